@@ -0,0 +1,91 @@
+import asyncio, datetime, heapq, itertools
+from concurrent.futures import ThreadPoolExecutor
+import click
+from dltctl.api.pipelines import print_event, DEFAULT_EVENTS_PAGE_SIZE
+from dltctl.types.events import EventCursor, EVENT_CURSOR_LOOKBACK_SECONDS, _shift_timestamp
+from dltctl.utils.poll_utils import AdaptivePoller, DEFAULT_MIN_POLL_INTERVAL, DEFAULT_MAX_POLL_INTERVAL
+
+DEFAULT_TAIL_WORKERS = 8
+
+def _utcnow():
+    return datetime.datetime.utcnow().isoformat(timespec="milliseconds") + "Z"
+
+class MultiPipelineTailer:
+    """Tails the event feeds of many pipelines from one asyncio event loop.
+
+    Every pipeline gets its own cursor and adaptive poller. Fetches run on a small thread pool
+    that shares the API client's HTTP session, so connections are reused across pipelines.
+    Fetched events wait in a heap until every pipeline has polled past their timestamp, which
+    keeps the merged output in timestamp order.
+    """
+    def __init__(self, pipelines_api, pipelines, ts=None, min_polling_interval=DEFAULT_MIN_POLL_INTERVAL,
+                 max_polling_interval=DEFAULT_MAX_POLL_INTERVAL, page_size=DEFAULT_EVENTS_PAGE_SIZE,
+                 max_workers=DEFAULT_TAIL_WORKERS, max_polls_without_events=None, verbose=False):
+        self.pipelines_api = pipelines_api
+        # Pipeline ID to the name printed in front of its events
+        self.pipelines = pipelines
+        self.start_time = ts if ts else _shift_timestamp(_utcnow(), -5)
+        self.min_polling_interval = min_polling_interval
+        self.max_polling_interval = max_polling_interval
+        self.page_size = page_size
+        self.max_workers = max_workers
+        self.max_polls_without_events = max_polls_without_events
+        self.verbose = verbose
+        self.heap = []
+        self.counter = itertools.count()
+        self.watermarks = {}
+
+    def _fetch(self, pipeline_id, cursor):
+        t = cursor.get_filter_timestamp()
+        pages = list(self.pipelines_api.iter_event_pages(pipeline_id, timestamp_filter=t, page_size=self.page_size, inclusive=True))
+        # Only a full drain moves the cursor, so a poll that fails partway refetches everything next time
+        events = []
+        for page in pages:
+            events.extend(cursor.advance(page))
+        return events
+
+    def _flush(self):
+        """Prints buffered events that no pipeline can still precede"""
+        low_watermark = min(self.watermarks.values()) if self.watermarks else None
+        while self.heap and (low_watermark is None or self.heap[0][0] <= low_watermark):
+            timestamp, _, pipeline_id, event = heapq.heappop(self.heap)
+            print_event(event, self.verbose, prefix=self.pipelines[pipeline_id])
+
+    async def _tail(self, pipeline_id, executor):
+        loop = asyncio.get_running_loop()
+        cursor = EventCursor(self.start_time)
+        poller = AdaptivePoller(self.min_polling_interval, self.max_polling_interval)
+        polls_without_events = 0
+        events = None
+        while True:
+            if events is not None:
+                await asyncio.sleep(poller.next_interval(bool(events)))
+            polled_at = _utcnow()
+            try:
+                events = await loop.run_in_executor(executor, self._fetch, pipeline_id, cursor)
+            except Exception as e:
+                click.secho(f"[{self.pipelines[pipeline_id]}] Failed to fetch events: {e}", fg='red')
+                events = []
+            else:
+                for event in events:
+                    heapq.heappush(self.heap, (event.timestamp or "", next(self.counter), pipeline_id, event))
+                # Events this pipeline writes from now on can land slightly behind the poll time. A failed
+                # poll leaves the watermark where it was, the events it missed are still to come.
+                self.watermarks[pipeline_id] = _shift_timestamp(polled_at, -EVENT_CURSOR_LOOKBACK_SECONDS)
+                self._flush()
+
+            polls_without_events = 0 if events else polls_without_events + 1
+            if self.max_polls_without_events and polls_without_events >= self.max_polls_without_events:
+                break
+        # A finished tail no longer holds back the others
+        del self.watermarks[pipeline_id]
+        self._flush()
+
+    async def _run(self):
+        # Nothing before the start time is fetched, so that is where every pipeline begins
+        self.watermarks = {pipeline_id: self.start_time for pipeline_id in self.pipelines}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            await asyncio.gather(*[self._tail(pipeline_id, executor) for pipeline_id in self.pipelines])
+
+    def run(self):
+        asyncio.run(self._run())
@@ -1,9 +1,12 @@
 from cmath import pi
-import json, time
+import json, time, queue, threading
 import click
-import datetime
+import datetime, weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from databricks_cli.pipelines.api import PipelinesApi
-from dltctl.types.events import PipelineEventsResponse
+from dltctl.types.events import PipelineEventsResponse, EventCursor, EVENT_CURSOR_LOOKBACK_SECONDS, _shift_timestamp
+from dltctl.utils.poll_utils import AdaptivePoller, DEFAULT_MIN_POLL_INTERVAL, DEFAULT_MAX_POLL_INTERVAL
 
 class PipelineNameNotUniqueError(Exception):
     pass
@@ -11,26 +14,162 @@ class PipelineNameNotUniqueError(Exception):
 class PipelineNameNotFoundError(Exception):
     pass
 
+DEFAULT_EVENTS_PAGE_SIZE = 100
+# The events endpoint rejects a larger max_results
+MAX_EVENTS_PAGE_SIZE = 100
+DEFAULT_BACKFILL_WORKERS = 8
+# More windows than workers keeps every worker busy when a few windows hold most of the events
+BACKFILL_WINDOWS_PER_WORKER = 4
+# Pages a window fetches ahead of the writer, which bounds an export's memory to about
+# workers * (BACKFILL_QUEUE_PAGES + 1) * page_size events
+BACKFILL_QUEUE_PAGES = 2
+_WINDOW_DONE = object()
+UPDATE_TERMINAL_STATES = ['COMPLETED', 'FAILED', 'CANCELED']
+
+def _parse_timestamp(timestamp):
+    parsed = datetime.datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def _format_timestamp(dt):
+    return dt.isoformat(timespec="milliseconds") + "Z"
+
+def split_time_range(since, until, count):
+    """Splits [since, until) into up to count adjacent, half-open windows"""
+    start, end = _parse_timestamp(since), _parse_timestamp(until)
+    if count <= 1 or end <= start:
+        return [(_format_timestamp(start), _format_timestamp(end))]
+    step = (end - start) / count
+    bounds = sorted(set([_format_timestamp(start + step * i) for i in range(count)] + [_format_timestamp(end)]))
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def print_event(event, verbose=False, prefix=None):
+    """Prints one event line and returns the color it was printed in"""
+    color = 'red' if (event.level == 'ERROR' or event.has_error()) else 'green'
+    emoji = u'\u2714'
+    click.secho(emoji + " ", fg=color, nl=False)
+    if prefix:
+        click.secho(f"[{prefix}] ", nl=False, bold=True)
+    click.secho(event.timestamp + " ", nl=False)
+    click.secho(event.event_type + " ", nl=False, fg=color)
+    click.secho(event.message)
+    if verbose:
+        click.echo("Verbose Details:", nl=True)
+        click.secho(event.details)
+    return color
+
+def _print_failure(error):
+    try:
+        message = error["exceptions"][0]["message"]
+    except: 
+        message = error["exceptions"]
+
+    click.secho("Pipeline execution has FAILED. Failure reason:", fg='red')
+    click.secho(f"{message}", fg='red')
+
+def _print_caught_up(count, pages, elapsed):
+    click.secho(f"Caught up on {count} events across {pages} pages in {elapsed:.1f}s "
+                f"({count / elapsed:.0f} events/s)", dim=True)
+
+def print_update_state(state, last_error=None):
+    """Prints how an update that reached a terminal state ended"""
+    if state == 'COMPLETED':
+        click.secho("Pipeline execution is complete", fg='green')
+    elif state == 'CANCELED':
+        click.secho("Pipeline execution was CANCELED", fg='yellow')
+    elif last_error:
+        _print_failure(last_error)
+    else:
+        click.secho("Pipeline execution has FAILED", fg='red')
+    print("")
+
+# Pipelines fetched in the last few seconds, shared by every PipelinesApi on the same client. The TTL
+# keeps one command from refetching the same pipeline without long-lived clients reading stale state.
+_pipeline_snapshots = weakref.WeakKeyDictionary()
+PIPELINE_SNAPSHOT_TTL = 5
+
 class PipelinesApi(PipelinesApi):
-    
-    def get_pipeline_id_by_name(self, pipeline_name):
-        pipelines = self.list()
-        if(len(pipelines) < 1):
+
+    def __init__(self, api_client, id_cache=None, event_store=None):
+        super().__init__(api_client)
+        self.id_cache = id_cache
+        self.event_store = event_store
+        self.snapshots = _pipeline_snapshots.setdefault(api_client, {})
+
+    def get_snapshot(self, pipeline_id):
+        """Read-through get() that reuses the pipeline fetched in the last PIPELINE_SNAPSHOT_TTL seconds"""
+        snapshot = self.snapshots.get(pipeline_id)
+        if not snapshot or time.monotonic() - snapshot[0] > PIPELINE_SNAPSHOT_TTL:
+            snapshot = (time.monotonic(), self.get(pipeline_id))
+            self.snapshots[pipeline_id] = snapshot
+        return snapshot[1]
+
+    def invalidate_snapshot(self, pipeline_id):
+        self.snapshots.pop(pipeline_id, None)
+
+    def _get_cached_pipeline_id(self, pipeline_name):
+        if not self.id_cache:
             return None
-        
+        pipeline_id = self.id_cache.get(pipeline_name)
+        if not pipeline_id:
+            return None
+        # Verify the cached ID still points at a pipeline with this name
+        try:
+            pipeline = self.get_snapshot(pipeline_id)
+            remote_name = pipeline["name"] if "name" in pipeline else pipeline["spec"]["name"]
+        except Exception:
+            remote_name = None
+        if remote_name != pipeline_name:
+            self.id_cache.evict(pipeline_name=pipeline_name)
+            return None
+        return pipeline_id
+
+    def get_pipeline_id_by_name(self, pipeline_name):
+        cached_id = self._get_cached_pipeline_id(pipeline_name)
+        if cached_id:
+            return cached_id
+
+        # Names can't be quoted in a filter expression, fall back to an unfiltered listing
+        name_filter = f"name LIKE '{pipeline_name}'" if "'" not in pipeline_name else None
         pipelines_with_name = []
-        for pipeline in pipelines:
+        for pipeline in self.iter_pipelines(filter=name_filter):
             if pipeline["name"] == pipeline_name:
                 pipelines_with_name.append(pipeline)
-        
+            # A second match is enough to know the name is not unique
+            if len(pipelines_with_name) > 1:
+                break
+
         if(len(pipelines_with_name) < 1):
             return None
         elif (len(pipelines_with_name) > 1):
             raise PipelineNameNotUniqueError(f"Unable to get pipeline by name: Multiple pipelines with the same name: {pipelines_with_name} ")
         else:
-            return pipelines_with_name[0]["pipeline_id"]
+            pipeline_id = pipelines_with_name[0]["pipeline_id"]
+            if self.id_cache:
+                self.id_cache.put(pipeline_name, pipeline_id)
+            return pipeline_id
+
+    def iter_pipelines(self, filter=None, page_size=None, headers=None):
+        """Lazily yields pipeline statuses, fetching the next page only when needed"""
+        _data = {}
+        if filter:
+            _data["filter"] = filter
+        if page_size:
+            _data["max_results"] = page_size
+        while True:
+            response = self.client.client.perform_query(
+                'GET', '/pipelines', data=_data, headers=headers)
+            for pipeline in response.get("statuses", []):
+                yield pipeline
+            if "next_page_token" not in response:
+                return
+            _data = {"page_token": response["next_page_token"]}
+            if page_size:
+                _data["max_results"] = page_size
 
     def get_last_update_id(self, pipeline_id):
+        # Updates start outside of this client too, so they are always read fresh
         pipeline = self.get(pipeline_id)
         if "latest_updates" in pipeline:
             last_update_id = pipeline["latest_updates"][0]["update_id"]
@@ -47,86 +186,242 @@ class PipelinesApi(PipelinesApi):
             raise Exception("Pipeline exist but has no updates. It has likely never ran")
     
     def get_pipeline_settings(self, pipeline_id):
-        pipeline = self.get(pipeline_id)
+        pipeline = self.get_snapshot(pipeline_id)
         return pipeline["spec"]
 
     def get_pipeline_state(self, pipeline_id):
-        pipeline = self.get(pipeline_id)
+        pipeline = self.get_snapshot(pipeline_id)
         return pipeline["state"]
 
     def get_pipeline_libraries(self, pipeline_id):
         libs = []
-        pipeline = self.get(pipeline_id)
+        pipeline = self.get_snapshot(pipeline_id)
         libraries = pipeline["spec"]["libraries"]
         for library in libraries:
             libs.append(library["notebook"]["path"])
         return libs
         
-    def stream_events(self, pipeline_id, ts=None, polling_interval=3, max_polls_without_events=None, verbose=False):
-        start_time = ts
+    def iter_event_pages(self, pipeline_id, timestamp_filter=None, page_size=DEFAULT_EVENTS_PAGE_SIZE, inclusive=False,
+                         until=None, keep_details=False):
+        """Yields pages of events after timestamp_filter, following page tokens until the feed is drained.
+
+        keep_details keeps the details and error parsed with the rest of each event.
+        """
+        page_token = None
+        while True:
+            response = PipelineEventsResponse().from_json_response(self.get_events(
+                pipeline_id, max_result=page_size, timestamp_filter=timestamp_filter, page_token=page_token,
+                inclusive=inclusive, until=until))
+            events = response.to_pipeline_events(keep_details) or []
+            if self.event_store:
+                self.event_store.add(events, pipeline_id)
+            yield events
+            # The API can return short pages while more events remain, only a missing token or an empty page ends the feed
+            if not response.next_page_token or not events:
+                return
+            page_token = response.next_page_token
+
+    def _stream_window(self, pipeline_id, since, until, page_size, keep_details, pages, stopped):
+        """Puts the pages of one window on a bounded queue, ending with _WINDOW_DONE or the error"""
+        def put(item):
+            while not stopped.is_set():
+                try:
+                    pages.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+        try:
+            for page in self.iter_event_pages(pipeline_id, timestamp_filter=since, page_size=page_size,
+                                              inclusive=True, until=until, keep_details=keep_details):
+                if not put(page):
+                    return
+        except Exception as e:
+            put(e)
+            return
+        put(_WINDOW_DONE)
+
+    def iter_backfill_pages(self, pipeline_id, since=None, until=None, max_workers=DEFAULT_BACKFILL_WORKERS,
+                            page_size=DEFAULT_EVENTS_PAGE_SIZE, keep_details=False):
+        """Yields the pages of events in [since, until) in timestamp order.
+
+        The range is split into windows that are fetched concurrently, each following its own
+        pagination. Every window streams its pages through a queue of BACKFILL_QUEUE_PAGES, so
+        memory stays bounded by the number of workers and the page size, and pages are yielded
+        in order as soon as every earlier window has been. With a single worker the pages are
+        streamed one at a time instead.
+        """
+        if max_workers <= 1:
+            yield from self.iter_event_pages(pipeline_id, timestamp_filter=since, page_size=page_size, inclusive=True,
+                                             until=until, keep_details=keep_details)
+            return
+        if not since:
+            first = self.get_events(pipeline_id, max_result=1).get("events_json")
+            if not first:
+                return
+            since = PipelineEventsResponse().from_json_response({"events_json": first}).to_pipeline_events()[0].timestamp
+        until = until if until else _format_timestamp(datetime.datetime.utcnow())
+        windows = deque(split_time_range(since, until, max_workers * BACKFILL_WINDOWS_PER_WORKER))
+
+        edge_ids = set()
+        stopped = threading.Event()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            try:
+                in_flight = deque()
+                while windows or in_flight:
+                    while windows and len(in_flight) < max_workers:
+                        start, end = windows.popleft()
+                        pages = queue.Queue(maxsize=BACKFILL_QUEUE_PAGES)
+                        executor.submit(self._stream_window, pipeline_id, start, end, page_size, keep_details, pages, stopped)
+                        in_flight.append((end, pages))
+                    end, pages = in_flight.popleft()
+                    # Drop events the next window returns again if the API's bounds overlap at the edge
+                    edge = _shift_timestamp(end, -EVENT_CURSOR_LOOKBACK_SECONDS)
+                    next_edge_ids = set()
+                    while True:
+                        page = pages.get()
+                        if page is _WINDOW_DONE:
+                            break
+                        if isinstance(page, Exception):
+                            raise page
+                        events = [event for event in page if event.id not in edge_ids]
+                        next_edge_ids.update(event.id for event in events if event.timestamp and event.timestamp >= edge)
+                        if events:
+                            yield events
+                    edge_ids = next_edge_ids
+            finally:
+                # Unblocks windows still fetching when the consumer stops early or a window fails
+                stopped.set()
+
+    def get_update(self, pipeline_id, update_id):
+        response = self.client.client.perform_query('GET', f'/pipelines/{pipeline_id}/updates/{update_id}')
+        return response.get("update", {})
+
+    def iter_events(self, pipeline_id, since=None, follow=True, update_id=None, max_polls_without_events=None,
+                    min_polling_interval=DEFAULT_MIN_POLL_INTERVAL, max_polling_interval=DEFAULT_MAX_POLL_INTERVAL,
+                    page_size=DEFAULT_EVENTS_PAGE_SIZE, on_caught_up=None):
+        """Yields the events of a pipeline from since onwards, in order and without duplicates.
+
+        Without follow it stops once it has caught up. With follow it keeps polling until the
+        update_id reaches a terminal state, or after max_polls_without_events idle polls, or
+        forever. Pages are only fetched when the consumer asks for more events, so a slow consumer
+        slows down polling instead of piling up events. Returns the terminal state of update_id,
+        if it reached one.
+        """
+        start_time = since if since else (datetime.datetime.utcnow() - datetime.timedelta(seconds=5)).isoformat()[:-3]+'Z'
+        cursor = EventCursor(start_time)
+        poller = AdaptivePoller(min_polling_interval, max_polling_interval)
         polls_without_events = 0
         last_event = None
+        active = None
+        while True:
+            # The first fetch goes out right away, later ones speed up or back off with activity
+            if active is not None:
+                poller.wait(active)
+            # Read the state before the events so the events leading up to a terminal state are all yielded
+            update_state = self.get_update(pipeline_id, update_id).get("state") if update_id else None
+            # Drain every page so a busy update doesn't fall further behind with each poll
+            fetch_started = time.monotonic()
+            count = 0
+            pages = 0
+            t = cursor.get_filter_timestamp()
+            try:
+                for page in self.iter_event_pages(pipeline_id, timestamp_filter=t, page_size=page_size, inclusive=True):
+                    pages += 1
+                    for event in cursor.advance(page):
+                        count += 1
+                        last_event = event
+                        yield event
+            except GeneratorExit:
+                # The consumer stopped partway through the batch, it still caught up on what it read
+                if pages > 1 and on_caught_up:
+                    on_caught_up(count, pages, max(time.monotonic() - fetch_started, 0.001))
+                raise
+            if pages > 1 and on_caught_up:
+                on_caught_up(count, pages, max(time.monotonic() - fetch_started, 0.001))
+            active = count > 0
+
+            if update_state in UPDATE_TERMINAL_STATES:
+                return update_state
+            if not follow:
+                return None
+            if active:
+                polls_without_events = 0
+                continue
+            polls_without_events += 1
+            if not last_event:
+                continue
+            elif 'WAITING_FOR_RESOURCES' in last_event.message:
+                polls_without_events = 0
+
+            if max_polls_without_events and (polls_without_events >= max_polls_without_events):
+                return None
+
+    def stream_events(self, pipeline_id, ts=None, min_polling_interval=DEFAULT_MIN_POLL_INTERVAL,
+                      max_polling_interval=DEFAULT_MAX_POLL_INTERVAL, max_polls_without_events=None, verbose=False,
+                      page_size=DEFAULT_EVENTS_PAGE_SIZE, update_id=None):
+        """Prints pipeline events as they arrive.
+
+        With an update_id the update's own state decides when to stop, otherwise the events and
+        max_polls_without_events do.
+        """
+        events = self.iter_events(pipeline_id, since=ts, update_id=update_id,
+                                  max_polls_without_events=max_polls_without_events,
+                                  min_polling_interval=min_polling_interval, max_polling_interval=max_polling_interval,
+                                  page_size=page_size, on_caught_up=_print_caught_up)
+        last_error = None
         while True:
-          to_exit = False
-          t = (datetime.datetime.utcnow() - datetime.timedelta(seconds=5)).isoformat()[:-3]+'Z'  if start_time is None else start_time
-          time.sleep(polling_interval)
-          json_events = self.get_events(pipeline_id, max_result=100, timestamp_filter=t)
-          events = PipelineEventsResponse().from_json_response(json_events).to_pipeline_events()
-          if events is None:
-              polls_without_events+=1
-              if not last_event:
-                  continue
-              elif 'WAITING_FOR_RESOURCES' in last_event.message:
-                  polls_without_events = 0 
-
-              if max_polls_without_events and (polls_without_events >= max_polls_without_events):
-                  break
-              else:
-                  continue
-          polls_without_events = 0
-          start_time = events[-1].timestamp
-          for event in events:
-              last_event = event
-              color = 'red' if (event.level == 'ERROR' or event.error) else 'green'
-              emoji = u'\u2714'
-              click.secho(emoji + " ", fg=color, nl=False)
-              click.secho(event.timestamp + " ", nl=False)
-              click.secho(event.event_type + " ", nl=False, fg=color)
-              click.secho(event.message)
-              if verbose:
-                  click.echo("Verbose Details:", nl=True)
-                  click.secho(event.details)
-              if 'update_progress' in event.details and event.details["update_progress"]["state"] == 'COMPLETED':
-                  click.secho("Pipeline execution is complete", fg=color)
-                  print("")
-                  to_exit = True
-
-              elif event.error:
-                  try:
-                      message = event.error["exceptions"][0]["message"]
-                  except: 
-                      message = event.error["exceptions"]
-
-                  click.secho("Pipeline execution has FAILED. Failure reason:", fg=color)
-                  click.secho(f"{message}", fg=color)
-                  print("")
-                  to_exit = True
-              
-          if to_exit:
-              break
+            try:
+                event = next(events)
+            except StopIteration as stop:
+                update_state = stop.value
+                break
+            color = print_event(event, verbose)
+            if event.has_error():
+                last_error = event.error
+            if update_id:
+                continue
+            if event.event_type == 'update_progress' and (event.details or {}).get("update_progress", {}).get("state") == 'COMPLETED':
+                events.close()
+                click.secho("Pipeline execution is complete", fg=color)
+                print("")
+                return
+            elif event.has_error():
+                events.close()
+                _print_failure(event.error)
+                print("")
+                return
+
+        if update_state:
+            print_update_state(update_state, last_error)
  
     def create(self,settings,headers=None):
         data = settings
-        return self.client.client.perform_query('POST', '/pipelines', data=data,
-                                                headers=headers)
+        response = self.client.client.perform_query('POST', '/pipelines', data=data,
+                                                    headers=headers)
+        if self.id_cache and response and "pipeline_id" in response:
+            self.id_cache.put(settings.get("name"), response["pipeline_id"])
+        return response
+
+    def delete(self, pipeline_id, headers=None):
+        self.invalidate_snapshot(pipeline_id)
+        self.client.delete(pipeline_id, headers)
+        if self.id_cache:
+            self.id_cache.evict(pipeline_id=pipeline_id)
                                                 
     def edit(self, pipeline_id, settings, headers=None):
         data = settings.to_json()
         data["id"] = pipeline_id
+        self.invalidate_snapshot(pipeline_id)
         self.client.client.perform_query('PUT', '/pipelines/{}'.format(pipeline_id), data=data,
                                          headers=headers)
 
+    def start_update(self, pipeline_id, full_refresh=None, headers=None):
+        self.invalidate_snapshot(pipeline_id)
+        return self.client.start_update(pipeline_id, full_refresh=full_refresh, headers=headers)
+
     def stop(self, pipeline_id, headers=None):
+        self.invalidate_snapshot(pipeline_id)
         self.client.stop(pipeline_id, headers)
         status = 'RUNNING'
         while(status == 'RUNNING'):
@@ -134,15 +429,26 @@ class PipelinesApi(PipelinesApi):
             time.sleep(3)
     
     def stop_async(self, pipeline_id, headers=None):
+        self.invalidate_snapshot(pipeline_id)
         self.client.stop(pipeline_id, headers)
         return
 
-    def get_events(self, pipeline_id, max_result=100, order_by="timestamp asc", timestamp_filter=None):
+    def get_events(self, pipeline_id, max_result=DEFAULT_EVENTS_PAGE_SIZE, order_by="timestamp asc", timestamp_filter=None,
+                   page_token=None, inclusive=False, until=None):
         _data = {}
         _data["max_results"] = max_result
-        _data["order_by"] = order_by
-        if timestamp_filter:
-            _data["filter"] = f'timestamp > \'{timestamp_filter}\''
+        # A page token carries the rest of the original query, the API rejects both together
+        if page_token:
+            _data["page_token"] = page_token
+        else:
+            _data["order_by"] = order_by
+            filters = []
+            if timestamp_filter:
+                filters.append(f'timestamp {">=" if inclusive else ">"} \'{timestamp_filter}\'')
+            if until:
+                filters.append(f'timestamp < \'{until}\'')
+            if filters:
+                _data["filter"] = " AND ".join(filters)
 
         response = self.client.client.perform_query(
             'GET', f'/pipelines/{pipeline_id}/events', data=_data)
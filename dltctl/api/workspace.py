@@ -3,6 +3,106 @@ from databricks_cli.pipelines.api import PipelinesApi
 from databricks_cli.workspace.api import WorkspaceApi
 from databricks_cli.workspace.types import WorkspaceLanguage, WorkspaceFormat
 from dltctl.utils.print_utils import event_print
+from dltctl.utils.hash_utils import get_local_artifact_md5
+from dltctl.utils.state_utils import DEPLOYMENT_HISTORY_SIZE
+from dltctl.core.constants import DEFAULT_MAX_WORKERS
+from concurrent.futures import ThreadPoolExecutor
+import requests
+import base64, datetime, io, json, random, re, time, uuid, zipfile
+
+ARTIFACT_MANIFEST_NAME = "_dltctl_manifest"
+ARTIFACT_MANIFEST_VERSION = 1
+UPLOAD_MAX_RETRIES = 5
+UPLOAD_BACKOFF_SECONDS = 1
+UPLOAD_MAX_BACKOFF_SECONDS = 60
+# databricks-cli's ApiClient already retries 429s with backoff and Retry-After, retrying them here
+# as well would multiply its attempts. Only server and connection errors are retried at this level.
+RETRYABLE_STATUS_CODES = [500, 502, 503, 504]
+RETRYABLE_ERROR_CODES = ['TEMPORARILY_UNAVAILABLE']
+BULK_IMPORT_DIR = ".dltctl_bulk"
+# The import API rejects request content over 10MB once base64 encoded
+BULK_IMPORT_MAX_BYTES = 10 * 1024 * 1024
+OBJECT_STORE_DIR = ".dltctl/objects"
+# Source file extension to DBC archive language and line comment prefix
+DBC_LANGUAGES = {".py": ("python", "#"), ".sql": ("sql", "--"), ".scala": ("scala", "//"), ".r": ("r", "#")}
+
+def get_retry_delay(error, attempt):
+    """Seconds to wait before retrying a failed request, or None if it shouldn't be retried"""
+    response = getattr(error, "response", None)
+    status_code = response.status_code if response is not None else None
+    retryable = (status_code in RETRYABLE_STATUS_CODES
+                 or isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+                 or any(code in str(error) for code in RETRYABLE_ERROR_CODES))
+    if not retryable:
+        return None
+    # Honour the server's requested wait, e.g. on a 503
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), UPLOAD_MAX_BACKOFF_SECONDS)
+        except ValueError:
+            pass
+    backoff = min(UPLOAD_BACKOFF_SECONDS * 2 ** attempt, UPLOAD_MAX_BACKOFF_SECONDS)
+    return backoff / 2 + random.uniform(0, backoff / 2)
+
+def get_artifact_workspace_path(artifact, workspace_destination):
+    """Workspace path a local artifact is uploaded to"""
+    return Path(workspace_destination, Path(artifact).name).as_posix()
+
+def get_object_store_dir(workspace_destination):
+    return Path(workspace_destination, OBJECT_STORE_DIR).as_posix()
+
+def get_artifact_object_path(artifact, md5_hash, workspace_destination):
+    """Content-addressed workspace path of a local artifact"""
+    return Path(get_object_store_dir(workspace_destination), md5_hash, Path(artifact).name).as_posix()
+
+def get_object_hash(workspace_path):
+    """Hash encoded in a content-addressed object path, or None for any other path"""
+    match = re.search(r"/\.dltctl/objects/([0-9a-f]{32})/[^/]+$", workspace_path)
+    return match.group(1) if match else None
+
+def get_artifact_manifest_dir(workspace_path):
+    """Directory holding the manifest that covers workspace_path"""
+    if get_object_hash(workspace_path):
+        # A single manifest at the store root indexes every object
+        return Path(workspace_path).parent.parent.as_posix()
+    return Path(workspace_path).parent.as_posix()
+
+def get_dbc_notebook(artifact):
+    """Converts a local source file to the notebook JSON carried in a DBC archive"""
+    language, comment = DBC_LANGUAGES[Path(artifact).suffix.lower()]
+    with open(artifact, 'r', encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    if lines and lines[0].strip() == f"{comment} Databricks notebook source":
+        lines = lines[1:]
+    # Keep the cell boundaries a SOURCE import would have created
+    cells = [[]]
+    for line in lines:
+        if line.strip() == f"{comment} COMMAND ----------":
+            cells.append([])
+        else:
+            cells[-1].append(line)
+    commands = [{
+        "version": "CommandV1",
+        "origId": position,
+        "guid": str(uuid.uuid4()),
+        "subtype": "command",
+        "commandType": "auto",
+        "position": float(position),
+        "command": "\n".join(cell).strip("\n")
+    } for position, cell in enumerate(cells, start=1)]
+    return language, {
+        "version": "NotebookV1",
+        "origId": 0,
+        "name": Path(artifact).name,
+        "language": language,
+        "commands": commands,
+        "dashboards": [],
+        "guid": str(uuid.uuid4()),
+        "globalVars": {},
+        "iPythonMetadata": None,
+        "inputWidgets": {}
+    }
 
 class WorkspaceApi(WorkspaceApi):
 
@@ -14,6 +114,76 @@ class WorkspaceApi(WorkspaceApi):
         raise
 
 
+    def get_artifact_manifest_path(self, workspace_dir):
+      return Path(workspace_dir, ARTIFACT_MANIFEST_NAME).as_posix()
+
+    def get_artifact_manifest(self, workspace_dir):
+      """Returns the artifact manifest stored in workspace_dir, or None if it is missing or corrupt"""
+      try:
+          content = self.get_workspace_file_b64(self.get_artifact_manifest_path(workspace_dir))
+          decoded = base64.b64decode(content).decode("utf-8")
+          # The manifest is stored as a notebook, skip the header line added on import
+          manifest = json.loads(decoded[decoded.find('\n') + 1:])
+          if not isinstance(manifest.get("artifacts"), dict):
+              return None
+          return manifest
+      except Exception:
+          return None
+
+    def put_artifact_manifest(self, workspace_dir, manifest):
+      content = base64.b64encode(json.dumps(manifest, indent=1).encode("utf-8")).decode()
+      self.client.import_workspace(
+          self.get_artifact_manifest_path(workspace_dir),
+          WorkspaceFormat.SOURCE,
+          WorkspaceLanguage.PYTHON,
+          content,
+          True)
+
+    def update_artifact_manifest(self, uploads, hash_cache=None):
+      """Records the normalized hash of each uploaded (local path, workspace path) pair"""
+      uploaded_at = datetime.datetime.utcnow().isoformat()[:-3]+'Z'
+      uploads_by_dir = {}
+      for artifact, workspace_path in uploads:
+          uploads_by_dir.setdefault(get_artifact_manifest_dir(workspace_path), []).append((artifact, workspace_path))
+      for workspace_dir, dir_uploads in uploads_by_dir.items():
+          manifest = self.get_artifact_manifest(workspace_dir)
+          if not manifest:
+              manifest = {"version": ARTIFACT_MANIFEST_VERSION, "artifacts": {}}
+          for artifact, workspace_path in dir_uploads:
+              manifest["artifacts"][workspace_path] = {
+                  "hash": hash_cache.get_md5(artifact) if hash_cache else get_local_artifact_md5(artifact),
+                  "uploaded_at": uploaded_at
+              }
+          self.put_artifact_manifest(workspace_dir, manifest)
+      if hash_cache:
+          hash_cache.save()
+
+    def get_deployment(self, workspace_dir, pipeline_id):
+      manifest = self.get_artifact_manifest(workspace_dir)
+      if not manifest or not isinstance(manifest.get("deployments"), dict):
+          return None
+      return manifest["deployments"].get(str(pipeline_id))
+
+    def get_deployment_history(self, workspace_dir, pipeline_id):
+      manifest = self.get_artifact_manifest(workspace_dir)
+      if not manifest or not isinstance(manifest.get("history"), dict):
+          return []
+      return manifest["history"].get(str(pipeline_id), [])
+
+    def record_deployment(self, workspace_dir, pipeline_id, git_sha=None, history_entry=None):
+      """Records what was last deployed from workspace_dir for a pipeline, and optionally adds it to the rollback history"""
+      manifest = self.get_artifact_manifest(workspace_dir)
+      if not manifest:
+          manifest = {"version": ARTIFACT_MANIFEST_VERSION, "artifacts": {}}
+      manifest.setdefault("deployments", {})[str(pipeline_id)] = {
+          "git_sha": git_sha,
+          "deployed_at": datetime.datetime.utcnow().isoformat()[:-3]+'Z'
+      }
+      if history_entry:
+          history = manifest.setdefault("history", {}).get(str(pipeline_id), []) + [history_entry]
+          manifest["history"][str(pipeline_id)] = history[-DEPLOYMENT_HISTORY_SIZE:]
+      self.put_artifact_manifest(workspace_dir, manifest)
+
     def get_default_workspace_path(self):
       response = self.client.client.perform_query(
             'GET', f'/preview/scim/v2/Me')
@@ -21,7 +191,87 @@ class WorkspaceApi(WorkspaceApi):
       default_path = Path('/Users',f'{user_name}/').as_posix()
       return default_path
 
-    def upload_pipeline_artifacts(self, artifacts, workspace_destination, print_event=True):
+    def import_artifact(self, artifact, workspace_path, max_retries=UPLOAD_MAX_RETRIES):
+      """Imports a local artifact as a notebook, retrying transient server and connection failures"""
+      lang_fmt = WorkspaceLanguage.to_language_and_format(artifact)
+      attempt = 0
+      while True:
+          try:
+              self.import_workspace(artifact,workspace_path,language=lang_fmt[0],fmt=lang_fmt[0],is_overwrite=True)
+              return workspace_path
+          except Exception as e:
+              delay = get_retry_delay(e, attempt)
+              if delay is None or attempt >= max_retries:
+                  raise
+              time.sleep(delay)
+              attempt += 1
+
+    def import_artifact_object(self, artifact, workspace_path, max_retries=UPLOAD_MAX_RETRIES):
+      """Imports an artifact into its own object directory in the content-addressed store"""
+      self.mkdirs(Path(workspace_path).parent.as_posix())
+      return self.import_artifact(artifact, workspace_path, max_retries)
+
+    def walk(self, workspace_dir):
+      """Yields (directory, subdirectory paths, other objects) for workspace_dir and everything below it.
+
+      The other objects are every object that isn't a directory: notebooks, files, libraries and repos.
+      """
+      dirs = [workspace_dir]
+      while dirs:
+          current_dir = dirs.pop()
+          objects = self.list_objects(current_dir)
+          subdirs = [obj.path for obj in objects if obj.is_dir]
+          yield current_dir, subdirs, [obj for obj in objects if not obj.is_dir]
+          dirs.extend(subdirs)
+
+    def list_notebooks_recursive(self, workspace_dir):
+      return [obj for _, _, objects in self.walk(workspace_dir) for obj in objects if obj.is_notebook]
+
+    def remove_manifest_entries(self, workspace_paths):
+      """Drops deleted artifacts from the manifests that list them"""
+      paths_by_dir = {}
+      for workspace_path in workspace_paths:
+          paths_by_dir.setdefault(get_artifact_manifest_dir(workspace_path), set()).add(workspace_path)
+      for workspace_dir, dir_paths in paths_by_dir.items():
+          manifest = self.get_artifact_manifest(workspace_dir)
+          if not manifest or not dir_paths.intersection(manifest["artifacts"]):
+              continue
+          manifest["artifacts"] = {k: v for k, v in manifest["artifacts"].items() if k not in dir_paths}
+          self.put_artifact_manifest(workspace_dir, manifest)
+
+    def bulk_import_artifacts(self, artifacts, workspace_destination):
+      """Imports artifacts with a single DBC archive import into a new batch directory.
+
+      DBC directory imports can't overwrite, so every batch lands in its own directory under
+      workspace_destination. Returns the workspace path of each artifact, checked with a listing
+      of the batch directory.
+      """
+      names = [Path(a).name for a in artifacts]
+      if len(set(names)) < len(names):
+          raise ValueError("Artifacts with the same file name can't share a bulk import")
+      archive = io.BytesIO()
+      with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as z:
+          for artifact in artifacts:
+              language, notebook = get_dbc_notebook(artifact)
+              z.writestr(f"{Path(artifact).name}.{language}", json.dumps(notebook))
+      content = base64.b64encode(archive.getvalue()).decode()
+      if len(content) > BULK_IMPORT_MAX_BYTES:
+          raise ValueError(f"Bulk archive is {len(content)} bytes encoded, over the {BULK_IMPORT_MAX_BYTES} byte import limit")
+
+      batch_root = Path(workspace_destination, BULK_IMPORT_DIR).as_posix()
+      batch_dir = Path(batch_root, datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%S%fZ")).as_posix()
+      self.mkdirs(batch_root)
+      self.client.import_workspace(batch_dir, WorkspaceFormat.DBC, None, content, False)
+
+      imported = {obj.basename: obj.path for obj in self.list_notebooks_recursive(batch_dir)}
+      missing = [a for a in artifacts if Path(a).name not in imported]
+      if missing:
+          raise Exception(f"Bulk import into {batch_dir} is missing {', '.join(missing)}")
+      return {a: imported[Path(a).name] for a in artifacts}
+
+    def upload_pipeline_artifacts(self, artifacts, workspace_destination, print_event=True, hash_cache=None,
+                                  max_workers=DEFAULT_MAX_WORKERS, max_retries=UPLOAD_MAX_RETRIES, bulk=False,
+                                  content_addressed=False, on_uploaded=None):
         # Check that workspace destination exists or not
         uploaded_workspace_paths = []
         try:
@@ -42,27 +292,94 @@ class WorkspaceApi(WorkspaceApi):
                         level='ERROR',
                         msg=f"Attempted to create {workspace_destination} but failed")
                     raise e 
-        for artifact in artifacts:
-                filename = Path(artifact).name
-                full_path = Path(workspace_destination,filename).as_posix()
-                if print_event:
-                  event_print(
-                    type="cli_status",
-                    level='INFO',
-                    msg=f"Uploading {artifact} to {workspace_destination}.")
-                  
-                lang_fmt = WorkspaceLanguage.to_language_and_format(artifact)
-                try:
-                  self.import_workspace(artifact,full_path,language=lang_fmt[0],fmt=lang_fmt[0],is_overwrite=True)
+        if print_event and artifacts:
+          event_print(
+            type="cli_status",
+            level='INFO',
+            msg=f"Uploading {len(artifacts)} artifact(s) to {workspace_destination}.")
+
+        object_paths = {}
+        stored_paths = set()
+        if content_addressed:
+          for artifact in artifacts:
+              md5_hash = hash_cache.get_md5(artifact) if hash_cache else get_local_artifact_md5(artifact)
+              object_paths[artifact] = get_artifact_object_path(artifact, md5_hash, workspace_destination)
+          # One read of the store's manifest tells which objects another deploy already uploaded
+          stored = self.get_artifact_manifest(get_object_store_dir(workspace_destination))
+          stored_paths = set(stored["artifacts"]) if stored else set()
+
+        bulk_paths = {}
+        archivable = [a for a in artifacts if Path(a).suffix.lower() in DBC_LANGUAGES]
+        # Archive imports can't target the per-object directories of the content-addressed store
+        if bulk and archivable and not content_addressed:
+          try:
+              bulk_paths = self.bulk_import_artifacts(archivable, workspace_destination)
+          except Exception as e:
+              # Anything that didn't make it in the archive is imported file by file below
+              if print_event:
+                event_print(
+                  type="cli_status",
+                  level='WARNING',
+                  msg=f"Bulk import failed, falling back to per-file imports: {e}")
+
+        uploads = []
+        upload_error = None
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+          futures = []
+          for artifact in artifacts:
+              if artifact in bulk_paths:
+                  futures.append((artifact, bulk_paths[artifact], None))
+              elif artifact in object_paths:
+                  full_path = object_paths[artifact]
+                  # Objects already in the store are referenced as they are
+                  future = None if full_path in stored_paths else executor.submit(
+                      self.import_artifact_object, artifact, full_path, max_retries)
+                  futures.append((artifact, full_path, future))
+              else:
+                  full_path = get_artifact_workspace_path(artifact, workspace_destination)
+                  futures.append((artifact, full_path, executor.submit(self.import_artifact, artifact, full_path, max_retries)))
+          # Collect in input order so the returned paths don't depend on which upload finished first
+          for artifact, full_path, future in futures:
+              if full_path in stored_paths:
                   uploaded_workspace_paths.append(full_path)
                   if print_event:
                     event_print(
                       type="cli_status",
                       level='INFO',
-                      msg=f"Successfully uploaded {artifact} to {workspace_destination}.")
+                      msg=f"{artifact} is already stored at {full_path}. Skipping upload.")
+                  continue
+              try:
+                  if future:
+                      future.result()
+              except Exception as e:
+                  if print_event:
+                    event_print(
+                      type="cli_status",
+                      level='ERROR',
+                      msg=f"Failed to upload {artifact} to {full_path}: {e}")
+                  upload_error = upload_error if upload_error else e
+                  continue
+              uploaded_workspace_paths.append(full_path)
+              uploads.append((artifact, full_path))
+              if on_uploaded:
+                  on_uploaded(artifact, full_path)
+              if print_event:
+                event_print(
+                  type="cli_status",
+                  level='INFO',
+                  msg=f"Uploaded {artifact} to {full_path}.")
 
-                except Exception as e:
-                    raise e
+        # The manifest only speeds up later diffs, an upload that succeeded shouldn't fail on it
+        try:
+          self.update_artifact_manifest(uploads, hash_cache=hash_cache)
+        except Exception as e:
+          if print_event:
+            event_print(
+              type="cli_status",
+              level='WARNING',
+              msg=f"Unable to update artifact manifest in {workspace_destination}: {e}")
+        if upload_error:
+            raise upload_error
         return uploaded_workspace_paths
 
             
\ No newline at end of file
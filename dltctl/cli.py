@@ -6,6 +6,9 @@ from databricks_cli.secrets.cli import secrets_group
 from databricks_cli.utils import pipelines_exception_eater
 from dltctl.core import commands
 from dltctl.core.constants import *
+from dltctl.api.pipelines import DEFAULT_EVENTS_PAGE_SIZE, MAX_EVENTS_PAGE_SIZE
+from dltctl.utils.export_utils import EXPORT_FORMATS
+from dltctl.utils.poll_utils import DEFAULT_MIN_POLL_INTERVAL, DEFAULT_MAX_POLL_INTERVAL
 
 @click.group(help="CLI for development and CI/CD of DLT Pipelines")
 def cli():
@@ -23,18 +26,23 @@ cli.add_command(secrets_group, name='secrets')
 @click.option('-v', '--verbose-events', 'verbose_events', is_flag=True, help=VERBOSE_EVENTS_HELP)
 @click.option('-c', '--project-config-dir', 'proj_config_dir', type=click.Path(), help=PROJ_CONFIG_HELP)
 @click.option('--force', is_flag=True, help=FORCE_HELP)
+@click.option('--max-workers', 'max_workers', type=click.IntRange(min=1), default=DEFAULT_MAX_WORKERS, help=MAX_WORKERS_HELP)
+@click.option('--since-ref', 'since_ref', is_flag=True, help=SINCE_REF_HELP)
+@click.option('--bulk', is_flag=True, help=BULK_HELP)
+@click.option('--content-addressed', 'content_addressed', is_flag=True, help=CONTENT_ADDRESSED_HELP)
+@click.option('--resume', is_flag=True, help=RESUME_HELP)
 @debug_option
 @profile_option
 @pipelines_exception_eater
 @provide_api_client
-def deploy(api_client, as_job, full_refresh, pipeline_files_dir, workspace_path, verbose_events, proj_config_dir, force):
+def deploy(api_client, as_job, full_refresh, pipeline_files_dir, workspace_path, verbose_events, proj_config_dir, force, max_workers, since_ref, bulk, content_addressed, resume):
     """Stages artifacts, creates/starts and/or restarts a DLT pipeline"""
     commands.deploy(
         api_client, as_job, 
         full_refresh,
         pipeline_files_dir, workspace_path, 
         verbose_events, proj_config_dir,
-        force)
+        force, max_workers, since_ref, bulk, content_addressed, resume)
   
 @cli.command()
 @debug_option
@@ -45,9 +53,13 @@ def deploy(api_client, as_job, full_refresh, pipeline_files_dir, workspace_path,
 @click.option('-f', '--pipeline-files-dir', 'pipeline_files_dir', type=click.Path(), help=PIPELINE_FILES_HELP)
 @click.option('-c', '--project-config-dir', 'proj_config_dir', type=click.Path(), help=PROJ_CONFIG_HELP)
 @click.option('--force', is_flag=True, help=FORCE_HELP)
-def stage(api_client, proj_config_dir, pipeline_files_dir, workspace_path, force):
+@click.option('--max-workers', 'max_workers', type=click.IntRange(min=1), default=DEFAULT_MAX_WORKERS, help=MAX_WORKERS_HELP)
+@click.option('--since-ref', 'since_ref', is_flag=True, help=SINCE_REF_HELP)
+@click.option('--bulk', is_flag=True, help=BULK_HELP)
+@click.option('--content-addressed', 'content_addressed', is_flag=True, help=CONTENT_ADDRESSED_HELP)
+def stage(api_client, proj_config_dir, pipeline_files_dir, workspace_path, force, max_workers, since_ref, bulk, content_addressed):
     """Stages DLT pipeline code artifacts as notebooks and updates settings."""
-    commands.stage(api_client, proj_config_dir, pipeline_files_dir, workspace_path, force)
+    commands.stage(api_client, proj_config_dir, pipeline_files_dir, workspace_path, force, max_workers, since_ref, bulk, content_addressed)
     
 
 @cli.command()
@@ -60,6 +72,101 @@ def stop(api_client, proj_config_dir):
     """Stops a pipeline if it is running."""
     commands.stop(api_client, proj_config_dir)
 
+@cli.command()
+@debug_option
+@profile_option
+@pipelines_exception_eater
+@provide_api_client
+@click.option('-c', '--project-config-dir', 'proj_config_dir', type=click.Path(), help=PROJ_CONFIG_HELP)
+@click.option('-w', '--workspace-path', 'workspace_path', type=str, help=WORKSPACE_PATH_HELP)
+@click.option('--to', 'to', type=click.IntRange(min=1), default=1, help=ROLLBACK_TO_HELP)
+def rollback(api_client, proj_config_dir, workspace_path, to):
+    """Restores the pipeline libraries and settings of a previous deploy."""
+    commands.rollback(api_client, proj_config_dir, workspace_path, to)
+
+@cli.command()
+@debug_option
+@profile_option
+@pipelines_exception_eater
+@provide_api_client
+@click.option('-c', '--project-config-dir', 'proj_config_dir', type=click.Path(), help=PROJ_CONFIG_HELP)
+@click.option('-w', '--workspace-path', 'workspace_path', type=str, help=WORKSPACE_PATH_HELP)
+@click.option('--dry-run', 'dry_run', is_flag=True, help=DRY_RUN_HELP)
+@click.option('--grace-days', 'grace_days', type=click.IntRange(min=0), default=DEFAULT_GC_GRACE_DAYS, help=GRACE_DAYS_HELP)
+@click.option('--max-workers', 'max_workers', type=click.IntRange(min=1), default=DEFAULT_MAX_WORKERS, help=MAX_WORKERS_HELP)
+def gc(api_client, proj_config_dir, workspace_path, dry_run, grace_days, max_workers):
+    """Deletes pipeline artifacts in the workspace that no pipeline references."""
+    commands.gc(api_client, proj_config_dir, workspace_path, dry_run, grace_days, max_workers)
+
+@provide_api_client
+def _tail_events(*args, api_client):
+    commands.events(api_client, *args)
+
+@cli.group(invoke_without_command=True)
+@debug_option
+@profile_option
+@pipelines_exception_eater
+@click.option('-c', '--project-config-dir', 'proj_config_dir', type=click.Path(), help=PROJ_CONFIG_HELP)
+@click.option('--all', 'all_pipelines', is_flag=True, help=ALL_PIPELINES_HELP)
+@click.option('--pipelines', 'pipeline_names', type=str, help=PIPELINES_HELP)
+@click.option('-v', '--verbose-events', 'verbose_events', is_flag=True, help=VERBOSE_EVENTS_HELP)
+@click.option('--page-size', 'page_size', type=click.IntRange(1, MAX_EVENTS_PAGE_SIZE), default=DEFAULT_EVENTS_PAGE_SIZE, help=PAGE_SIZE_HELP)
+@click.option('--min-poll-interval', 'min_poll_interval', type=click.FloatRange(min=0.1), default=DEFAULT_MIN_POLL_INTERVAL, help=MIN_POLL_INTERVAL_HELP)
+@click.option('--max-poll-interval', 'max_poll_interval', type=click.FloatRange(min=0.1), default=DEFAULT_MAX_POLL_INTERVAL, help=MAX_POLL_INTERVAL_HELP)
+@click.option('--max-workers', 'max_workers', type=click.IntRange(min=1), default=DEFAULT_MAX_WORKERS, help=MAX_WORKERS_HELP)
+@click.pass_context
+def events(ctx, proj_config_dir, all_pipelines, pipeline_names, verbose_events, page_size, min_poll_interval, max_poll_interval, max_workers):
+    """Tails the events of the project pipeline, or of many pipelines at once."""
+    # Only tailing needs a workspace connection
+    if ctx.invoked_subcommand is None:
+        _tail_events(proj_config_dir, all_pipelines, pipeline_names, verbose_events,
+            page_size, min_poll_interval, max_poll_interval, max_workers)
+
+@events.command()
+@profile_option
+@click.option('-p', '--pipeline', 'pipeline', type=str, help=STORED_PIPELINE_HELP)
+@click.option('-u', '--update-id', 'update_id', type=str, help=UPDATE_ID_HELP)
+@click.option('--since', 'since', type=str, help=SINCE_HELP)
+@click.option('--until', 'until', type=str, help=UNTIL_HELP)
+@click.option('-l', '--level', 'levels', multiple=True, type=str, help=LEVEL_HELP)
+@click.option('-t', '--event-type', 'event_types', multiple=True, type=str, help=EVENT_TYPE_HELP)
+@click.option('-n', '--limit', 'limit', type=click.IntRange(min=1), help=LIMIT_HELP)
+@click.option('--json', 'as_json', is_flag=True, help=JSON_HELP)
+@click.option('-v', '--verbose-events', 'verbose_events', is_flag=True, help=VERBOSE_EVENTS_HELP)
+def query(pipeline, update_id, since, until, levels, event_types, limit, as_json, verbose_events):
+    """Prints events from the local event store, without contacting the workspace."""
+    commands.events_query(pipeline, update_id, since, until, levels, event_types, limit, as_json, verbose_events)
+
+@events.command()
+@debug_option
+@profile_option
+@pipelines_exception_eater
+@provide_api_client
+@click.option('-c', '--project-config-dir', 'proj_config_dir', type=click.Path(), help=PROJ_CONFIG_HELP)
+@click.option('-p', '--pipeline', 'pipeline', type=str, help=PIPELINE_NAME_HELP)
+@click.option('--since', 'since', type=str, help=SINCE_HELP)
+@click.option('--until', 'until', type=str, help=UNTIL_HELP)
+@click.option('--format', 'format', type=click.Choice(EXPORT_FORMATS), default="ndjson", help=EXPORT_FORMAT_HELP)
+@click.option('-o', '--output', 'output', type=click.Path(allow_dash=True), default="-", help=EXPORT_OUTPUT_HELP)
+@click.option('--page-size', 'page_size', type=click.IntRange(1, MAX_EVENTS_PAGE_SIZE), default=DEFAULT_EVENTS_PAGE_SIZE, help=PAGE_SIZE_HELP)
+@click.option('--max-workers', 'max_workers', type=click.IntRange(min=1), default=DEFAULT_MAX_WORKERS, help=BACKFILL_WORKERS_HELP)
+def export(api_client, proj_config_dir, pipeline, since, until, format, output, page_size, max_workers):
+    """Exports the event history of a pipeline to ndjson or parquet."""
+    commands.events_export(api_client, proj_config_dir, pipeline, since, until, format, output, page_size, max_workers)
+
+@events.command()
+@profile_option
+@click.option('-c', '--project-config-dir', 'proj_config_dir', type=click.Path(), help=PROJ_CONFIG_HELP)
+@click.option('-p', '--pipeline', 'pipeline', type=str, help=STORED_PIPELINE_HELP)
+@click.option('-u', '--update-id', 'update_id', type=str, help=UPDATE_ID_HELP)
+@click.option('--since', 'since', type=str, help=SINCE_HELP)
+@click.option('--until', 'until', type=str, help=UNTIL_HELP)
+@click.option('--speed', 'speed', type=click.FloatRange(min=0), default=0, help=REPLAY_SPEED_HELP)
+@click.option('-v', '--verbose-events', 'verbose_events', is_flag=True, help=VERBOSE_EVENTS_HELP)
+def replay(proj_config_dir, pipeline, update_id, since, until, speed, verbose_events):
+    """Replays the stored events of the last update, or of the one given, without contacting the workspace."""
+    commands.events_replay(proj_config_dir, pipeline, update_id, since, until, speed, verbose_events)
+
 @cli.command()
 @debug_option
 @profile_option
@@ -1,11 +1,15 @@
 from dltctl.core.helpers import *
 from dltctl.core.constants import *
 from dltctl.utils.print_utils import event_print
-from dltctl.api.pipelines import PipelinesApi
+from dltctl.api.pipelines import (PipelinesApi, DEFAULT_EVENTS_PAGE_SIZE, UPDATE_TERMINAL_STATES, print_event,
+                                  print_update_state)
+from dltctl.api.event_tail import MultiPipelineTailer
+from dltctl.utils.poll_utils import DEFAULT_MIN_POLL_INTERVAL, DEFAULT_MAX_POLL_INTERVAL
 from dltctl.types.pipelines import ClusterConfig,PipelineSettings
 from dltctl.types.project import ProjectConfig
 from pathlib import Path
-import datetime
+from concurrent.futures import ThreadPoolExecutor
+import click, datetime, time
 
 def create(api_client, proj_config_dir, workspace_path, pipeline_files_dir):
     """Creates a pipeline with the specified configuration."""
@@ -21,7 +25,8 @@ def create(api_client, proj_config_dir, workspace_path, pipeline_files_dir):
               msg=f"{str(e)}")
         exit(1)
     workspace_api = WorkspaceApi(api_client)
-    pipelines_api = PipelinesApi(api_client)
+    pipelines_api = PipelinesApi(api_client, id_cache=get_pipeline_id_cache(api_client))
+    hash_cache = ArtifactHashCache(get_project_state_dir(proj_config_dir))
 
 
     if not settings.name:
@@ -53,7 +58,7 @@ def create(api_client, proj_config_dir, workspace_path, pipeline_files_dir):
             msg="Unable to detect pipeline files in current directory and no pipeline files specified. Pipeline files are required for a pipeline to be created")
           return
     
-        artifacts = workspace_api.upload_pipeline_artifacts(pipeline_files,workspace_path)
+        artifacts = workspace_api.upload_pipeline_artifacts(pipeline_files,workspace_path, hash_cache=hash_cache)
         settings.pipeline_files = artifacts
     ts = datetime.datetime.utcnow().isoformat()[:-3]+'Z'
     event_print("cli_status", level="INFO", msg=f"Creating pipeline named: {settings.name}")
@@ -61,7 +66,7 @@ def create(api_client, proj_config_dir, workspace_path, pipeline_files_dir):
     pipeline = pipelines_api.create(settings=json_settings)
     #set_acls(api_client, proj_settings)
 
-def deploy(api_client, as_job, full_refresh, pipeline_files_dir, workspace_path, verbose_events, proj_config_dir, force):
+def deploy(api_client, as_job, full_refresh, pipeline_files_dir, workspace_path, verbose_events, proj_config_dir, force, max_workers=DEFAULT_MAX_WORKERS, since_ref=False, bulk=False, content_addressed=False, resume=False):
     """Stages artifacts, creates/starts and/or restarts a DLT pipeline"""
     try:
         proj_settings = get_project_settings(proj_config_dir)
@@ -69,8 +74,10 @@ def deploy(api_client, as_job, full_refresh, pipeline_files_dir, workspace_path,
         workspace_path = workspace_path if workspace_path else proj_settings.pipeline_files_workspace_dir
         settings = proj_settings.pipeline_settings
         pipeline_files = get_dlt_artifacts(pipeline_files_dir)
-        pipelines_api = PipelinesApi(api_client)
+        pipelines_api = PipelinesApi(api_client, id_cache=get_pipeline_id_cache(api_client), event_store=get_event_store(api_client))
         workspace_api = WorkspaceApi(api_client)
+        hash_cache = ArtifactHashCache(get_project_state_dir(proj_config_dir))
+        journal = DeployJournal(get_project_state_dir(proj_config_dir))
     except Exception as e:
         event_print(
               type="cli_status",
@@ -99,7 +106,26 @@ def deploy(api_client, as_job, full_refresh, pipeline_files_dir, workspace_path,
 
     
     settings.id = pipelines_api.get_pipeline_id_by_name(settings.name)
-    pipeline_files_diffs = get_artifact_diffs(api_client, settings, pipeline_files)
+    if bool(resume) and journal.resume(settings.name, workspace_path):
+        event_print(
+            type="cli_status",
+            level='INFO',
+            msg=f"Resuming the deploy started at {journal.get('started_at')}")
+    else:
+        journal.start(settings.name, workspace_path)
+
+    pipeline_files_diffs = None
+    local_stats = get_artifact_stats(pipeline_files)
+    journaled_diffs = journal.get("diffs")
+    # Diffs are only reused while the local files are untouched since they were computed
+    if settings.id and journaled_diffs and journaled_diffs["stats"] == local_stats:
+        pipeline_files_diffs = journaled_diffs["diffs"]
+    if pipeline_files_diffs is None and bool(since_ref) and not bool(force):
+        pipeline_files_diffs = get_git_artifact_diffs(api_client, settings, pipeline_files, workspace_path, pipeline_files_dir)
+    if pipeline_files_diffs is None:
+        pipeline_files_diffs = get_artifact_diffs(api_client, settings, pipeline_files, max_workers=max_workers, hash_cache=hash_cache, workspace_path=workspace_path)
+    if settings.id:
+        journal.record("diffs", {"stats": local_stats, "diffs": pipeline_files_diffs})
 
     try:
       if(settings.id):
@@ -114,10 +140,10 @@ def deploy(api_client, as_job, full_refresh, pipeline_files_dir, workspace_path,
               level="INFO",
               msg="Force flag was set - force uploading all artifacts"
           )
-              artifacts = workspace_api.upload_pipeline_artifacts(pipeline_files,workspace_path)
+              artifacts = upload_journaled_artifacts(workspace_api, journal, pipeline_files,workspace_path, hash_cache=hash_cache, max_workers=max_workers, bulk=bulk, content_addressed=content_addressed)
               settings.pipeline_files = artifacts
           else:
-              artifacts = workspace_api.upload_pipeline_artifacts(pipeline_files_diffs["upload"],workspace_path)
+              artifacts = upload_journaled_artifacts(workspace_api, journal, pipeline_files_diffs["upload"],workspace_path, hash_cache=hash_cache, max_workers=max_workers, bulk=bulk, content_addressed=content_addressed)
               settings.pipeline_files = artifacts + pipeline_files_diffs["keep"]
         else:
           event_print(
@@ -125,75 +151,97 @@ def deploy(api_client, as_job, full_refresh, pipeline_files_dir, workspace_path,
               level="INFO",
               msg="No changes detected. Nothing new to deploy."
           )
+          journal.clear()
           return
       else:
-        artifacts = workspace_api.upload_pipeline_artifacts(pipeline_files,workspace_path)
+        artifacts = upload_journaled_artifacts(workspace_api, journal, pipeline_files,workspace_path, hash_cache=hash_cache, max_workers=max_workers, bulk=bulk, content_addressed=content_addressed)
         settings.pipeline_files = artifacts
       
-      json_settings = settings.to_json()
-      # If there's a pipeline id, it's an update
-      if(settings.id):
-          pipeline = pipelines_api.get(settings.id)
-          if pipeline["state"] == 'RUNNING':
-              event_print(
-              type="cli_status",
-              level='INFO',
-              msg=f"Pipeline {settings.id} is currrently RUNNING. Stopping pipeline.")
-              update = pipelines_api.stop(settings.id)
-              
-      # Otherwise it's a new pipeline
-      else:
+      if journal.get("edited") == settings.to_json() and is_pipeline_edit_applied(api_client, settings):
           event_print(
               type="cli_status",
               level='INFO',
-              msg=f"Detected first time deploy. Creating pipeline named {settings.name}")
+              msg=f"Settings for pipeline ID {settings.id} were updated before the interruption. Skipping.")
+      else:
+        json_settings = settings.to_json()
+        # If there's a pipeline id, it's an update
+        if(settings.id):
+            if pipelines_api.get_pipeline_state(settings.id) == 'RUNNING':
+                event_print(
+                type="cli_status",
+                level='INFO',
+                msg=f"Pipeline {settings.id} is currrently RUNNING. Stopping pipeline.")
+                update = pipelines_api.stop(settings.id)
+              
+        # Otherwise it's a new pipeline
+        else:
+            event_print(
+                type="cli_status",
+                level='INFO',
+                msg=f"Detected first time deploy. Creating pipeline named {settings.name}")
 
-          pipeline = pipelines_api.create(settings=json_settings)
-          settings.id = pipeline["pipeline_id"]
+            pipeline = pipelines_api.create(settings=json_settings)
+            settings.id = pipeline["pipeline_id"]
 
-          event_print(
-              type="cli_status",
-              level='INFO',
-              msg=f"Successfully created with pipeline ID: {settings.id}") 
+            event_print(
+                type="cli_status",
+                level='INFO',
+                msg=f"Successfully created with pipeline ID: {settings.id}") 
 
-      event_print(
-              type="cli_status",
-              level='INFO',
-              msg=f"Updating settings for pipeline ID: {settings.id}")
+        event_print(
+                type="cli_status",
+                level='INFO',
+                msg=f"Updating settings for pipeline ID: {settings.id}")
 
-      #set_acls(api_client, proj_settings)
+        #set_acls(api_client, proj_settings)
 
-      # Workaround for Pipeline Edit API starting continuous pipelines
-      if settings.continuous:
-          edit_and_stop_continuous(api_client, settings)
-      else:
-          pipelines_api.edit(settings.id, settings)
+        # Workaround for Pipeline Edit API starting continuous pipelines
+        if settings.continuous:
+            edit_and_stop_continuous(api_client, settings)
+        else:
+            pipelines_api.edit(settings.id, settings)
+        record_deployment(workspace_api, settings, workspace_path, pipeline_files_dir, get_project_state_dir(proj_config_dir))
+        journal.record("edited", settings.to_json())
 
       if(bool(as_job)):
         run_as_job(api_client=api_client, 
           settings=proj_settings, 
           full_refresh=bool(full_refresh),
           pipeline_id=settings.id)
+        journal.clear()
       else:
-          event_print(
+          ts = journal.get("update_started")
+          update_id = journal.get("update_id")
+          if ts:
+              event_print(
+                  type="cli_status",
+                  level='INFO',
+                  msg=f"An update of pipeline {settings.id} was started before the interruption. Resuming its events.")
+          else:
+              event_print(
                   type="cli_status",
                   level='INFO',
                   msg=f"Starting pipeline {settings.id}")
-         
-          pipelines_api.start_update(settings.id, bool(full_refresh))
-          
+
+              update = pipelines_api.start_update(settings.id, bool(full_refresh))
+              ts = datetime.datetime.utcnow().isoformat()[:-3]+'Z'
+              update_id = get_started_update_id(update)
+              journal.record("update_id", update_id)
+              journal.record("update_started", ts)
+
           event_print(
                   type="cli_status",
                   level='INFO',
                   msg=f"Waiting for pipeline events...")
-          ts = datetime.datetime.utcnow().isoformat()[:-3]+'Z'
     
           # If it's a streaming pipeline, we stop tailing events after some time without events
           if(settings.continuous):  
-              pipelines_api.stream_events(settings.id, ts=ts, max_polls_without_events=10, verbose=bool(verbose_events))
+              pipelines_api.stream_events(settings.id, ts=ts, max_polls_without_events=10, verbose=bool(verbose_events), update_id=update_id)
+              journal.clear()
               exit(0)
           else:
-              pipelines_api.stream_events(settings.id, ts=ts, verbose=bool(verbose_events))
+              pipelines_api.stream_events(settings.id, ts=ts, verbose=bool(verbose_events), update_id=update_id)
+              journal.clear()
               exit(0)
       
     
@@ -215,7 +263,7 @@ def delete(api_client, proj_config_dir):
               level='ERROR',
               msg=f"{str(e)}")
         exit(1)
-    pipelines_api = PipelinesApi(api_client)
+    pipelines_api = PipelinesApi(api_client, id_cache=get_pipeline_id_cache(api_client))
 
     settings.id = pipelines_api.get_pipeline_id_by_name(settings.name)
     
@@ -301,7 +349,7 @@ def show(api_client, proj_config_dir):
               level='ERROR',
               msg=f"{str(e)}")
         exit(1)
-    pipelines_api = PipelinesApi(api_client)
+    pipelines_api = PipelinesApi(api_client, id_cache=get_pipeline_id_cache(api_client))
     settings.id = pipelines_api.get_pipeline_id_by_name(settings.name)
     
     if not settings.id:
@@ -312,11 +360,140 @@ def show(api_client, proj_config_dir):
         return
 
     # TODO - make this prettier
-    p = pipelines_api.get(settings.id)
+    p = pipelines_api.get_snapshot(settings.id)
     print(p)
     return
 
-def stage(api_client, proj_config_dir, pipeline_files_dir, workspace_path, force):
+def events(api_client, proj_config_dir, all_pipelines=False, pipeline_names=None, verbose_events=False,
+           page_size=DEFAULT_EVENTS_PAGE_SIZE, min_poll_interval=DEFAULT_MIN_POLL_INTERVAL,
+           max_poll_interval=DEFAULT_MAX_POLL_INTERVAL, max_workers=DEFAULT_MAX_WORKERS):
+    """Tails the events of one or more pipelines, merged in timestamp order."""
+    if max_poll_interval < min_poll_interval:
+        event_print("cli_status", level="ERROR",
+                    msg=f"--min-poll-interval ({min_poll_interval}) can't be greater than --max-poll-interval ({max_poll_interval}).")
+        exit(1)
+    pipelines_api = PipelinesApi(api_client, id_cache=get_pipeline_id_cache(api_client), event_store=get_event_store(api_client))
+    if all_pipelines:
+        pipelines = {p["pipeline_id"]: p["name"] for p in pipelines_api.iter_pipelines()}
+    else:
+        if pipeline_names:
+            names = [name.strip() for name in pipeline_names.split(",") if name.strip()]
+        else:
+            try:
+                names = [get_project_settings(proj_config_dir).pipeline_settings.name]
+            except Exception as e:
+                event_print(
+                      type="cli_status",
+                      level='ERROR',
+                      msg=f"{str(e)}")
+                exit(1)
+        pipelines = {}
+        for name in names:
+            pipeline_id = pipelines_api.get_pipeline_id_by_name(name)
+            if not pipeline_id:
+                event_print("cli_status", level="ERROR", msg=f"No existing pipeline with name {name} found.")
+                exit(1)
+            pipelines[pipeline_id] = name
+
+    if not pipelines:
+        event_print("cli_status", level="INFO", msg="No pipelines found. Nothing to tail.")
+        return
+
+    event_print("cli_status", level="INFO", msg=f"Tailing events of {len(pipelines)} pipeline(s). Press Ctrl+C to stop.")
+    MultiPipelineTailer(pipelines_api, pipelines,
+        min_polling_interval=min_poll_interval,
+        max_polling_interval=max_poll_interval,
+        page_size=page_size,
+        max_workers=max_workers,
+        verbose=bool(verbose_events)).run()
+
+def _get_stored_pipeline(pipeline, proj_config_dir):
+    """The pipeline given on the command line, or the project pipeline"""
+    if pipeline:
+        return pipeline
+    try:
+        return get_project_settings(proj_config_dir).pipeline_settings.name
+    except Exception as e:
+        event_print(
+              type="cli_status",
+              level='ERROR',
+              msg=f"{str(e)}")
+        exit(1)
+
+def events_query(pipeline=None, update_id=None, since=None, until=None, levels=None,
+                 event_types=None, limit=None, as_json=False, verbose_events=False):
+    """Prints events from the local event store."""
+    event_store = get_event_store()
+    count = 0
+    for event in event_store.query(pipeline=pipeline, update_id=update_id, since=since, until=until,
+                                   levels=levels, event_types=event_types, limit=limit):
+        count += 1
+        if as_json:
+            click.echo(event.raw)
+        else:
+            print_event(event, bool(verbose_events), prefix=(event.origin or {}).get("pipeline_name"))
+    if not count and not as_json:
+        event_print("cli_status", level="INFO", msg="No stored events match. Events are stored as dltctl fetches them.")
+
+def events_replay(proj_config_dir, pipeline=None, update_id=None, since=None, until=None, speed=0, verbose_events=False):
+    """Replays the stored events of an update as they were streamed."""
+    event_store = get_event_store()
+    pipeline = _get_stored_pipeline(pipeline, proj_config_dir)
+    if not update_id and not since:
+        update_id = event_store.get_last_update_id(pipeline)
+        if not update_id:
+            event_print("cli_status", level="INFO", msg=f"No stored events for pipeline {pipeline}. Nothing to replay.")
+            return
+
+    event_print("cli_status", level="INFO", msg=f"Replaying stored events of pipeline {pipeline}" +
+                (f" update {update_id}" if update_id else ""))
+    last_error = None
+    previous = None
+    for event in event_store.query(pipeline=pipeline, update_id=update_id, since=since, until=until):
+        if speed and previous and event.timestamp and previous.timestamp:
+            gap = (datetime.datetime.fromisoformat(event.timestamp.replace("Z", "+00:00")) -
+                   datetime.datetime.fromisoformat(previous.timestamp.replace("Z", "+00:00"))).total_seconds()
+            time.sleep(min(max(gap, 0) / speed, MAX_REPLAY_GAP_SECONDS))
+        previous = event
+        print_event(event, bool(verbose_events))
+        if event.has_error():
+            last_error = event.error
+        if event.event_type != 'update_progress':
+            continue
+        state = (event.details or {}).get("update_progress", {}).get("state")
+        if state in UPDATE_TERMINAL_STATES:
+            print_update_state(state, last_error)
+
+def events_export(api_client, proj_config_dir, pipeline=None, since=None, until=None, format="ndjson", output="-",
+                  page_size=DEFAULT_EVENTS_PAGE_SIZE, max_workers=DEFAULT_MAX_WORKERS):
+    """Writes the event history of a pipeline to a file, one page at a time."""
+    pipeline = _get_stored_pipeline(pipeline, proj_config_dir)
+    # Exports can be large, they bypass the local event store
+    pipelines_api = PipelinesApi(api_client, id_cache=get_pipeline_id_cache(api_client))
+    pipeline_id = pipelines_api.get_pipeline_id_by_name(pipeline)
+    if not pipeline_id:
+        event_print("cli_status", level="ERROR", msg=f"No existing pipeline with name {pipeline} found.")
+        exit(1)
+
+    try:
+        writer = get_event_writer(format, output)
+    except (ImportError, ValueError, OSError) as e:
+        event_print("cli_status", level="ERROR", msg=f"{str(e)}")
+        exit(1)
+
+    count = 0
+    try:
+        # Every exported row reads details and error, so they are kept from the first parse
+        for page in pipelines_api.iter_backfill_pages(pipeline_id, since=since, until=until, max_workers=max_workers,
+                                                      page_size=page_size, keep_details=True):
+            writer.write(page)
+            count += len(page)
+    finally:
+        writer.close()
+    if output != "-":
+        event_print("cli_status", level="INFO", msg=f"Exported {count} events of pipeline {pipeline} to {output}")
+
+def stage(api_client, proj_config_dir, pipeline_files_dir, workspace_path, force, max_workers=DEFAULT_MAX_WORKERS, since_ref=False, bulk=False, content_addressed=False):
     try:
         proj_settings = get_project_settings(proj_config_dir)
         pipeline_files_dir = pipeline_files_dir if pipeline_files_dir else proj_settings.pipeline_files_local_dir
@@ -330,7 +507,8 @@ def stage(api_client, proj_config_dir, pipeline_files_dir, workspace_path, force
               msg=f"{str(e)}")
         exit(1)
     workspace_api = WorkspaceApi(api_client)
-    pipelines_api = PipelinesApi(api_client)
+    pipelines_api = PipelinesApi(api_client, id_cache=get_pipeline_id_cache(api_client))
+    hash_cache = ArtifactHashCache(get_project_state_dir(proj_config_dir))
 
     settings.id = pipelines_api.get_pipeline_id_by_name(settings.name)
 
@@ -351,7 +529,11 @@ def stage(api_client, proj_config_dir, pipeline_files_dir, workspace_path, force
     if not workspace_path:
         workspace_path = workspace_api.get_default_workspace_path()
     
-    pipeline_files_diffs = get_artifact_diffs(api_client, settings, pipeline_files)
+    pipeline_files_diffs = None
+    if bool(since_ref) and not bool(force):
+        pipeline_files_diffs = get_git_artifact_diffs(api_client, settings, pipeline_files, workspace_path, pipeline_files_dir)
+    if pipeline_files_diffs is None:
+        pipeline_files_diffs = get_artifact_diffs(api_client, settings, pipeline_files, max_workers=max_workers, hash_cache=hash_cache, workspace_path=workspace_path)
 
     if (len(pipeline_files_diffs["upload"]) > 0 
            or len(pipeline_files_diffs["delete"]) > 0 
@@ -364,10 +546,10 @@ def stage(api_client, proj_config_dir, pipeline_files_dir, workspace_path, force
             level="INFO",
             msg="Force flag was set - force uploading all artifacts"
         )
-            artifacts = workspace_api.upload_pipeline_artifacts(pipeline_files,workspace_path)
+            artifacts = workspace_api.upload_pipeline_artifacts(pipeline_files,workspace_path, hash_cache=hash_cache, max_workers=max_workers, bulk=bulk, content_addressed=content_addressed)
             settings.pipeline_files = artifacts
         else:
-            artifacts = workspace_api.upload_pipeline_artifacts(pipeline_files_diffs["upload"],workspace_path)
+            artifacts = workspace_api.upload_pipeline_artifacts(pipeline_files_diffs["upload"],workspace_path, hash_cache=hash_cache, max_workers=max_workers, bulk=bulk, content_addressed=content_addressed)
             settings.pipeline_files = artifacts + pipeline_files_diffs["keep"]
 
         # An edit starts a pipeline for a continuous pipeline which may not be desired.
@@ -385,6 +567,7 @@ def stage(api_client, proj_config_dir, pipeline_files_dir, workspace_path, force
             edit_and_stop_continuous(api_client, settings)
         else:
             pipelines_api.edit(settings.id, settings)
+        record_deployment(workspace_api, settings, workspace_path, pipeline_files_dir, get_project_state_dir(proj_config_dir))
         
         #set_acls(api_client, proj_settings)
 
@@ -400,7 +583,7 @@ def start(api_client, as_job, full_refresh, proj_config_dir):
               msg=f"{str(e)}")
         exit(1)
     
-    pipelines_api = PipelinesApi(api_client)
+    pipelines_api = PipelinesApi(api_client, id_cache=get_pipeline_id_cache(api_client), event_store=get_event_store(api_client))
 
     settings.id = pipelines_api.get_pipeline_id_by_name(settings.name)
 
@@ -412,8 +595,7 @@ def start(api_client, as_job, full_refresh, proj_config_dir):
         exit(1)
 
     # Check to see if the pipeline is already running
-    pipeline = pipelines_api.get(settings.id)
-    if pipeline["state"] == 'RUNNING':
+    if pipelines_api.get_pipeline_state(settings.id) == 'RUNNING':
         event_print(
         type="cli_status",
         level='ERROR',
@@ -429,8 +611,10 @@ def start(api_client, as_job, full_refresh, proj_config_dir):
           pipeline_id=settings.id)
         exit(0)
     else:
-        pipelines_api.start_update(settings.id, bool(full_refresh))
-        pipelines_api.stream_events(settings.id, ts=ts, max_polls_without_events=10)
+        update = pipelines_api.start_update(settings.id, bool(full_refresh))
+        # Triggered updates are followed until they finish, continuous ones until they go quiet
+        pipelines_api.stream_events(settings.id, ts=ts, max_polls_without_events=10 if settings.continuous else None,
+                                    update_id=get_started_update_id(update))
         exit(0)
 
 def stop(api_client, proj_config_dir):
@@ -444,7 +628,7 @@ def stop(api_client, proj_config_dir):
               level='ERROR',
               msg=f"{str(e)}")
         exit(1)
-    pipelines_api = PipelinesApi(api_client)
+    pipelines_api = PipelinesApi(api_client, id_cache=get_pipeline_id_cache(api_client), event_store=get_event_store(api_client))
 
     settings.id = pipelines_api.get_pipeline_id_by_name(settings.name)
 
@@ -466,3 +650,176 @@ def stop(api_client, proj_config_dir):
     else:
         pipelines_api.stop_async(settings.id)
         pipelines_api.stream_events(settings.id, ts=ts, max_polls_without_events=5)
+
+def rollback(api_client, proj_config_dir, workspace_path, to=1):
+    """Restores the libraries and settings of a previous deploy"""
+    try:
+        proj_settings = get_project_settings(proj_config_dir)
+        workspace_path = workspace_path if workspace_path else proj_settings.pipeline_files_workspace_dir
+        settings = proj_settings.pipeline_settings
+        pipelines_api = PipelinesApi(api_client, id_cache=get_pipeline_id_cache(api_client))
+        workspace_api = WorkspaceApi(api_client)
+        history = DeploymentHistory(get_project_state_dir(proj_config_dir))
+    except Exception as e:
+        event_print(
+              type="cli_status",
+              level='ERROR',
+              msg=f"{str(e)}")
+        exit(1)
+
+    settings.id = pipelines_api.get_pipeline_id_by_name(settings.name)
+    if not settings.id:
+        event_print(
+            type="cli_status",
+            level='ERROR',
+            msg=f"No existing pipeline with name {settings.name} found or no settings found. Nothing to roll back.")
+        exit(1)
+
+    if not workspace_path:
+        workspace_path = workspace_api.get_default_workspace_path()
+
+    # The remote history is shared by everyone deploying the pipeline, the local one covers a lost manifest
+    entries = workspace_api.get_deployment_history(workspace_path, settings.id)
+    if not entries:
+        entries = history.get(settings.id)
+    entries = get_rollback_candidates(entries)
+    if len(entries) <= to:
+        event_print(
+            type="cli_status",
+            level='ERROR',
+            msg=f"{len(entries)} deploy(s) recorded for pipeline {settings.id}. Unable to roll back {to}.")
+        exit(1)
+    entry = entries[-1 - to]
+
+    unretained = get_unretained_libraries(workspace_api, entry["libraries"])
+    if unretained:
+        for library in unretained:
+            event_print(
+                type="cli_status",
+                level='ERROR',
+                msg=f"{library} has changed, been removed or has no recorded hash since the deploy from {entry['deployed_at']}.")
+        event_print(
+            type="cli_status",
+            level='ERROR',
+            msg="Unable to roll back without uploading. Deploy from the previous revision instead.")
+        exit(1)
+
+    event_print(
+        type="cli_status",
+        level='INFO',
+        msg=f"Rolling back pipeline {settings.id} to the deploy from {entry['deployed_at']}")
+    restored = PipelineSettings().from_dict(entry["settings"])
+    restored.id = settings.id
+    try:
+        if pipelines_api.get_pipeline_state(settings.id) == 'RUNNING':
+            event_print(
+                type="cli_status",
+                level='INFO',
+                msg=f"Pipeline {settings.id} is currrently RUNNING. Stopping pipeline.")
+            pipelines_api.stop(settings.id)
+        # Workaround for Pipeline Edit API starting continuous pipelines
+        if restored.continuous:
+            edit_and_stop_continuous(api_client, restored)
+        else:
+            pipelines_api.edit(settings.id, restored)
+    except Exception as e:
+        event_print(
+              type="cli_status",
+              level='ERROR',
+              msg=f"{str(e)}")
+        exit(1)
+
+    # Record how far back this went, so the deploys rolled back from are skipped by the next rollback
+    rolled_back = dict(entry, deployed_at=datetime.datetime.utcnow().isoformat()[:-3]+'Z', rolled_back=to)
+    history.append(settings.id, rolled_back)
+    try:
+        workspace_api.record_deployment(workspace_path, settings.id, entry.get("git_sha"), history_entry=rolled_back)
+    except Exception as e:
+        event_print(
+            type="cli_status",
+            level="WARNING",
+            msg=f"Unable to record rollback: {e}")
+
+    event_print(
+        type="cli_status",
+        level='INFO',
+        msg=f"Rolled back pipeline {settings.id}. Run dltctl start to run an update with the restored libraries.")
+
+def gc(api_client, proj_config_dir, workspace_path, dry_run=False, grace_days=DEFAULT_GC_GRACE_DAYS, max_workers=DEFAULT_MAX_WORKERS):
+    """Deletes artifacts under the pipeline files workspace dir that no pipeline references"""
+    try:
+        proj_settings = get_project_settings(proj_config_dir)
+        workspace_path = workspace_path if workspace_path else proj_settings.pipeline_files_workspace_dir
+        workspace_api = WorkspaceApi(api_client)
+    except Exception as e:
+        event_print(
+              type="cli_status",
+              level='ERROR',
+              msg=f"{str(e)}")
+        exit(1)
+
+    # Never fall back to the home folder, it holds far more than pipeline artifacts
+    if not workspace_path:
+        event_print(
+            type="cli_status",
+            level='ERROR',
+            msg="No pipeline_files_workspace_dir in dltctl.yaml and no workspace path specified. Nothing to collect.")
+        exit(1)
+
+    try:
+        referenced = get_referenced_libraries(api_client, workspace_api, workspace_path, grace_days, max_workers=max_workers)
+        orphaned_dirs, orphaned_notebooks, orphaned_artifacts = get_orphaned_artifacts(workspace_api, workspace_path, referenced, max_workers=max_workers)
+    except Exception as e:
+        event_print(
+              type="cli_status",
+              level='ERROR',
+              msg=f"{str(e)}")
+        exit(1)
+
+    if not orphaned_artifacts:
+        event_print(
+            type="cli_status",
+            level='INFO',
+            msg=f"No unreferenced artifacts found under {workspace_path}. Nothing to collect.")
+        return
+
+    event_print(
+        type="cli_status",
+        level='INFO',
+        msg=f"Found {len(orphaned_artifacts)} unreferenced artifact(s) under {workspace_path}.")
+    for path in orphaned_dirs + orphaned_notebooks:
+        event_print(
+            type="cli_status",
+            level='INFO',
+            msg=f"{'Would delete' if dry_run else 'Deleting'}: {path}")
+    if dry_run:
+        return
+
+    deletes = [(d, True) for d in orphaned_dirs] + [(n, False) for n in orphaned_notebooks]
+    failed = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [(path, executor.submit(workspace_api.delete, path, is_recursive)) for path, is_recursive in deletes]
+        for path, future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                failed.append(path)
+                event_print(
+                    type="cli_status",
+                    level='ERROR',
+                    msg=f"Failed to delete {path}: {e}")
+
+    deleted = [a for a in orphaned_artifacts if not any(a == f or a.startswith(f + "/") for f in failed)]
+    try:
+        workspace_api.remove_manifest_entries(deleted)
+    except Exception as e:
+        event_print(
+            type="cli_status",
+            level='WARNING',
+            msg=f"Unable to update artifact manifests: {e}")
+    if failed:
+        exit(1)
+    event_print(
+        type="cli_status",
+        level='INFO',
+        msg=f"Deleted {len(deleted)} unreferenced artifact(s) with {len(deletes)} request(s).")
@@ -5,4 +5,34 @@ VERBOSE_EVENTS_HELP = "Will print more verbose DLT event logs to the console"
 PROJ_CONFIG_HELP = "Directory containing config named dltctl.yaml. If not specified, will look in local directory for dltctl.yaml"
 FULL_REFRESH_HELP = "Whether to execute a full refresh of the pipeline"
 AS_JOB_HELP = "(experimental) Whether to run as a Databricks job non-interactively"
-FORCE_HELP = "Force upload artifacts and update settings"
\ No newline at end of file
+FORCE_HELP = "Force upload artifacts and update settings"
+SINCE_REF_HELP = "Detect changed artifacts with git diff against the commit recorded at the last deploy instead of hashing every file"
+BULK_HELP = "Upload changed artifacts with a single archive import instead of one import per file"
+CONTENT_ADDRESSED_HELP = "Upload artifacts to content-addressed paths under .dltctl/objects in the workspace path, skipping any already stored"
+ROLLBACK_TO_HELP = "Number of deploys to roll back"
+DRY_RUN_HELP = "Only report what would be deleted"
+GRACE_DAYS_HELP = "Keep artifacts used by deploys in the rollback history from this many days back"
+DEFAULT_GC_GRACE_DAYS = 7
+# Artifacts uploaded this recently may belong to a deploy that hasn't updated its pipeline yet
+GC_MIN_ARTIFACT_AGE_MINUTES = 15
+RESUME_HELP = "Resume an interrupted deploy, skipping the steps it already completed"
+ALL_PIPELINES_HELP = "Tail the events of every pipeline in the workspace"
+PIPELINES_HELP = "Comma-delimited list of pipeline names to tail events for"
+PAGE_SIZE_HELP = "Number of events to request per page"
+MIN_POLL_INTERVAL_HELP = "Seconds between polls while events are arriving"
+MAX_POLL_INTERVAL_HELP = "Longest wait in seconds between polls of an idle pipeline"
+STORED_PIPELINE_HELP = "Name or ID of the pipeline. Defaults to the project pipeline for replay and to all pipelines for query"
+UPDATE_ID_HELP = "Only events of this update"
+SINCE_HELP = "Only events at or after this timestamp, e.g. 2024-01-01T00:00:00.000Z"
+UNTIL_HELP = "Only events before this timestamp"
+LEVEL_HELP = "Only events of this level. Can be specified multiple times"
+EVENT_TYPE_HELP = "Only events of this type. Can be specified multiple times"
+LIMIT_HELP = "Maximum number of events to print"
+JSON_HELP = "Print the events as JSON, one per line"
+REPLAY_SPEED_HELP = "Replay at this multiple of the original pace. 0 prints every event right away"
+MAX_REPLAY_GAP_SECONDS = 5
+EXPORT_FORMAT_HELP = "Output format. parquet needs pyarrow, installed with the dltctl[parquet] extra"
+BACKFILL_WORKERS_HELP = "Number of time windows fetched at the same time. Each one buffers at most a few pages ahead of the writer"
+EXPORT_OUTPUT_HELP = "File to write the events to. - writes ndjson to stdout"
+MAX_WORKERS_HELP = "Maximum number of concurrent workspace requests"
+DEFAULT_MAX_WORKERS = 8
\ No newline at end of file
@@ -2,12 +2,59 @@ from dltctl.types.permissions import AclList
 from dltctl.types.pipelines import PipelineSettings, JobConfig
 from dltctl.types.project import ProjectConfig
 from dltctl.utils.print_utils import event_print
+from dltctl.utils.cache_utils import PipelineIdCache, ArtifactHashCache
+from dltctl.utils.hash_utils import get_local_artifact_md5, get_notebook_source_md5
+from dltctl.utils.git_utils import GitError, get_changed_files, get_head_sha, is_clean
+from dltctl.utils.state_utils import DeploymentHistory, DeployJournal
+from dltctl.utils.event_store import EventStore
+from dltctl.utils.export_utils import get_event_writer
+from dltctl.core.constants import DEFAULT_MAX_WORKERS, GC_MIN_ARTIFACT_AGE_MINUTES
 from dltctl.api.pipelines import PipelinesApi
 from dltctl.api.permissions import PermissionsApi
 from dltctl.api.jobs import JobsApi
-from dltctl.api.workspace import WorkspaceApi
+from dltctl.api.workspace import (WorkspaceApi, ARTIFACT_MANIFEST_NAME, get_artifact_workspace_path,
+                                  get_artifact_manifest_dir, get_object_hash)
+from databricks_cli.configure.config import get_profile_from_context
+from databricks_cli.configure.provider import ProfileConfigProvider, InvalidConfigurationError, get_config
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-import os, copy, hashlib, base64, glob
+from urllib.parse import urlparse
+import os, copy, datetime, glob, json
+
+def get_project_state_dir(settings_dir=None):
+    """Directory next to dltctl.yaml where dltctl keeps local state such as the hash cache"""
+    return Path(settings_dir if settings_dir else os.getcwd(), ".dltctl").as_posix()
+
+def _get_context_profile():
+    try:
+        return get_profile_from_context()
+    except RuntimeError:
+        # No active click context, e.g. when called as a library
+        return None
+
+def get_pipeline_id_cache(api_client):
+    """Returns the pipeline name to ID cache for the active profile and workspace host"""
+    return PipelineIdCache(profile=_get_context_profile(), host=getattr(api_client, "url", None))
+
+def _get_profile_api_url(profile):
+    """The API URL an ApiClient of the profile would use, read from the config without connecting"""
+    try:
+        config = ProfileConfigProvider(profile).get_config() if profile else get_config()
+    except InvalidConfigurationError:
+        return None
+    if not config or not config.host:
+        return None
+    parsed_url = urlparse(config.host)
+    return "%s://%s/api/" % (parsed_url.scheme, parsed_url.hostname)
+
+def get_event_store(api_client=None):
+    """Returns the local store of fetched pipeline events for the active profile and workspace host.
+
+    Without an API client, e.g. for offline queries, the host comes from the profile's config.
+    """
+    profile = _get_context_profile()
+    host = getattr(api_client, "url", None) if api_client else _get_profile_api_url(profile)
+    return EventStore(scope=f"{profile if profile else 'DEFAULT'}@{host}")
 
 def set_acls(api_client, settings):
     if not settings.access_config:
@@ -192,20 +239,18 @@ def is_job_conf_diff(api_client, job_conf, job_id):
 
 def is_access_conf_diff(api_client, access_conf):
     return
-def is_pipeline_settings_diff(api_client, settings):
-    remote_settings = PipelineSettings().from_dict(PipelinesApi(api_client).get_pipeline_settings(settings.id))
-    r = copy.deepcopy(remote_settings)
+def _core_settings_json(settings):
     s = copy.deepcopy(settings)
     # Don't compare libraries or pipeline files, we're concerned about the core settings
-    r.libraries = None
-    r.pipeline_files = None
-    r.storage = None
-    r.id = None
     s.libraries = None
     s.pipeline_files = None
     s.storage = None
     s.id = None
-    settings_diff = not r.to_json() == s.to_json()
+    return s.to_json()
+
+def is_pipeline_settings_diff(api_client, settings):
+    remote_settings = PipelineSettings().from_dict(PipelinesApi(api_client).get_pipeline_settings(settings.id))
+    settings_diff = not _core_settings_json(remote_settings) == _core_settings_json(settings)
     if settings_diff:
         event_print(
               type="cli_status",
@@ -230,7 +275,64 @@ def get_dlt_artifacts(pipeline_files_dir=None):
         
     return pipeline_files
 
-def get_artifact_diffs(api_client, settings, artifacts):
+def _get_remote_artifact_md5(workspace_api, path):
+    return get_notebook_source_md5(workspace_api.get_workspace_file_b64(path))
+
+def get_manifest_md5s(workspace_api, libs, include_object_paths=True):
+    """Looks up remote artifact hashes from the manifests stored next to the pipeline libraries"""
+    manifest_md5s = {}
+    for workspace_dir in sorted(set(get_artifact_manifest_dir(l) for l in libs)):
+        manifest = workspace_api.get_artifact_manifest(workspace_dir)
+        if not manifest:
+            continue
+        for path, entry in manifest["artifacts"].items():
+            if isinstance(entry, dict) and entry.get("hash"):
+                manifest_md5s[path] = entry["hash"]
+    # Content-addressed objects carry their hash in the path even if the store manifest lost them
+    for l in libs if include_object_paths else []:
+        if l not in manifest_md5s and get_object_hash(l):
+            manifest_md5s[l] = get_object_hash(l)
+    return manifest_md5s
+
+def _find_remote_artifact(artifact, remote_paths, workspace_path=None):
+    """Workspace path of the library an artifact was uploaded to, or None"""
+    target = get_artifact_workspace_path(artifact, workspace_path) if workspace_path else None
+    if target in remote_paths:
+        return target
+    # Bulk imports land in batch directories below the workspace path, so fall back to the file name
+    return next((l for l in remote_paths if Path(l).name == Path(artifact).name), None)
+
+def _match_artifacts(local_md5s, remote_md5s, workspace_path=None):
+    """Pairs local artifacts with pipeline libraries by workspace path first, then by content"""
+    unmatched_remote = dict(remote_md5s)
+    keeps, uploads, renames, unmatched_local = [], [], [], []
+    for artifact, md5_hash in local_md5s.items():
+        target = _find_remote_artifact(artifact, unmatched_remote, workspace_path)
+        if target:
+            if unmatched_remote.pop(target) == md5_hash:
+                keeps.append(target)
+            else:
+                uploads.append(artifact)
+        else:
+            unmatched_local.append(artifact)
+
+    # Anything left that matches a remote library by content was moved or renamed locally
+    for artifact in unmatched_local:
+        renamed_from = next((l for l, md5_hash in unmatched_remote.items() if md5_hash == local_md5s[artifact]), None)
+        if renamed_from:
+            unmatched_remote.pop(renamed_from)
+            keeps.append(renamed_from)
+            renames.append({"from": renamed_from, "to": artifact})
+        else:
+            uploads.append(artifact)
+
+    artifacts_by_md5 = {}
+    for artifact, md5_hash in local_md5s.items():
+        artifacts_by_md5.setdefault(md5_hash, []).append(artifact)
+    duplicates = [a for a in artifacts_by_md5.values() if len(a) > 1]
+    return keeps, uploads, list(unmatched_remote), renames, duplicates
+
+def get_artifact_diffs(api_client, settings, artifacts, max_workers=DEFAULT_MAX_WORKERS, hash_cache=None, workspace_path=None):
     # This is a new pipeline, no need to look for diffs
     if not settings.id:
         return artifacts
@@ -242,64 +344,306 @@ def get_artifact_diffs(api_client, settings, artifacts):
         )
 
     libs = PipelinesApi(api_client).get_pipeline_libraries(settings.id)
-    remote_md5s = []
-    local_md5s = []
-    remote_md5_lookup = {}
-    local_md5_lookup = {}
-    for l in libs:
-        content = WorkspaceApi(api_client).get_workspace_file_b64(l)
-        decoded = base64.b64decode(content).decode("utf-8")
-        first_nl = decoded.find('\n') + 1
-        clean_str = decoded[first_nl:len(decoded)]
-        clean_str = "".join([s for s in clean_str.splitlines(True) if s.strip("\r\n")])
-        md5_hash = hashlib.md5(clean_str.encode('utf-8')).hexdigest()
-        remote_md5s.append(md5_hash)
-        remote_md5_lookup[md5_hash] = l
-    for a in artifacts:
-        with open(a) as f:
-            content = f.read()
-            content = "".join([s for s in content.splitlines(True) if s.strip("\r\n")])
-            md5_hash = hashlib.md5(content.encode('utf-8')).hexdigest()
-            local_md5s.append(md5_hash)
-            local_md5_lookup[md5_hash] = a
-   
-    keeps = set(remote_md5s).intersection(set(local_md5s))
-    diffs = set(local_md5s) - set(remote_md5s)
-    deletes = set(remote_md5s) - set(local_md5s)
-    artifacts_to_keep = []
-    artifacts_to_upload = []
-    artifacts_to_delete = []
+    workspace_api = WorkspaceApi(api_client)
+    manifest_md5s = get_manifest_md5s(workspace_api, libs)
+    unlisted_libs = [l for l in libs if l not in manifest_md5s]
+    if unlisted_libs:
+        event_print(
+            type="cli_status",
+            level="INFO",
+            msg=f"{len(unlisted_libs)} remote artifact(s) not in an artifact manifest. Exporting them to compare."
+        )
+    remote_md5s = {}
+    local_md5s = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        remote_md5_futures = {l: executor.submit(_get_remote_artifact_md5, workspace_api, l) for l in unlisted_libs}
+        # Hash local artifacts while the remote exports are in flight
+        for a in artifacts:
+            local_md5s[a] = hash_cache.get_md5(a) if hash_cache else get_local_artifact_md5(a)
+        for l in libs:
+            remote_md5s[l] = manifest_md5s[l] if l in manifest_md5s else remote_md5_futures[l].result()
+    if hash_cache:
+        hash_cache.save()
+
+    artifacts_to_keep, artifacts_to_upload, artifacts_to_delete, renames, duplicates = _match_artifacts(
+        local_md5s, remote_md5s, workspace_path)
 
-    for checksum in deletes:
+    for artifact in artifacts_to_delete:
         event_print(
         type="cli_status",
         level="INFO",
-        msg=f"Remote {remote_md5_lookup[checksum]} will be de-referenced by pipeline or replaced by updated changes."
+        msg=f"Remote {artifact} will be de-referenced by pipeline or replaced by updated changes."
         )
-        artifacts_to_delete.append(remote_md5_lookup[checksum])
 
-    for checksum in keeps:
+    for artifact in artifacts_to_keep:
         event_print(
         type="cli_status",
         level="INFO",
-        msg=f"Keeping: {remote_md5_lookup[checksum]}"
+        msg=f"Keeping: {artifact}"
+        )
+
+    for rename in renames:
+        event_print(
+        type="cli_status",
+        level="INFO",
+        msg=f"Detected rename of {rename['from']} to {rename['to']}. Reusing the remote copy instead of uploading."
+        )
+
+    for duplicate in duplicates:
+        event_print(
+        type="cli_status",
+        level="WARNING",
+        msg=f"Identical content in: {', '.join(duplicate)}"
         )
-        artifacts_to_keep.append(remote_md5_lookup[checksum])
 
-    for checksum in diffs:
+    for artifact in artifacts_to_upload:
         event_print(
         type="cli_status",
         level="INFO",
-        msg=f"Found diffs in: {local_md5_lookup[checksum]}"
+        msg=f"Found diffs in: {artifact}"
         )
-        artifacts_to_upload.append(local_md5_lookup[checksum])
     
-    if len(diffs) == 0:
+    if len(artifacts_to_upload) == 0:
         event_print(
         type="cli_status",
         level="INFO",
         msg=f"No local artifact diffs found. Nothing new to upload."
         )
 
-    ret = {"keep": artifacts_to_keep, "upload": artifacts_to_upload, "delete": artifacts_to_delete}
-    return ret
\ No newline at end of file
+    ret = {"keep": artifacts_to_keep, "upload": artifacts_to_upload, "delete": artifacts_to_delete,
+           "rename": renames, "duplicate": duplicates}
+    return ret
+
+def get_git_artifact_diffs(api_client, settings, artifacts, workspace_path, files_dir=None):
+    """Builds artifact diffs from git changes since the last recorded deploy.
+
+    Returns None when there is no recorded commit or git can't answer, so callers can fall
+    back to get_artifact_diffs.
+    """
+    if not settings.id:
+        return None
+    files_dir = files_dir if files_dir else os.getcwd()
+    deployment = WorkspaceApi(api_client).get_deployment(workspace_path, settings.id)
+    since_sha = deployment.get("git_sha") if deployment else None
+    if not since_sha:
+        event_print(
+            type="cli_status",
+            level="INFO",
+            msg="No deployed commit recorded for this pipeline. Falling back to content hashing."
+        )
+        return None
+    try:
+        changed_files = get_changed_files(since_sha, files_dir)
+    except GitError as e:
+        event_print(
+            type="cli_status",
+            level="WARNING",
+            msg=f"{e}. Falling back to content hashing."
+        )
+        return None
+
+    event_print(
+            type="cli_status",
+            level="INFO",
+            msg=f"Checking for artifact diffs since commit {since_sha}"
+        )
+    libs = PipelinesApi(api_client).get_pipeline_libraries(settings.id)
+    artifacts_to_keep = []
+    artifacts_to_upload = []
+    unmatched_libs = list(libs)
+    for artifact in artifacts:
+        target = _find_remote_artifact(artifact, unmatched_libs, workspace_path)
+        if target:
+            unmatched_libs.remove(target)
+        if target and Path(artifact).resolve().as_posix() not in changed_files:
+            artifacts_to_keep.append(target)
+        else:
+            event_print(
+            type="cli_status",
+            level="INFO",
+            msg=f"Found diffs in: {artifact}"
+            )
+            artifacts_to_upload.append(artifact)
+    artifacts_to_delete = unmatched_libs
+    for artifact in artifacts_to_delete:
+        event_print(
+        type="cli_status",
+        level="INFO",
+        msg=f"Remote {artifact} will be de-referenced by pipeline or replaced by updated changes."
+        )
+    if len(artifacts_to_upload) == 0:
+        event_print(
+        type="cli_status",
+        level="INFO",
+        msg=f"No local artifact diffs found. Nothing new to upload."
+        )
+    return {"keep": artifacts_to_keep, "upload": artifacts_to_upload, "delete": artifacts_to_delete,
+            "rename": [], "duplicate": []}
+
+def get_artifact_stats(artifacts):
+    """Size and modification time of each artifact, a cheap way to tell whether any changed"""
+    stats = {}
+    for artifact in artifacts:
+        st = os.stat(artifact)
+        stats[artifact] = [st.st_size, st.st_mtime_ns]
+    return stats
+
+def upload_journaled_artifacts(workspace_api, journal, artifacts, workspace_path, hash_cache, **upload_args):
+    """Uploads artifacts, skipping those the journal shows were already uploaded with the same content"""
+    uploaded = {}
+    for artifact in artifacts:
+        workspace_artifact = journal.get_upload(artifact, hash_cache.get_md5(artifact))
+        if workspace_artifact:
+            uploaded[artifact] = workspace_artifact
+    if uploaded:
+        event_print(
+            type="cli_status",
+            level="INFO",
+            msg=f"Skipping {len(uploaded)} artifact(s) uploaded before the interruption."
+        )
+    remaining = [a for a in artifacts if a not in uploaded]
+    if remaining:
+        try:
+            paths = workspace_api.upload_pipeline_artifacts(
+                remaining, workspace_path, hash_cache=hash_cache,
+                on_uploaded=lambda a, p: journal.record_upload(a, p, hash_cache.get_md5(a)), **upload_args)
+        finally:
+            # Keep what did upload even if others failed
+            journal.flush()
+        uploaded.update(zip(remaining, paths))
+    return [uploaded[a] for a in artifacts]
+
+def is_pipeline_edit_applied(api_client, settings):
+    """Whether the pipeline's live spec has the settings and libraries of a deploy"""
+    remote_settings = PipelineSettings().from_dict(PipelinesApi(api_client).get_pipeline_settings(settings.id))
+    remote_libraries = remote_settings.to_json().get("libraries", [])
+    return (_core_settings_json(remote_settings) == _core_settings_json(settings)
+            and sorted(remote_libraries, key=json.dumps) == sorted(settings.to_json()["libraries"], key=json.dumps))
+
+def get_started_update_id(response):
+    """The update ID from a start_update response, if it has one"""
+    return response.get("update_id") if isinstance(response, dict) else None
+
+def get_rollback_candidates(entries):
+    """The deploys a rollback can go back through, oldest first, with the live one last.
+
+    A rollback is recorded as an entry with rolled_back set to how many deploys it went back.
+    Those deploys are dropped, so a second rollback keeps going back instead of forward.
+    """
+    deploys = []
+    for entry in entries:
+        rolled_back = entry.get("rolled_back")
+        if rolled_back:
+            # The history is capped, a rollback can reach further back than what is kept
+            del deploys[max(len(deploys) - rolled_back, 1):]
+        else:
+            deploys.append(entry)
+    return deploys
+
+def get_deployment_history_entry(workspace_api, settings, git_sha=None):
+    """Settings and library hashes of a deploy, enough to restore it later with a single edit"""
+    libraries = settings.pipeline_files if settings.pipeline_files else []
+    md5s = get_manifest_md5s(workspace_api, libraries)
+    return {
+        "deployed_at": datetime.datetime.utcnow().isoformat()[:-3]+'Z',
+        "git_sha": git_sha,
+        "settings": settings.to_json(omit_id=True),
+        "libraries": {l: md5s.get(l) for l in libraries}
+    }
+
+def get_unretained_libraries(workspace_api, libraries):
+    """Libraries of a history entry whose deployed content has since been overwritten or removed.
+
+    Libraries deployed without a recorded hash can't be verified, so they don't count as retained either.
+    """
+    # Object paths only count as retained while the store manifest still lists them
+    current_md5s = get_manifest_md5s(workspace_api, list(libraries), include_object_paths=False)
+    return [l for l, md5_hash in libraries.items() if not md5_hash or current_md5s.get(l) != md5_hash]
+
+def record_deployment(workspace_api, settings, workspace_path, files_dir=None, state_dir=None):
+    """Records the deployed commit and rollback history next to the artifacts, and locally if state_dir is set"""
+    files_dir = files_dir if files_dir else os.getcwd()
+    try:
+        # A dirty tree is recorded without a commit so the next --since-ref run hashes instead
+        git_sha = get_head_sha(files_dir) if is_clean(files_dir) else None
+    except GitError:
+        # Not a git checkout
+        git_sha = None
+    try:
+        entry = get_deployment_history_entry(workspace_api, settings, git_sha)
+        if state_dir:
+            DeploymentHistory(state_dir).append(settings.id, entry)
+        workspace_api.record_deployment(workspace_path, settings.id, git_sha, history_entry=entry)
+    except Exception as e:
+        event_print(
+            type="cli_status",
+            level="WARNING",
+            msg=f"Unable to record deployment: {e}"
+        )
+
+def get_referenced_libraries(api_client, workspace_api, workspace_path, grace_days, max_workers=DEFAULT_MAX_WORKERS):
+    """Workspace paths used by any pipeline, or by a deploy in the rollback history newer than grace_days"""
+    pipelines_api = PipelinesApi(api_client)
+    pipeline_ids = [p["pipeline_id"] for p in pipelines_api.iter_pipelines()]
+    referenced = set()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for pipeline in executor.map(pipelines_api.get_snapshot, pipeline_ids):
+            for library in pipeline.get("spec", {}).get("libraries", []):
+                for library_type in ("notebook", "file"):
+                    if library_type in library:
+                        referenced.add(library[library_type]["path"])
+
+    cutoff = (datetime.datetime.utcnow() - datetime.timedelta(days=grace_days)).isoformat()[:-3]+'Z'
+    manifest = workspace_api.get_artifact_manifest(workspace_path)
+    history = manifest.get("history") if manifest else None
+    for entries in (history if isinstance(history, dict) else {}).values():
+        for entry in entries:
+            if entry.get("deployed_at", "") >= cutoff:
+                referenced.update(entry.get("libraries", {}))
+    return referenced
+
+def get_orphaned_artifacts(workspace_api, workspace_path, referenced, min_age_minutes=GC_MIN_ARTIFACT_AGE_MINUTES,
+                           max_workers=DEFAULT_MAX_WORKERS):
+    """Finds artifacts under workspace_path that dltctl uploaded and nothing references.
+
+    Only paths listed in dltctl's own manifests are candidates, so anything else under
+    workspace_path is left alone. So are artifacts uploaded in the last min_age_minutes, which a
+    deploy in progress may not have pointed its pipeline at yet. A directory is returned for a
+    single recursive delete only when every object in it is an orphan or a manifest. Returns the
+    directories, the remaining artifacts and every orphaned artifact path, including those inside
+    the directories.
+    """
+    walked = list(workspace_api.walk(workspace_path))
+    manifest_dirs = [d for d, _, objects in walked if any(obj.basename == ARTIFACT_MANIFEST_NAME for obj in objects)]
+    managed = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for manifest in executor.map(workspace_api.get_artifact_manifest, manifest_dirs):
+            managed.update(manifest["artifacts"] if manifest else {})
+    cutoff = (datetime.datetime.utcnow() - datetime.timedelta(minutes=min_age_minutes)).isoformat()[:-3]+'Z'
+
+    def is_orphan(path):
+        entry = managed.get(path)
+        return (isinstance(entry, dict) and path not in referenced
+                and entry.get("uploaded_at", "") < cutoff)
+
+    orphans_by_dir = {}
+    has_kept = {}
+    has_orphans = {}
+    # Children are listed after their parents, so walk backwards to settle them first
+    for current_dir, subdirs, objects in reversed(walked):
+        artifacts = [obj for obj in objects if obj.basename != ARTIFACT_MANIFEST_NAME]
+        orphans_by_dir[current_dir] = [obj.path for obj in artifacts if is_orphan(obj.path)]
+        has_kept[current_dir] = (len(orphans_by_dir[current_dir]) < len(artifacts)
+                                 or any(has_kept[d] for d in subdirs))
+        has_orphans[current_dir] = bool(orphans_by_dir[current_dir]) or any(has_orphans[d] for d in subdirs)
+
+    orphaned_dirs, orphaned_notebooks, orphaned_artifacts = [], [], []
+    for current_dir, subdirs, objects in walked:
+        orphaned_artifacts.extend(orphans_by_dir[current_dir])
+        if any(current_dir.startswith(d + "/") for d in orphaned_dirs):
+            continue
+        if current_dir != workspace_path and has_orphans[current_dir] and not has_kept[current_dir]:
+            orphaned_dirs.append(current_dir)
+        else:
+            orphaned_notebooks.extend(orphans_by_dir[current_dir])
+    return orphaned_dirs, orphaned_notebooks, orphaned_artifacts
@@ -1,6 +1,22 @@
-import json
+from collections import OrderedDict
+import datetime, json
+
+EVENT_CURSOR_LOOKBACK_SECONDS = 2
+EVENT_CURSOR_MAX_SEEN = 10000
+
+# Marks details or error that are in the raw event but haven't been parsed yet
+_UNPARSED = object()
 
 class PipelineEvent:
+    """A pipeline event that keeps the JSON it was parsed from.
+
+    Only the top-level fields are kept after parsing. details and error, which hold most of an
+    event, are parsed again from the raw JSON the first time they are read, so events that are
+    only printed, stored or deduplicated never keep those trees around. Consumers that read them
+    for every event, like exports, pass keep_details to skip that second parse.
+    """
+    __slots__ = ("id", "sequence", "origin", "timestamp", "message", "level", "event_type", "raw", "_details", "_error")
+
     def __init__(self):
         self.id = None
         self.sequence = None
@@ -8,21 +24,60 @@ class PipelineEvent:
         self.timestamp = None
         self.message = None
         self.level = None
-        self.details = None
         self.event_type = None
+        # The event exactly as the API returned it, for the local event store
+        self.raw = None
+        self._details = None
+        self._error = None
     
-    def from_json(self, event):
+    def from_json(self, event, keep_details=False):
         json_event = json.loads(event)
-        self.id = json_event["id"] if "id" in json_event else None
-        self.origin = json_event["origin"] if "origin" in json_event else None
-        self.sequence = json_event["sequence"] if "sequence" in json_event else None
-        self.timestamp = json_event["timestamp"] if "timestamp" in json_event else None
-        self.message = json_event["message"] if "message" in json_event else None
-        self.level = json_event["level"] if "level" in json_event else None
-        self.error = json_event["error"] if "error" in json_event else None
-        self.details = json_event["details"] if "details" in json_event else None
-        self.event_type = json_event["event_type"] if "event_type" in json_event else None
+        self.raw = event
+        self.id = json_event.get("id")
+        self.origin = json_event.get("origin")
+        self.sequence = json_event.get("sequence")
+        self.timestamp = json_event.get("timestamp")
+        self.message = json_event.get("message")
+        self.level = json_event.get("level")
+        self.event_type = json_event.get("event_type")
+        if keep_details:
+            self._details = json_event.get("details")
+            self._error = json_event.get("error")
+        else:
+            self._details = _UNPARSED if json_event.get("details") is not None else None
+            self._error = _UNPARSED if json_event.get("error") is not None else None
         return self
+
+    def _parse_lazy_fields(self):
+        json_event = json.loads(self.raw)
+        if self._details is _UNPARSED:
+            self._details = json_event.get("details")
+        if self._error is _UNPARSED:
+            self._error = json_event.get("error")
+
+    @property
+    def details(self):
+        if self._details is _UNPARSED:
+            self._parse_lazy_fields()
+        return self._details
+
+    @details.setter
+    def details(self, details):
+        self._details = details
+
+    @property
+    def error(self):
+        if self._error is _UNPARSED:
+            self._parse_lazy_fields()
+        return self._error
+
+    @error.setter
+    def error(self, error):
+        self._error = error
+
+    def has_error(self):
+        """Whether the event carries an error, without parsing it"""
+        return self._error is not None
     
 class PipelineEventsResponse:
     def __init__(self):
@@ -37,14 +92,63 @@ class PipelineEventsResponse:
       self.previous_page_token = json_response["prev_page_token"] if "prev_page_token" in json_response else None
       return self
     
-    def to_pipeline_events(self):
+    def to_pipeline_events(self, keep_details=False):
         if self.events is None:
             return
         else:
             pipeline_events = []
             for event in self.events:
-                e = PipelineEvent().from_json(event)
+                e = PipelineEvent().from_json(event, keep_details)
                 pipeline_events.append(e)
             self.pipeline_events = pipeline_events
             return pipeline_events
 
+def _shift_timestamp(timestamp, seconds):
+    shifted = datetime.datetime.fromisoformat(timestamp.replace("Z", "+00:00")) + datetime.timedelta(seconds=seconds)
+    return shifted.replace(tzinfo=None).isoformat(timespec="milliseconds") + "Z"
+
+class EventCursor:
+    """Position in a pipeline's event feed that doesn't lose events.
+
+    Polls ask for events at or after the last seen timestamp minus a short lookback, so events
+    sharing a millisecond with the last one, or written slightly out of order, are fetched
+    again instead of skipped. Events already seen are recognised by id and sequence in a
+    bounded LRU set, which keeps memory flat on day-long tails.
+    """
+    def __init__(self, timestamp=None, lookback_seconds=EVENT_CURSOR_LOOKBACK_SECONDS, max_seen=EVENT_CURSOR_MAX_SEEN):
+        self.start = timestamp
+        self.timestamp = timestamp
+        self.lookback_seconds = lookback_seconds
+        self.max_seen = max_seen
+        self.seen = OrderedDict()
+
+    def get_filter_timestamp(self):
+        """Lower bound, inclusive, for the next fetch"""
+        if not self.timestamp:
+            return None
+        try:
+            lower_bound = _shift_timestamp(self.timestamp, -self.lookback_seconds)
+        except ValueError:
+            return self.timestamp
+        # Never reach back before where the caller asked to start
+        return max(lower_bound, self.start) if self.start else lower_bound
+
+    def _key(self, event):
+        sequence = json.dumps(event.sequence, sort_keys=True) if event.sequence else None
+        return (event.id, sequence)
+
+    def advance(self, events):
+        """Returns the events that weren't seen before and moves the cursor past them"""
+        new_events = []
+        for event in events:
+            key = self._key(event)
+            if key in self.seen:
+                self.seen.move_to_end(key)
+                continue
+            self.seen[key] = True
+            if len(self.seen) > self.max_seen:
+                self.seen.popitem(last=False)
+            new_events.append(event)
+            if event.timestamp and (not self.timestamp or event.timestamp > self.timestamp):
+                self.timestamp = event.timestamp
+        return new_events
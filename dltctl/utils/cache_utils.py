@@ -0,0 +1,112 @@
+import json, os, threading, time
+from pathlib import Path
+from dltctl.utils.hash_utils import HASH_VERSION, get_local_artifact_md5
+
+DLTCTL_HOME_DIR = Path(Path.home(), ".dltctl").as_posix()
+PIPELINE_ID_CACHE_FILE = "pipeline_ids.json"
+PIPELINE_ID_CACHE_TTL = 24 * 60 * 60
+ARTIFACT_HASH_CACHE_FILE = "hashcache"
+# Files modified this recently may still change within the same mtime tick, so they aren't cached
+RACY_MTIME_WINDOW_NS = 2 * 10**9
+
+def read_json_file(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def write_json_file(path, content):
+    """Writes to a temp file and swaps it in so concurrent readers never see a partial file"""
+    os.makedirs(Path(path).parent.as_posix(), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(content, f)
+    os.replace(tmp_path, path)
+
+class PipelineIdCache:
+    """On-disk cache of pipeline name to pipeline ID lookups, scoped to a profile and host"""
+    def __init__(self, profile=None, host=None, ttl=PIPELINE_ID_CACHE_TTL, cache_dir=None):
+        self.scope = f"{profile if profile else 'DEFAULT'}@{host}"
+        self.ttl = ttl
+        self.cache_path = Path(cache_dir if cache_dir else DLTCTL_HOME_DIR, PIPELINE_ID_CACHE_FILE).as_posix()
+
+    def _load_scope(self):
+        entries = read_json_file(self.cache_path)
+        return entries, entries.get(self.scope, {})
+
+    def get(self, pipeline_name):
+        entries, scoped = self._load_scope()
+        entry = scoped.get(pipeline_name)
+        if not entry:
+            return None
+        if time.time() - entry.get("cached_at", 0) > self.ttl:
+            return None
+        return entry.get("pipeline_id")
+
+    def put(self, pipeline_name, pipeline_id):
+        if not pipeline_name or not pipeline_id:
+            return
+        entries, scoped = self._load_scope()
+        scoped[pipeline_name] = {"pipeline_id": pipeline_id, "cached_at": time.time()}
+        entries[self.scope] = scoped
+        try:
+            write_json_file(self.cache_path, entries)
+        except OSError:
+            # The cache is an optimization only, never fail a command on it
+            pass
+
+    def evict(self, pipeline_name=None, pipeline_id=None):
+        entries, scoped = self._load_scope()
+        evicted = {name: entry for name, entry in scoped.items()
+                   if name == pipeline_name or entry.get("pipeline_id") == pipeline_id}
+        if not evicted:
+            return
+        for name in evicted:
+            scoped.pop(name)
+        entries[self.scope] = scoped
+        try:
+            write_json_file(self.cache_path, entries)
+        except OSError:
+            pass
+
+class ArtifactHashCache:
+    """Normalized local artifact hashes, only recomputed when a file's size, mtime or inode changes"""
+    def __init__(self, state_dir):
+        self.cache_path = Path(state_dir, ARTIFACT_HASH_CACHE_FILE).as_posix()
+        self.entries = None
+        self.dirty = False
+        self.lock = threading.Lock()
+
+    def _load(self):
+        if self.entries is None:
+            cache = read_json_file(self.cache_path)
+            self.entries = cache.get("entries", {}) if cache.get("version") == HASH_VERSION else {}
+        return self.entries
+
+    def get_md5(self, path):
+        st = os.stat(path)
+        key = Path(path).resolve().as_posix()
+        stat_key = [st.st_size, st.st_mtime_ns, st.st_ino]
+        with self.lock:
+            entry = self._load().get(key)
+        if entry and entry["stat"] == stat_key:
+            return entry["md5"]
+
+        md5_hash = get_local_artifact_md5(path)
+        if time.time_ns() - st.st_mtime_ns > RACY_MTIME_WINDOW_NS:
+            with self.lock:
+                self.entries[key] = {"stat": stat_key, "md5": md5_hash}
+                self.dirty = True
+        return md5_hash
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            entries = {k: v for k, v in self.entries.items() if os.path.exists(k)}
+            try:
+                write_json_file(self.cache_path, {"version": HASH_VERSION, "entries": entries})
+                self.dirty = False
+            except OSError:
+                pass
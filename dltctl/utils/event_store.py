@@ -0,0 +1,136 @@
+import datetime, json, sqlite3, threading
+from pathlib import Path
+from dltctl.types.events import PipelineEvent
+from dltctl.utils.cache_utils import DLTCTL_HOME_DIR
+
+EVENT_STORE_FILE = "events.db"
+EVENT_STORE_RETENTION_DAYS = 30
+# Bumped whenever the table changes. Older tables are dropped, the store is only a local copy.
+_SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    scope TEXT NOT NULL,
+    pipeline_id TEXT NOT NULL,
+    pipeline_name TEXT,
+    update_id TEXT,
+    id TEXT NOT NULL,
+    sequence TEXT NOT NULL,
+    timestamp TEXT,
+    level TEXT,
+    event_type TEXT,
+    event_json TEXT NOT NULL,
+    stored_at TEXT NOT NULL,
+    PRIMARY KEY (scope, pipeline_id, id, sequence)
+);
+CREATE INDEX IF NOT EXISTS events_pipeline_timestamp ON events (scope, pipeline_id, timestamp);
+CREATE INDEX IF NOT EXISTS events_pipeline_name_timestamp ON events (scope, pipeline_name, timestamp);
+CREATE INDEX IF NOT EXISTS events_update_timestamp ON events (update_id, timestamp);
+CREATE INDEX IF NOT EXISTS events_level ON events (level);
+CREATE INDEX IF NOT EXISTS events_event_type ON events (event_type);
+CREATE INDEX IF NOT EXISTS events_stored_at ON events (stored_at);
+"""
+
+def _utcnow():
+    return datetime.datetime.utcnow().isoformat(timespec="milliseconds") + "Z"
+
+def _row(event, scope, pipeline_id, stored_at):
+    origin = event.origin or {}
+    sequence = json.dumps(event.sequence, sort_keys=True) if event.sequence else ""
+    return (scope, origin.get("pipeline_id", pipeline_id), origin.get("pipeline_name"), origin.get("update_id"),
+            event.id or "", sequence, event.timestamp, event.level, event.event_type, event.raw, stored_at)
+
+class EventStore:
+    """Local SQLite copy of every pipeline event dltctl fetched, so past updates can be queried offline.
+
+    Events are keyed by scope, pipeline, id and sequence, so fetching the same event again is a no-op.
+    The scope is the profile and host the events came from, so same-named pipelines of different
+    workspaces never mix. Events stored more than retention_days ago are pruned.
+    """
+    def __init__(self, path=None, scope="", retention_days=EVENT_STORE_RETENTION_DAYS):
+        self.path = path if path else Path(DLTCTL_HOME_DIR, EVENT_STORE_FILE).as_posix()
+        self.scope = scope
+        self.retention_days = retention_days
+        self.pruned = False
+        self.conn = None
+        # Tails fetch from worker threads, which share one connection
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        if self.conn is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            self.conn = sqlite3.connect(self.path, check_same_thread=False)
+            if self.conn.execute("PRAGMA user_version").fetchone()[0] != _SCHEMA_VERSION:
+                self.conn.executescript(f"DROP TABLE IF EXISTS events; PRAGMA user_version = {_SCHEMA_VERSION};")
+            self.conn.executescript(_SCHEMA)
+        return self.conn
+
+    def _prune(self, conn):
+        """Deletes events stored longer ago than the retention, once per store"""
+        if self.pruned or not self.retention_days:
+            return
+        cutoff = (datetime.datetime.utcnow() - datetime.timedelta(days=self.retention_days)).isoformat(timespec="milliseconds") + "Z"
+        conn.execute("DELETE FROM events WHERE stored_at < ?", (cutoff,))
+        self.pruned = True
+
+    def add(self, events, pipeline_id=None):
+        stored_at = _utcnow()
+        rows = [_row(event, self.scope, pipeline_id, stored_at) for event in events if event.raw]
+        if not rows:
+            return
+        try:
+            with self.lock:
+                conn = self._connect()
+                with conn:
+                    self._prune(conn)
+                    conn.executemany("INSERT OR IGNORE INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        except (sqlite3.Error, OSError):
+            # The store is a local convenience only, never fail a command on it
+            pass
+
+    def query(self, pipeline=None, update_id=None, since=None, until=None, levels=None, event_types=None, limit=None):
+        """Yields stored events of the scope in timestamp order. pipeline matches either a pipeline ID or name."""
+        clauses, params = ["scope = ?"], [self.scope]
+        if pipeline:
+            clauses.append("(pipeline_id = ? OR pipeline_name = ?)")
+            params += [pipeline, pipeline]
+        if update_id:
+            clauses.append("update_id = ?")
+            params.append(update_id)
+        if since:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        if until:
+            clauses.append("timestamp < ?")
+            params.append(until)
+        for column, values in (("level", levels), ("event_type", event_types)):
+            if values:
+                clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+                params += list(values)
+        sql = "SELECT event_json FROM events WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY timestamp, rowid"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        if not Path(self.path).exists():
+            return
+        with self.lock:
+            rows = self._connect().execute(sql, params).fetchall()
+        for (event_json,) in rows:
+            yield PipelineEvent().from_json(event_json)
+
+    def get_last_update_id(self, pipeline):
+        """The update of the pipeline with the most recent stored event"""
+        if not Path(self.path).exists():
+            return None
+        with self.lock:
+            row = self._connect().execute(
+                "SELECT update_id FROM events WHERE scope = ? AND (pipeline_id = ? OR pipeline_name = ?) "
+                "AND update_id IS NOT NULL ORDER BY timestamp DESC LIMIT 1", (self.scope, pipeline, pipeline)).fetchone()
+        return row[0] if row else None
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
@@ -0,0 +1,106 @@
+import json, sys
+
+EXPORT_FORMATS = ["ndjson", "parquet"]
+PARQUET_ROW_GROUP_SIZE = 10000
+
+# Column name, path into the event and type. details and error are also kept whole as JSON.
+EXPORT_COLUMNS = [
+    ("id", ("id",), "string"),
+    ("timestamp", ("timestamp",), "string"),
+    ("level", ("level",), "string"),
+    ("event_type", ("event_type",), "string"),
+    ("message", ("message",), "string"),
+    ("pipeline_id", ("origin", "pipeline_id"), "string"),
+    ("pipeline_name", ("origin", "pipeline_name"), "string"),
+    ("update_id", ("origin", "update_id"), "string"),
+    ("cluster_id", ("origin", "cluster_id"), "string"),
+    ("flow_name", ("origin", "flow_name"), "string"),
+    ("update_progress_state", ("details", "update_progress", "state"), "string"),
+    ("flow_progress_status", ("details", "flow_progress", "status"), "string"),
+    ("flow_progress_metrics_num_output_rows", ("details", "flow_progress", "metrics", "num_output_rows"), "int64"),
+    ("flow_progress_metrics_backlog_bytes", ("details", "flow_progress", "metrics", "backlog_bytes"), "int64"),
+    ("flow_progress_data_quality_dropped_records", ("details", "flow_progress", "data_quality", "dropped_records"), "int64"),
+    ("cluster_resources_num_executors", ("details", "cluster_resources", "num_executors"), "int64"),
+    ("cluster_resources_num_task_slots", ("details", "cluster_resources", "num_task_slots"), "int64"),
+    ("cluster_resources_avg_num_queued_tasks", ("details", "cluster_resources", "avg_num_queued_tasks"), "double"),
+    ("cluster_resources_avg_task_slot_utilization", ("details", "cluster_resources", "avg_task_slot_utilization"), "double"),
+    ("cluster_resources_latest_requested_num_executors", ("details", "cluster_resources", "latest_requested_num_executors"), "int64"),
+    ("error", ("error",), "json"),
+    ("details", ("details",), "json"),
+]
+
+_CASTS = {"int64": int, "double": float}
+
+def _get_path(event, path):
+    value = getattr(event, path[0], None)
+    for key in path[1:]:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+def flatten_event(event):
+    """One export row of an event, with the columns of EXPORT_COLUMNS"""
+    row = {}
+    for name, path, column_type in EXPORT_COLUMNS:
+        value = _get_path(event, path)
+        if value is not None:
+            if column_type == "json":
+                value = json.dumps(value)
+            elif column_type in _CASTS:
+                try:
+                    value = _CASTS[column_type](value)
+                except (TypeError, ValueError):
+                    value = None
+        row[name] = value
+    return row
+
+class NdjsonEventWriter:
+    """Writes one flattened event per line. '-' writes to stdout."""
+    def __init__(self, path):
+        self.file = sys.stdout if path == "-" else open(path, "w")
+
+    def write(self, events):
+        for event in events:
+            self.file.write(json.dumps(flatten_event(event)) + "\n")
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+class ParquetEventWriter:
+    """Writes flattened events to a parquet file, one row group per PARQUET_ROW_GROUP_SIZE events"""
+    def __init__(self, path, row_group_size=PARQUET_ROW_GROUP_SIZE):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Exporting to parquet requires pyarrow. Install it with: pip install 'dltctl[parquet]'")
+        if path == "-":
+            raise ValueError("Parquet exports need an output file")
+        self.pa = pa
+        types = {"string": pa.string(), "json": pa.string(), "int64": pa.int64(), "double": pa.float64()}
+        self.schema = pa.schema([(name, types[column_type]) for name, _, column_type in EXPORT_COLUMNS])
+        self.writer = pq.ParquetWriter(path, self.schema)
+        self.row_group_size = row_group_size
+        self.rows = []
+
+    def _flush(self):
+        if self.rows:
+            self.writer.write_table(self.pa.Table.from_pylist(self.rows, schema=self.schema))
+            self.rows = []
+
+    def write(self, events):
+        for event in events:
+            self.rows.append(flatten_event(event))
+            if len(self.rows) >= self.row_group_size:
+                self._flush()
+
+    def close(self):
+        self._flush()
+        self.writer.close()
+
+def get_event_writer(format, path):
+    if format == "parquet":
+        return ParquetEventWriter(path)
+    return NdjsonEventWriter(path)
@@ -0,0 +1,43 @@
+import subprocess
+from pathlib import Path
+
+class GitError(Exception):
+    pass
+
+def _git(args, cwd):
+    try:
+        result = subprocess.run(["git"] + args, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    except (OSError, subprocess.CalledProcessError) as e:
+        stderr = e.stderr.decode("utf-8", "replace").strip() if getattr(e, "stderr", None) else str(e)
+        raise GitError(f"git {' '.join(args)} failed: {stderr}")
+    return result.stdout.decode("utf-8")
+
+def _split_z(output):
+    return [entry for entry in output.split("\0") if entry]
+
+def get_repo_root(cwd):
+    return Path(_git(["rev-parse", "--show-toplevel"], cwd).strip()).resolve()
+
+def get_head_sha(cwd):
+    return _git(["rev-parse", "HEAD"], cwd).strip()
+
+def is_clean(cwd):
+    """Whether tracked and untracked files under cwd match HEAD"""
+    return _git(["status", "--porcelain", "--untracked-files=all", "--", "."], cwd).strip() == ""
+
+def get_changed_files(since_sha, cwd):
+    """Absolute paths of files that differ between since_sha and the working tree, including untracked files"""
+    root = get_repo_root(cwd)
+    entries = _split_z(_git(["diff", "--name-status", "-z", since_sha, "--", "."], cwd))
+    changed = set()
+    i = 0
+    while i < len(entries):
+        status = entries[i]
+        # Renames and copies list both the old and the new path
+        path_count = 2 if status[0] in ("R", "C") else 1
+        for path in entries[i + 1:i + 1 + path_count]:
+            changed.add(Path(root, path).as_posix())
+        i += 1 + path_count
+    for path in _split_z(_git(["ls-files", "--others", "--exclude-standard", "--full-name", "-z", "--", "."], cwd)):
+        changed.add(Path(root, path).as_posix())
+    return changed
@@ -0,0 +1,65 @@
+import base64, codecs, hashlib, io, mmap, os
+
+# Bump whenever the normalization rules change so persisted hashes are recomputed
+HASH_VERSION = 2
+CHUNK_SIZE = 1024 * 1024
+# Base64 decodes in groups of 4 characters, so remote chunks must stay aligned to that
+B64_CHUNK_SIZE = 4 * 256 * 1024
+
+def _is_complete_line(line):
+    return len(line.splitlines()[0]) < len(line)
+
+class ArtifactHasher:
+    """Incrementally normalizes artifact content and hashes it in bounded memory.
+
+    Content is decoded as UTF-8 with universal newlines and blank lines are dropped, so
+    formatting-only changes don't count as diffs. Local files and exported notebooks both
+    go through this class, which keeps the two sides of a diff hashed with the same rules.
+    """
+    def __init__(self, skip_header=False):
+        self.md5 = hashlib.md5()
+        self.decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder("utf-8")(), translate=True)
+        self.skip_header = skip_header
+        self.pending = ""
+
+    def update(self, data, final=False):
+        text = self.pending + self.decoder.decode(data, final=final)
+        self.pending = ""
+        if self.skip_header:
+            first_nl = text.find('\n')
+            if first_nl < 0 and not final:
+                self.pending = text
+                return
+            # Drop the notebook header line the workspace adds on import
+            text = text[first_nl + 1:]
+            self.skip_header = False
+
+        lines = text.splitlines(True)
+        # The last line may continue in the next chunk
+        if lines and not final and not _is_complete_line(lines[-1]):
+            self.pending = lines.pop()
+        for line in lines:
+            if line.strip("\r\n"):
+                self.md5.update(line.encode('utf-8'))
+
+    def hexdigest(self):
+        self.update(b"", final=True)
+        return self.md5.hexdigest()
+
+def get_local_artifact_md5(path):
+    hasher = ArtifactHasher()
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        # Empty files can't be memory mapped
+        if size > 0:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                for offset in range(0, size, CHUNK_SIZE):
+                    hasher.update(mapped[offset:offset + CHUNK_SIZE])
+    return hasher.hexdigest()
+
+def get_notebook_source_md5(content_b64):
+    """Hashes an exported SOURCE notebook the same way as the local file it was imported from"""
+    hasher = ArtifactHasher(skip_header=True)
+    for offset in range(0, len(content_b64), B64_CHUNK_SIZE):
+        hasher.update(base64.b64decode(content_b64[offset:offset + B64_CHUNK_SIZE]))
+    return hasher.hexdigest()
@@ -0,0 +1,30 @@
+import random, time
+
+DEFAULT_MIN_POLL_INTERVAL = 1
+DEFAULT_MAX_POLL_INTERVAL = 30
+POLL_BACKOFF_FACTOR = 2
+
+class AdaptivePoller:
+    """Spaces out polls of a feed based on whether the last poll found anything.
+
+    Activity drops the interval back to min_interval. Every idle poll doubles it up to
+    max_interval, with jitter so many concurrent tails don't poll in lockstep.
+    """
+    def __init__(self, min_interval=DEFAULT_MIN_POLL_INTERVAL, max_interval=DEFAULT_MAX_POLL_INTERVAL,
+                 backoff_factor=POLL_BACKOFF_FACTOR):
+        if min_interval <= 0 or max_interval < min_interval:
+            raise ValueError(f"Invalid polling intervals: min {min_interval}, max {max_interval}")
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff_factor = backoff_factor
+        self.interval = min_interval
+
+    def next_interval(self, active):
+        if active:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * self.backoff_factor, self.max_interval)
+        return random.uniform(max(self.min_interval, self.interval / 2), self.interval)
+
+    def wait(self, active):
+        time.sleep(self.next_interval(active))
@@ -0,0 +1,101 @@
+from pathlib import Path
+from dltctl.utils.cache_utils import read_json_file, write_json_file
+import datetime, os, time
+
+DEPLOYMENT_HISTORY_FILE = "history.json"
+DEPLOYMENT_HISTORY_SIZE = 10
+DEPLOY_JOURNAL_FILE = "journal.json"
+# Uploads are written to the journal at most this often, so large deploys don't rewrite it per artifact
+DEPLOY_JOURNAL_FLUSH_SECONDS = 2
+
+class DeploymentHistory:
+    """Local record of the settings and library hashes of the last deploys of each pipeline"""
+    def __init__(self, state_dir, size=DEPLOYMENT_HISTORY_SIZE):
+        self.history_path = Path(state_dir, DEPLOYMENT_HISTORY_FILE).as_posix()
+        self.size = size
+
+    def get(self, pipeline_id):
+        return read_json_file(self.history_path).get(str(pipeline_id), [])
+
+    def append(self, pipeline_id, entry):
+        history = read_json_file(self.history_path)
+        entries = history.get(str(pipeline_id), []) + [entry]
+        history[str(pipeline_id)] = entries[-self.size:]
+        try:
+            write_json_file(self.history_path, history)
+        except OSError:
+            # The remote copy in the artifact manifest is still there to roll back from
+            pass
+
+class DeployJournal:
+    """Write-ahead log of the phases of a deploy, so an interrupted deploy can resume where it stopped.
+
+    Every phase is written to disk as soon as it completes. Uploads are batched and written at
+    most every flush_seconds, or on flush(); an upload lost from the journal is just redone.
+    The journal is cleared once the deploy finishes, so one left behind always belongs to a
+    deploy that didn't.
+    """
+    def __init__(self, state_dir, flush_seconds=DEPLOY_JOURNAL_FLUSH_SECONDS):
+        self.journal_path = Path(state_dir, DEPLOY_JOURNAL_FILE).as_posix()
+        self.entries = {}
+        self.flush_seconds = flush_seconds
+        self.unsaved_uploads = 0
+        self.saved_at = 0
+
+    def resume(self, pipeline_name, workspace_path):
+        """Loads the journal of an unfinished deploy of the same pipeline and workspace path, or starts a new one"""
+        entries = read_json_file(self.journal_path)
+        if entries.get("pipeline_name") == pipeline_name and entries.get("workspace_path") == workspace_path:
+            self.entries = entries
+            return True
+        self.start(pipeline_name, workspace_path)
+        return False
+
+    def start(self, pipeline_name, workspace_path):
+        self.entries = {
+            "pipeline_name": pipeline_name,
+            "workspace_path": workspace_path,
+            "started_at": datetime.datetime.utcnow().isoformat()[:-3]+'Z',
+            "uploads": {}
+        }
+        self._save()
+
+    def get(self, phase):
+        return self.entries.get(phase)
+
+    def record(self, phase, value):
+        self.entries[phase] = value
+        self._save()
+
+    def get_upload(self, artifact, md5_hash):
+        """Workspace path an artifact was uploaded to, if it was uploaded with the same content"""
+        entry = self.entries.get("uploads", {}).get(Path(artifact).resolve().as_posix())
+        return entry["path"] if entry and entry["hash"] == md5_hash else None
+
+    def record_upload(self, artifact, workspace_path, md5_hash):
+        self.entries.setdefault("uploads", {})[Path(artifact).resolve().as_posix()] = {"path": workspace_path, "hash": md5_hash}
+        self.unsaved_uploads += 1
+        if time.monotonic() - self.saved_at >= self.flush_seconds:
+            self._save()
+
+    def flush(self):
+        """Writes uploads recorded since the last save"""
+        if self.unsaved_uploads:
+            self._save()
+
+    def clear(self):
+        self.entries = {}
+        self.unsaved_uploads = 0
+        try:
+            os.remove(self.journal_path)
+        except OSError:
+            pass
+
+    def _save(self):
+        self.unsaved_uploads = 0
+        self.saved_at = time.monotonic()
+        try:
+            write_json_file(self.journal_path, self.entries)
+        except OSError:
+            # Without a journal a rerun just starts from scratch
+            pass
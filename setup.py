@@ -30,6 +30,9 @@ setup(
         'colorama>=0.4.5',
         'PyYAML==6.0',
     ],
+    extras_require={
+        'parquet': ['pyarrow>=8.0.0'],
+    },
     entry_points='''
         [console_scripts]
         dltctl=dltctl.cli:cli
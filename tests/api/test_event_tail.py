@@ -0,0 +1,83 @@
+import json
+from unittest import mock
+from dltctl.api.pipelines import PipelinesApi
+from dltctl.api.event_tail import MultiPipelineTailer
+
+def _event(id, timestamp, message):
+    return json.dumps({"id": id, "sequence": {"data_plane_id": {"seq_no": 1}}, "origin": {"pipeline_id": "p"},
+                       "timestamp": timestamp, "message": message, "level": "INFO", "event_type": "update_progress",
+                       "details": {}})
+
+def test_tailer_merges_pipelines_in_timestamp_order(capsys):
+    client_mock = mock.MagicMock()
+    responses = {
+        "/pipelines/a/events": iter([{"events_json": [_event("a1", "2022-01-01T00:00:01.000Z", "a first"),
+                                                      _event("a2", "2022-01-01T00:00:04.000Z", "a second")]}, {}]),
+        "/pipelines/b/events": iter([{"events_json": [_event("b1", "2022-01-01T00:00:02.000Z", "b first"),
+                                                      _event("b2", "2022-01-01T00:00:03.000Z", "b second")]}, {}])}
+    client_mock.perform_query.side_effect = lambda method, path, **kwargs: next(responses[path])
+    tailer = MultiPipelineTailer(PipelinesApi(client_mock), {"a": "alpha", "b": "beta"}, ts="2022-01-01T00:00:00.000Z",
+                                 min_polling_interval=0.1, max_polling_interval=0.1, max_polls_without_events=1)
+    tailer.run()
+    out, err = capsys.readouterr()
+    lines = out.splitlines()
+    assert [l.split(" ", 1)[1] for l in lines] == [
+        "[alpha] 2022-01-01T00:00:01.000Z update_progress a first",
+        "[beta] 2022-01-01T00:00:02.000Z update_progress b first",
+        "[beta] 2022-01-01T00:00:03.000Z update_progress b second",
+        "[alpha] 2022-01-01T00:00:04.000Z update_progress a second"]
+    assert client_mock.perform_query.call_count == 4
+
+def test_tailer_keeps_going_when_one_pipeline_fails(capsys):
+    client_mock = mock.MagicMock()
+    responses = {
+        "/pipelines/a/events": iter([{"events_json": [_event("a1", "2022-01-01T00:00:01.000Z", "a first")]}, {}])}
+
+    def perform_query(method, path, **kwargs):
+        if path not in responses:
+            raise Exception("pipeline not found")
+        return next(responses[path])
+    client_mock.perform_query.side_effect = perform_query
+    tailer = MultiPipelineTailer(PipelinesApi(client_mock), {"a": "alpha", "gone": "gone"}, ts="2022-01-01T00:00:00.000Z",
+                                 min_polling_interval=0.1, max_polling_interval=0.1, max_polls_without_events=2)
+    tailer.run()
+    out, err = capsys.readouterr()
+    assert "[gone] Failed to fetch events: pipeline not found" in out
+    assert "a first" in out
+
+def _serve(responses):
+    """perform_query that serves each path's responses in turn, raising those that are exceptions"""
+    def perform_query(method, path, **kwargs):
+        response = next(responses[path], {})
+        if isinstance(response, Exception):
+            raise response
+        return response
+    return perform_query
+
+def test_tailer_refetches_events_of_a_poll_that_failed_partway(capsys):
+    client_mock = mock.MagicMock()
+    events = [_event(f"e{i}", f"2022-01-01T00:00:0{i}.000Z", f"event {i}") for i in range(3)]
+    responses = {"/pipelines/a/events": iter([
+        {"events_json": events[:2], "next_page_token": "page0"}, Exception("503 Service Unavailable"),
+        {"events_json": events}])}
+    client_mock.perform_query.side_effect = _serve(responses)
+    tailer = MultiPipelineTailer(PipelinesApi(client_mock), {"a": "alpha"}, ts="2022-01-01T00:00:00.000Z",
+                                 min_polling_interval=0.1, max_polling_interval=0.1, max_polls_without_events=2)
+    tailer.run()
+    out, err = capsys.readouterr()
+    assert "Failed to fetch events: 503 Service Unavailable" in out
+    assert [f"event {i}" in out for i in range(3)] == [True] * 3
+
+def test_tailer_failed_poll_holds_back_merged_output(capsys):
+    client_mock = mock.MagicMock()
+    responses = {
+        "/pipelines/a/events": iter([Exception("503 Service Unavailable"),
+                                     {"events_json": [_event("a1", "2022-01-01T00:00:03.000Z", "a first")]}]),
+        "/pipelines/b/events": iter([{"events_json": [_event("b1", "2022-01-01T00:00:05.000Z", "b first")]}])}
+    client_mock.perform_query.side_effect = _serve(responses)
+    tailer = MultiPipelineTailer(PipelinesApi(client_mock), {"a": "alpha", "b": "beta"}, ts="2022-01-01T00:00:00.000Z",
+                                 min_polling_interval=0.1, max_polling_interval=0.1, max_polls_without_events=2)
+    tailer.run()
+    out, err = capsys.readouterr()
+    # alpha's failed poll doesn't let beta's later event print ahead of alpha's earlier one
+    assert out.index("a first") < out.index("b first")
@@ -1,7 +1,8 @@
 from unittest import mock
-import pytest, json
-from dltctl.api.pipelines import PipelinesApi, PipelineNameNotUniqueError
+import pytest, json, re, time
+from dltctl.api.pipelines import PipelinesApi, PipelineNameNotUniqueError, split_time_range, BACKFILL_QUEUE_PAGES, PIPELINE_SNAPSHOT_TTL
 from dltctl.types.pipelines import PipelineSettings
+from dltctl.utils.cache_utils import PipelineIdCache
 
 _EVENT_DICT = {
     "id": "15e29b10-48bb-11ed-b1cf-9649472ee14a",
@@ -167,7 +168,7 @@ _EVENT_JSON = """{
 }"""
 
 _WAITING_EVENT_JSON = """{
-    "id": "15e29b10-48bb-11ed-b1cf-9649472ee14a",
+    "id": "35e29b10-48bb-11ed-b1cf-9649472ee14a",
     "sequence": {
         "control_plane_seq_no": 1234567789
     },
@@ -248,7 +249,7 @@ _WAITING_EVENT_JSON = """{
     "maturity_level": "STABLE"
 }"""
 _FAILURE_EVENT_JSON = """{
-    "id": "15e29b10-48bb-11ed-b1cf-9649472ee14a",
+    "id": "25e29b10-48bb-11ed-b1cf-9649472ee14a",
     "error": {"exceptions": "some failure exception"},
     "sequence": {
         "control_plane_seq_no": 1234567789
@@ -542,3 +543,339 @@ def test_stream_events_resource_waiting(capsys):
 
 
 
+
+def test_get_pipeline_by_name_caches_id(pipelines_api_list_mock, tmp_path):
+    cache = PipelineIdCache(profile="test", host="https://foo.com/api/", cache_dir=tmp_path)
+    pipelines_api_list_mock.id_cache = cache
+    returned_pipeline = pipelines_api_list_mock.get_pipeline_id_by_name("foo")
+    assert returned_pipeline == 1
+    assert cache.get("foo") == 1
+
+def test_get_pipeline_by_name_cache_hit(tmp_path):
+    cache = PipelineIdCache(profile="test", host="https://foo.com/api/", cache_dir=tmp_path)
+    cache.put("mycoolpipeline", "1337")
+    client_mock = mock.MagicMock()
+    client_mock.perform_query.return_value = {"pipeline_id": "1337", "name": "mycoolpipeline", "spec": {"name": "mycoolpipeline"}}
+    p = PipelinesApi(client_mock, id_cache=cache)
+    assert p.get_pipeline_id_by_name("mycoolpipeline") == "1337"
+    client_mock.perform_query.assert_called_once_with("GET", "/pipelines/1337", data={}, headers=None)
+
+def test_get_pipeline_by_name_stale_cache(tmp_path):
+    cache = PipelineIdCache(profile="test", host="https://foo.com/api/", cache_dir=tmp_path)
+    cache.put("foo", "deleted-id")
+    client_mock = mock.MagicMock()
+    client_mock.perform_query.side_effect = [Exception("RESOURCE_DOES_NOT_EXIST"),
+        {"statuses":[{"pipeline_id": 1, "name": "foo"}, {"pipeline_id": 2, "name": "bar"}]}]
+    p = PipelinesApi(client_mock, id_cache=cache)
+    assert p.get_pipeline_id_by_name("foo") == 1
+    assert cache.get("foo") == 1
+
+def test_pipeline_id_cache_ttl_and_scope(tmp_path):
+    cache = PipelineIdCache(profile="test", host="https://foo.com/api/", ttl=0, cache_dir=tmp_path)
+    other_cache = PipelineIdCache(profile="other", host="https://foo.com/api/", cache_dir=tmp_path)
+    cache.put("foo", "1")
+    assert other_cache.get("foo") is None
+    with mock.patch('dltctl.utils.cache_utils.time.time') as time_mock:
+        time_mock.return_value = 10**10
+        assert cache.get("foo") is None
+
+def test_create_and_delete_update_cache(tmp_path):
+    cache = PipelineIdCache(profile="test", host="https://foo.com/api/", cache_dir=tmp_path)
+    client_mock = mock.MagicMock()
+    client_mock.perform_query.return_value = {"pipeline_id": "1337"}
+    p = PipelinesApi(client_mock, id_cache=cache)
+    p.create({"name": "mycoolpipeline"})
+    assert cache.get("mycoolpipeline") == "1337"
+    p.delete("1337")
+    assert cache.get("mycoolpipeline") is None
+
+def test_iter_pipelines_follows_page_tokens_lazily():
+    client_mock = mock.MagicMock()
+    client_mock.perform_query.side_effect = [
+        {"statuses": [{"pipeline_id": 1, "name": "foo"}], "next_page_token": "abc"},
+        {"statuses": [{"pipeline_id": 2, "name": "foo_bar"}]}]
+    p = PipelinesApi(client_mock)
+    pipelines = p.iter_pipelines(filter="name LIKE 'foo%'", page_size=1)
+    assert next(pipelines)["pipeline_id"] == 1
+    assert client_mock.perform_query.call_count == 1
+    assert next(pipelines)["pipeline_id"] == 2
+    client_mock.perform_query.assert_any_call("GET", "/pipelines", data={"filter": "name LIKE 'foo%'", "max_results": 1}, headers=None)
+    client_mock.perform_query.assert_called_with("GET", "/pipelines", data={"page_token": "abc", "max_results": 1}, headers=None)
+
+def test_get_pipeline_by_name_sends_filter_and_stops_at_duplicate():
+    client_mock = mock.MagicMock()
+    client_mock.perform_query.side_effect = [
+        {"statuses": [{"pipeline_id": 1, "name": "foo"}, {"pipeline_id": 2, "name": "foo"}], "next_page_token": "abc"}]
+    p = PipelinesApi(client_mock)
+    with pytest.raises(PipelineNameNotUniqueError):
+        p.get_pipeline_id_by_name("foo")
+    client_mock.perform_query.assert_called_once_with("GET", "/pipelines", data={"filter": "name LIKE 'foo'"}, headers=None)
+
+def test_pipeline_accessors_share_snapshot(pipelines_api_get_mock):
+    client_mock = pipelines_api_get_mock.client.client.perform_query
+    pipelines_api_get_mock.get_pipeline_libraries("1337")
+    pipelines_api_get_mock.get_pipeline_settings("1337")
+    PipelinesApi(pipelines_api_get_mock.client.client).get_pipeline_state("1337")
+    assert client_mock.call_count == 1
+
+def test_pipeline_writes_invalidate_snapshot(pipelines_api_get_mock):
+    client_mock = pipelines_api_get_mock.client.client.perform_query
+    pipelines_api_get_mock.get_pipeline_state("1337")
+    pipelines_api_get_mock.edit("1337", PipelineSettings())
+    pipelines_api_get_mock.get_pipeline_state("1337")
+    pipelines_api_get_mock.start_update("1337")
+    pipelines_api_get_mock.get_pipeline_state("1337")
+    assert client_mock.call_count == 5
+
+def test_pipeline_snapshot_expires(pipelines_api_get_mock):
+    client_mock = pipelines_api_get_mock.client.client.perform_query
+    with mock.patch('dltctl.api.pipelines.time.monotonic') as monotonic_mock:
+        monotonic_mock.return_value = 100
+        pipelines_api_get_mock.get_pipeline_state("1337")
+        pipelines_api_get_mock.get_pipeline_state("1337")
+        assert client_mock.call_count == 1
+        monotonic_mock.return_value = 100 + PIPELINE_SNAPSHOT_TTL + 1
+        pipelines_api_get_mock.get_pipeline_state("1337")
+    assert client_mock.call_count == 2
+
+def test_last_update_is_never_cached(pipelines_api_get_mock):
+    client_mock = pipelines_api_get_mock.client.client.perform_query
+    pipelines_api_get_mock.get_pipeline_state("1337")
+    assert pipelines_api_get_mock.get_last_update_id("1337") == 1
+    assert client_mock.call_count == 2
+
+def test_stream_events_drains_all_pages(capsys):
+    client_mock = mock.MagicMock()
+    event = json.loads(_EVENT_JSON)
+    pages = [{"events_json": [json.dumps(dict(event, id=f"{i}", message=f"event {i}")) for i in range(n, n + 2)], "next_page_token": f"page{n}"}
+             for n in (0, 2)]
+    client_mock.perform_query.side_effect = pages + [{"events_json": [_FAILURE_EVENT_JSON]}]
+    p = PipelinesApi(client_mock)
+    with mock.patch('dltctl.api.pipelines.time.sleep') as sleep_mock:
+        p.stream_events(12345, ts="2022-01-01T00:00:00.000Z", page_size=2)
+    out, err = capsys.readouterr()
+    # Every page is fetched within the first poll, which doesn't wait
+    sleep_mock.assert_not_called()
+    assert [f"event {i}" in out for i in range(4)] == [True] * 4
+    assert "across 3 pages" in out
+    calls = client_mock.perform_query.call_args_list
+    assert calls[0][1]["data"] == {"max_results": 2, "order_by": "timestamp asc", "filter": "timestamp >= '2022-01-01T00:00:00.000Z'"}
+    assert calls[1][1]["data"] == {"max_results": 2, "page_token": "page0"}
+    assert calls[2][1]["data"] == {"max_results": 2, "page_token": "page2"}
+
+def test_stream_events_keeps_events_sharing_a_timestamp(capsys):
+    client_mock = mock.MagicMock()
+    event = json.loads(_EVENT_JSON)
+    first = dict(event, id="a", message="first", timestamp="2022-01-01T00:00:01.000Z")
+    second = dict(event, id="b", message="second", timestamp="2022-01-01T00:00:01.000Z")
+    client_mock.perform_query.side_effect = [
+        {"events_json": [json.dumps(first)]},
+        # The next poll sees the first event again next to one written in the same millisecond
+        {"events_json": [json.dumps(first), json.dumps(second)]},
+        {"events_json": [json.dumps(first), json.dumps(second)]},
+        {}]
+    p = PipelinesApi(client_mock)
+    with mock.patch('dltctl.api.pipelines.time.sleep'):
+        p.stream_events(12345, ts="2022-01-01T00:00:00.000Z", max_polls_without_events=2)
+    out, err = capsys.readouterr()
+    assert out.count("first") == 1
+    assert out.count("second") == 1
+    assert client_mock.perform_query.call_args_list[1][1]["data"]["filter"] == "timestamp >= '2022-01-01T00:00:00.000Z'"
+    # Later polls reach back a little from the last event, but not before the start
+    assert client_mock.perform_query.call_args_list[3][1]["data"]["filter"] == "timestamp >= '2022-01-01T00:00:00.000Z'"
+
+def test_stream_events_polls_adaptively(capsys):
+    client_mock = mock.MagicMock()
+    event = json.loads(_EVENT_JSON)
+    client_mock.perform_query.side_effect = [{}, {}, {"events_json": [json.dumps(dict(event, id="a"))]}, {}, {}]
+    p = PipelinesApi(client_mock)
+    with mock.patch('dltctl.api.pipelines.time.sleep'):
+        with mock.patch('dltctl.utils.poll_utils.time.sleep') as sleep_mock:
+            with mock.patch('dltctl.utils.poll_utils.random.uniform', side_effect=lambda low, high: high):
+                p.stream_events(12345, ts="2022-01-01T00:00:00.000Z", max_polls_without_events=2,
+                                min_polling_interval=1, max_polling_interval=3)
+    # Backs off while idle, drops to the minimum after events arrive, and never exceeds the maximum
+    assert [c[0][0] for c in sleep_mock.call_args_list] == [2, 3, 1, 2]
+
+def test_stream_events_stops_on_terminal_update_state(capsys):
+    client_mock = mock.MagicMock()
+    event = json.loads(_EVENT_JSON)
+    responses = {
+        "/pipelines/12345/updates/u1": iter([{"update": {"state": "RUNNING"}}, {"update": {"state": "RUNNING"}},
+                                             {"update": {"state": "COMPLETED"}}]),
+        "/pipelines/12345/events": iter([{"events_json": [json.dumps(dict(event, id="a", message="waiting"))]}, {},
+                                         {"events_json": [json.dumps(dict(event, id="b", message="last one"))]}])}
+    client_mock.perform_query.side_effect = lambda method, path, **kwargs: next(responses[path])
+    p = PipelinesApi(client_mock)
+    with mock.patch('dltctl.utils.poll_utils.time.sleep'):
+        p.stream_events(12345, ts="2022-01-01T00:00:00.000Z", update_id="u1")
+    out, err = capsys.readouterr()
+    # Events fetched alongside the terminal state are still printed
+    assert "last one" in out
+    assert "Pipeline execution is complete" in out
+    assert client_mock.perform_query.call_count == 6
+
+def test_stream_events_reports_failed_update(capsys):
+    client_mock = mock.MagicMock()
+    responses = {
+        "/pipelines/12345/updates/u1": iter([{"update": {"state": "RUNNING"}}, {"update": {"state": "FAILED"}}]),
+        # Without an update_id the error event would end the stream on the first poll
+        "/pipelines/12345/events": iter([{"events_json": [_FAILURE_EVENT_JSON]}, {}])}
+    client_mock.perform_query.side_effect = lambda method, path, **kwargs: next(responses[path])
+    p = PipelinesApi(client_mock)
+    with mock.patch('dltctl.utils.poll_utils.time.sleep'):
+        p.stream_events(12345, ts="2022-01-01T00:00:00.000Z", update_id="u1")
+    out, err = capsys.readouterr()
+    assert out.count("Pipeline execution has FAILED") == 1
+    assert client_mock.perform_query.call_count == 4
+
+def test_iter_event_pages_stores_fetched_events():
+    client_mock = mock.MagicMock()
+    client_mock.perform_query.return_value = {"events_json": [_EVENT_JSON]}
+    store_mock = mock.MagicMock()
+    p = PipelinesApi(client_mock, event_store=store_mock)
+    pages = list(p.iter_event_pages("12345"))
+    store_mock.add.assert_called_once_with(pages[0], "12345")
+
+def test_iter_event_pages_follows_token_after_short_page():
+    client_mock = mock.MagicMock()
+    event = json.loads(_EVENT_JSON)
+    # The API may return fewer events than asked for while more remain
+    client_mock.perform_query.side_effect = [
+        {"events_json": [json.dumps(dict(event, id=f"{i}")) for i in range(2)], "next_page_token": "page0"},
+        {"events_json": [json.dumps(dict(event, id=f"{i}")) for i in range(2, 5)], "next_page_token": "page1"},
+        {"events_json": []}]
+    p = PipelinesApi(client_mock)
+    pages = list(p.iter_event_pages("12345", page_size=3))
+    assert [e.id for page in pages for e in page] == ["0", "1", "2", "3", "4"]
+    assert client_mock.perform_query.call_count == 3
+
+def test_get_events_until_filter():
+    client_mock = mock.MagicMock()
+    p = PipelinesApi(client_mock)
+    p.get_events("12345", timestamp_filter="2022-01-01T00:00:00.000Z", inclusive=True, until="2022-01-02T00:00:00.000Z")
+    assert client_mock.perform_query.call_args[1]["data"]["filter"] == \
+        "timestamp >= '2022-01-01T00:00:00.000Z' AND timestamp < '2022-01-02T00:00:00.000Z'"
+
+def _fake_events_endpoint(events, inclusive_until=False, short_page_size=None):
+    """Serves events from a list, honouring timestamp filters and page tokens.
+
+    With short_page_size, pages hold at most that many events while still carrying a token.
+    """
+    def perform_query(method, path, data=None, **kwargs):
+        if "page_token" in data:
+            bounds, offset = data["page_token"]
+        else:
+            bounds = re.findall(r"timestamp ([<>]=?) '([^']+)'", data.get("filter", ""))
+            offset = 0
+        matching = [e for e in events if all(
+            (e["timestamp"] >= ts if op == ">=" else
+             (e["timestamp"] <= ts if inclusive_until else e["timestamp"] < ts) if op == "<" else True)
+            for op, ts in bounds)]
+        page_size = min(data["max_results"], short_page_size) if short_page_size else data["max_results"]
+        page = matching[offset:offset + page_size]
+        response = {"events_json": [json.dumps(e) for e in page]}
+        if offset + page_size < len(matching):
+            response["next_page_token"] = (bounds, offset + page_size)
+        return response
+    return perform_query
+
+def test_iter_backfill_pages_stitches_windows_in_order():
+    events = [{"id": str(i), "timestamp": f"2022-01-01T00:{i // 60:02d}:{i % 60:02d}.000Z", "message": f"event {i}"}
+              for i in range(0, 240, 3)]
+    client_mock = mock.MagicMock()
+    # Overlapping window edges return boundary events twice
+    client_mock.perform_query.side_effect = _fake_events_endpoint(events, inclusive_until=True)
+    p = PipelinesApi(client_mock)
+    pages = list(p.iter_backfill_pages("12345", since="2022-01-01T00:00:00.000Z", until="2022-01-01T00:04:00.000Z",
+                                       max_workers=3, page_size=5))
+    # Windows are streamed page by page, never held whole
+    assert max(len(page) for page in pages) <= 5
+    assert [e.id for page in pages for e in page] == [e["id"] for e in events]
+
+def test_iter_backfill_pages_follows_short_pages():
+    events = [{"id": str(i), "timestamp": f"2022-01-01T00:00:{i:02d}.000Z"} for i in range(40)]
+    client_mock = mock.MagicMock()
+    # Every window gets pages shorter than it asked for, which still carry a token
+    client_mock.perform_query.side_effect = _fake_events_endpoint(events, short_page_size=2)
+    p = PipelinesApi(client_mock)
+    pages = list(p.iter_backfill_pages("12345", since="2022-01-01T00:00:00.000Z", until="2022-01-01T00:00:40.000Z",
+                                       max_workers=2, page_size=5))
+    assert [e.id for page in pages for e in page] == [e["id"] for e in events]
+
+def test_iter_backfill_pages_bounds_pages_in_memory():
+    events = [{"id": str(i), "timestamp": f"2022-01-01T00:00:{i % 60:02d}.{i // 60:03d}Z"} for i in range(600)]
+    events.sort(key=lambda e: e["timestamp"])
+    client_mock = mock.MagicMock()
+    client_mock.perform_query.side_effect = _fake_events_endpoint(events)
+    p = PipelinesApi(client_mock)
+    pages = p.iter_backfill_pages("12345", since="2022-01-01T00:00:00.000Z", until="2022-01-01T00:01:00.000Z",
+                                  max_workers=2, page_size=5)
+    assert len(next(pages)) <= 5
+    time.sleep(0.5)
+    # Both windows in flight fetch at most a full queue and the page they are putting ahead of the consumer
+    assert client_mock.perform_query.call_count <= 2 * (BACKFILL_QUEUE_PAGES + 2)
+    pages.close()
+
+def test_iter_backfill_pages_starts_at_first_event():
+    events = [{"id": str(i), "timestamp": f"2022-01-01T00:00:{i:02d}.000Z"} for i in range(10)]
+    client_mock = mock.MagicMock()
+    client_mock.perform_query.side_effect = _fake_events_endpoint(events)
+    p = PipelinesApi(client_mock)
+    pages = list(p.iter_backfill_pages("12345", until="2022-01-01T00:00:10.000Z", max_workers=2))
+    assert [e.id for page in pages for e in page] == [e["id"] for e in events]
+    assert client_mock.perform_query.call_args_list[0][1]["data"] == {"max_results": 1, "order_by": "timestamp asc"}
+
+def test_split_time_range():
+    assert split_time_range("2022-01-01T00:00:00Z", "2022-01-01T00:00:03.000Z", 3) == [
+        ("2022-01-01T00:00:00.000Z", "2022-01-01T00:00:01.000Z"),
+        ("2022-01-01T00:00:01.000Z", "2022-01-01T00:00:02.000Z"),
+        ("2022-01-01T00:00:02.000Z", "2022-01-01T00:00:03.000Z")]
+    assert split_time_range("2022-01-01T00:00:00.000Z", "2022-01-01T00:00:00.002Z", 8) == [
+        ("2022-01-01T00:00:00.000Z", "2022-01-01T00:00:00.001Z"),
+        ("2022-01-01T00:00:00.001Z", "2022-01-01T00:00:00.002Z")]
+
+def test_iter_events_without_follow():
+    client_mock = mock.MagicMock()
+    event = json.loads(_EVENT_JSON)
+    client_mock.perform_query.side_effect = [
+        {"events_json": [json.dumps(dict(event, id=f"{i}")) for i in range(2)], "next_page_token": "page0"},
+        {"events_json": [json.dumps(dict(event, id="2"))]}]
+    p = PipelinesApi(client_mock)
+    with mock.patch('dltctl.utils.poll_utils.time.sleep') as sleep_mock:
+        events = p.iter_events(12345, since="2022-01-01T00:00:00.000Z", follow=False, page_size=2)
+        assert next(events).id == "0"
+        # The next page is only fetched once the consumer gets to it
+        assert client_mock.perform_query.call_count == 1
+        assert [e.id for e in events] == ["1", "2"]
+    sleep_mock.assert_not_called()
+    assert client_mock.perform_query.call_count == 2
+
+def test_iter_events_returns_terminal_update_state():
+    client_mock = mock.MagicMock()
+    responses = {
+        "/pipelines/12345/updates/u1": iter([{"update": {"state": "RUNNING"}}, {"update": {"state": "CANCELED"}}]),
+        "/pipelines/12345/events": iter([{"events_json": [_EVENT_JSON]}, {}])}
+    client_mock.perform_query.side_effect = lambda method, path, **kwargs: next(responses[path])
+    p = PipelinesApi(client_mock)
+    with mock.patch('dltctl.utils.poll_utils.time.sleep'):
+        events = p.iter_events(12345, since="2022-01-01T00:00:00.000Z", update_id="u1")
+        seen = []
+        with pytest.raises(StopIteration) as stop:
+            while True:
+                seen.append(next(events))
+    assert len(seen) == 1
+    assert stop.value.value == "CANCELED"
+
+def test_iter_events_reports_caught_up_when_closed_mid_batch():
+    client_mock = mock.MagicMock()
+    event = json.loads(_EVENT_JSON)
+    client_mock.perform_query.side_effect = [
+        {"events_json": [json.dumps(dict(event, id=f"{i}")) for i in range(2)], "next_page_token": "page0"},
+        {"events_json": [json.dumps(dict(event, id=f"{i}")) for i in range(2, 4)], "next_page_token": "page2"}]
+    caught_up = mock.MagicMock()
+    p = PipelinesApi(client_mock)
+    events = p.iter_events(12345, since="2022-01-01T00:00:00.000Z", page_size=2, on_caught_up=caught_up)
+    assert [next(events).id for _ in range(3)] == ["0", "1", "2"]
+    events.close()
+    assert caught_up.call_args[0][:2] == (3, 2)
@@ -1,6 +1,7 @@
 from json import JSONDecodeError
 from dltctl.api.workspace import WorkspaceApi
-import unittest, pytest, base64
+import unittest, pytest, base64, io, json, random, requests, tempfile, time, zipfile
+from dltctl.utils.hash_utils import get_local_artifact_md5
 from unittest import mock
 from pathlib import Path
 
@@ -52,3 +53,151 @@ class TestWorkspaceApi(unittest.TestCase):
 
 
 
+    def test_upload_artifacts_writes_manifest(self):
+          with tempfile.TemporaryDirectory() as tmpdirname:
+            artifact = Path(tmpdirname, "foo.py").as_posix()
+            with open(artifact, 'w') as f:
+                f.write("import dlt\n\n")
+            client_mock = mock.MagicMock()
+            client_mock.perform_query.side_effect = [{"object_type": "DIRECTORY", "path": "/Users/foo@foo.com"},
+              Exception("RESOURCE_DOES_NOT_EXIST"), ""]
+            with mock.patch('dltctl.api.workspace.WorkspaceApi.import_workspace') as import_mock:
+              WorkspaceApi(client_mock).upload_pipeline_artifacts([artifact], '/Users/foo@foo.com')
+            method, endpoint = client_mock.perform_query.call_args[0]
+            data = client_mock.perform_query.call_args[1]["data"]
+            manifest = json.loads(base64.b64decode(data["content"]))
+            self.assertEqual(endpoint, "/workspace/import")
+            self.assertEqual(data["path"], "/Users/foo@foo.com/_dltctl_manifest")
+            self.assertEqual(manifest["artifacts"]["/Users/foo@foo.com/foo.py"]["hash"], get_local_artifact_md5(artifact))
+
+    def test_get_artifact_manifest(self):
+          client_mock = mock.MagicMock()
+          manifest = {"version": 1, "artifacts": {"/foo/bar.py": {"hash": "abc"}}}
+          content = base64.b64encode(("# Databricks notebook source\n" + json.dumps(manifest)).encode("utf-8"))
+          client_mock.perform_query.side_effect = [{"content": content}, {"content": base64.b64encode(b"# Databricks notebook source\n{not json")}]
+          api = WorkspaceApi(client_mock)
+          self.assertEqual(api.get_artifact_manifest("/foo"), manifest)
+          self.assertIsNone(api.get_artifact_manifest("/foo"))
+
+    def test_upload_artifacts_retries_unavailable_imports(self):
+          client_mock = mock.MagicMock()
+          unavailable = mock.MagicMock(status_code=503, headers={"Retry-After": "7"})
+          with mock.patch('dltctl.api.workspace.WorkspaceApi.import_workspace') as import_mock:
+            with mock.patch('dltctl.api.workspace.time.sleep') as sleep_mock:
+              import_mock.side_effect = [requests.exceptions.HTTPError("unavailable", response=unavailable), ""]
+              a = WorkspaceApi(client_mock).upload_pipeline_artifacts(["foo.py"], '/Users/foo@foo.com', max_workers=1)
+          sleep_mock.assert_called_once_with(7.0)
+          self.assertEqual(import_mock.call_count, 2)
+          self.assertEqual(a, ['/Users/foo@foo.com/foo.py'])
+
+    def test_upload_artifacts_leaves_throttling_to_the_api_client(self):
+          client_mock = mock.MagicMock()
+          # A 429 that reaches us has already used up the ApiClient's own retries
+          throttled = mock.MagicMock(status_code=429, headers={"Retry-After": "7"})
+          with mock.patch('dltctl.api.workspace.WorkspaceApi.import_workspace') as import_mock:
+            with mock.patch('dltctl.api.workspace.time.sleep') as sleep_mock:
+              import_mock.side_effect = requests.exceptions.HTTPError("throttled", response=throttled)
+              with self.assertRaises(requests.exceptions.HTTPError):
+                  WorkspaceApi(client_mock).upload_pipeline_artifacts(["foo.py"], '/Users/foo@foo.com', max_workers=1)
+          sleep_mock.assert_not_called()
+          self.assertEqual(import_mock.call_count, 1)
+
+    def test_upload_artifacts_does_not_retry_client_errors(self):
+          client_mock = mock.MagicMock()
+          bad_request = mock.MagicMock(status_code=400, headers={})
+          with mock.patch('dltctl.api.workspace.WorkspaceApi.import_workspace') as import_mock:
+              import_mock.side_effect = requests.exceptions.HTTPError("bad request", response=bad_request)
+              with self.assertRaises(requests.exceptions.HTTPError):
+                  WorkspaceApi(client_mock).upload_pipeline_artifacts(["foo.py"], '/Users/foo@foo.com')
+          self.assertEqual(import_mock.call_count, 1)
+
+    def test_upload_artifacts_keeps_input_order(self):
+          client_mock = mock.MagicMock()
+          artifacts = [f"file_{i}.py" for i in range(20)]
+          with mock.patch('dltctl.api.workspace.WorkspaceApi.import_workspace') as import_mock:
+              import_mock.side_effect = lambda *args, **kwargs: time.sleep(random.random() / 100)
+              a = WorkspaceApi(client_mock).upload_pipeline_artifacts(artifacts, '/Users/foo@foo.com', max_workers=8)
+          self.assertEqual(a, [f"/Users/foo@foo.com/file_{i}.py" for i in range(20)])
+
+    def test_bulk_upload_artifacts_single_import(self):
+          with tempfile.TemporaryDirectory() as tmpdirname:
+            artifacts = []
+            for name, content in [("foo.py", "import dlt\n# COMMAND ----------\nx = 1\n"), ("bar.sql", "SELECT 1\n"), ("baz.txt", "notes\n")]:
+                artifacts.append(Path(tmpdirname, name).as_posix())
+                with open(artifacts[-1], 'w') as f:
+                    f.write(content)
+            client_mock = mock.MagicMock()
+            api = WorkspaceApi(client_mock)
+            api.update_artifact_manifest = mock.MagicMock()
+            with mock.patch('dltctl.api.workspace.WorkspaceApi.import_workspace') as import_mock:
+              with mock.patch('dltctl.api.workspace.WorkspaceApi.list_objects') as list_mock:
+                list_mock.side_effect = lambda path: [mock.MagicMock(path=f"{path}/{n}", basename=n, is_dir=False, is_notebook=True)
+                                                      for n in ["foo.py", "bar.sql"]]
+                a = api.upload_pipeline_artifacts(artifacts, '/Users/foo@foo.com', bulk=True)
+
+            imports = [c for c in client_mock.perform_query.call_args_list if c[0][1] == "/workspace/import"]
+            self.assertEqual(len(imports), 1)
+            data = imports[0][1]["data"]
+            self.assertEqual(data["format"], "DBC")
+            self.assertTrue(data["path"].startswith("/Users/foo@foo.com/.dltctl_bulk/"))
+            with zipfile.ZipFile(io.BytesIO(base64.b64decode(data["content"]))) as z:
+                self.assertEqual(sorted(z.namelist()), ["bar.sql.sql", "foo.py.python"])
+                notebook = json.loads(z.read("foo.py.python"))
+            self.assertEqual([c["command"] for c in notebook["commands"]], ["import dlt", "x = 1"])
+            # Files the archive can't carry still go through a per-file import
+            import_mock.assert_called_once()
+            self.assertEqual(a, [f"{data['path']}/foo.py", f"{data['path']}/bar.sql", "/Users/foo@foo.com/baz.txt"])
+
+    def test_bulk_upload_artifacts_falls_back_to_per_file(self):
+          with tempfile.TemporaryDirectory() as tmpdirname:
+            artifact = Path(tmpdirname, "foo.py").as_posix()
+            with open(artifact, 'w') as f:
+                f.write("import dlt\n")
+            client_mock = mock.MagicMock()
+            api = WorkspaceApi(client_mock)
+            api.update_artifact_manifest = mock.MagicMock()
+            with mock.patch('dltctl.api.workspace.WorkspaceApi.import_workspace') as import_mock:
+              with mock.patch('dltctl.api.workspace.WorkspaceApi.list_objects') as list_mock:
+                list_mock.return_value = []
+                a = api.upload_pipeline_artifacts([artifact], '/Users/foo@foo.com', bulk=True)
+            import_mock.assert_called_once()
+            self.assertEqual(a, ['/Users/foo@foo.com/foo.py'])
+
+    def test_content_addressed_upload_skips_stored_objects(self):
+          with tempfile.TemporaryDirectory() as tmpdirname:
+            artifacts = []
+            for name, content in [("shared.py", "import dlt\n"), ("new.py", "import foo\n")]:
+                artifacts.append(Path(tmpdirname, name).as_posix())
+                with open(artifacts[-1], 'w') as f:
+                    f.write(content)
+            shared_path = f"/ws/.dltctl/objects/{get_local_artifact_md5(artifacts[0])}/shared.py"
+            new_path = f"/ws/.dltctl/objects/{get_local_artifact_md5(artifacts[1])}/new.py"
+            api = WorkspaceApi(mock.MagicMock())
+            api.get_artifact_manifest = mock.MagicMock(return_value={"version": 1, "artifacts": {shared_path: {"hash": "x"}}})
+            api.put_artifact_manifest = mock.MagicMock()
+            with mock.patch('dltctl.api.workspace.WorkspaceApi.import_workspace') as import_mock:
+              with mock.patch('dltctl.api.workspace.WorkspaceApi.mkdirs') as mkdirs_mock:
+                a = api.upload_pipeline_artifacts(artifacts, '/ws', content_addressed=True)
+
+            self.assertEqual(a, [shared_path, new_path])
+            import_mock.assert_called_once()
+            self.assertEqual(import_mock.call_args[0][1], new_path)
+            mkdirs_mock.assert_called_once_with(str(Path(new_path).parent))
+            # Objects are indexed by the manifest at the store root
+            api.put_artifact_manifest.assert_called_once()
+            self.assertEqual(api.put_artifact_manifest.call_args[0][0], "/ws/.dltctl/objects")
+            self.assertIn(new_path, api.put_artifact_manifest.call_args[0][1]["artifacts"])
+
+    def test_remove_manifest_entries(self):
+          api = WorkspaceApi(mock.MagicMock())
+          object_path = f"/ws/.dltctl/objects/{'a' * 32}/foo.py"
+          manifests = {
+            "/ws": {"version": 1, "artifacts": {"/ws/old.py": {"hash": "x"}, "/ws/keep.py": {"hash": "y"}}},
+            "/ws/.dltctl/objects": {"version": 1, "artifacts": {object_path: {"hash": "a" * 32}}},
+            "/ws/.dltctl_bulk/1": None
+          }
+          api.get_artifact_manifest = mock.MagicMock(side_effect=lambda d: manifests[d])
+          api.put_artifact_manifest = mock.MagicMock()
+          api.remove_manifest_entries(["/ws/old.py", object_path, "/ws/.dltctl_bulk/1/a.py"])
+          self.assertEqual(sorted(c[0][0] for c in api.put_artifact_manifest.call_args_list), ["/ws", "/ws/.dltctl/objects"])
+          self.assertEqual(manifests["/ws"]["artifacts"], {"/ws/keep.py": {"hash": "y"}})
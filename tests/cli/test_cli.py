@@ -1,7 +1,7 @@
 from json import JSONDecodeError
 from unittest import mock
 import pytest
-import tempfile, os
+import json, tempfile, os
 from click import Context, Command
 from click.testing import CliRunner
 from pathlib import Path
@@ -9,6 +9,11 @@ from tests.utils import provide_conf
 import dltctl.cli as cli
 from dltctl.types.pipelines import PipelineSettings
 from dltctl.types.project import ProjectConfig
+from dltctl.utils.state_utils import DeployJournal
+from dltctl.utils.event_store import EventStore
+from dltctl.types.events import PipelineEvent
+from dltctl.core.helpers import get_artifact_stats
+from dltctl.utils.hash_utils import get_local_artifact_md5
 from _pytest.assertion import truncate
 truncate.DEFAULT_MAX_LINES = 9999
 truncate.DEFAULT_MAX_CHARS = 9999  
@@ -160,6 +165,13 @@ def helpers_pipelines_api_mock():
         HelpersPipelinesApiMock.return_value = _pipelines_api_mock
         yield _pipelines_api_mock
 
+@pytest.fixture(autouse=True)
+def project_state_dir(tmp_path):
+    # Keep hash caches and deploy history written by commands out of the working directory
+    with mock.patch('dltctl.core.commands.get_project_state_dir') as state_dir:
+        state_dir.return_value = tmp_path.as_posix()
+        yield state_dir
+
 @pytest.fixture()
 def click_ctx():
     """
@@ -217,6 +229,14 @@ def test_start_pipeline(valid_pipeline_settings, valid_project_settings, pipelin
     result = runner.invoke(cli.start)
     assert result.exit_code == 0
 
+def test_start_pipeline_follows_started_update(valid_pipeline_settings, valid_project_settings, pipelines_api_mock, settings_save_mock):
+    pipelines_api_mock.get_pipeline_settings.return_value = valid_pipeline_settings
+    pipelines_api_mock.start_update.return_value = {"update_id": "u1"}
+
+    result = CliRunner().invoke(cli.start)
+    assert result.exit_code == 0
+    assert pipelines_api_mock.stream_events.call_args[1]["update_id"] == "u1"
+
 def test_start_pipeline_as_job(valid_project_settings,valid_pipeline_settings, pipelines_api_mock, settings_save_mock, helpers_jobs_api_mock, helpers_pipelines_api_mock):
  
     path = str(Path(__file__).parent.parent.resolve()) + '/files/valid/'
@@ -462,8 +482,251 @@ def test_init_invalid_cluster_conf():
         
         assert "Invalid JSON string for cluster config" in result.stdout
         assert result.exit_code == 1
-    
-        
 
+def test_rollback_restores_previous_deploy(valid_project_settings, pipelines_api_mock, workspace_api_mock):
+    pipelines_api_mock.get_pipeline_id_by_name.return_value = "1234"
+    previous = {"deployed_at": "2024-01-01T00:00:00.000Z", "git_sha": "abc",
+                "settings": {"name": "foo", "libraries": [{"notebook": {"path": "/ws/foo.py"}}]},
+                "libraries": {"/ws/foo.py": "aaa"}}
+    current = dict(previous, deployed_at="2024-01-02T00:00:00.000Z", libraries={"/ws/foo.py": "bbb"})
+    workspace_api_mock.get_deployment_history.return_value = [previous, current]
+    with mock.patch('dltctl.core.commands.get_unretained_libraries') as unretained_mock:
+        unretained_mock.return_value = []
+        result = CliRunner().invoke(cli.rollback, args=["-w", "/ws"])
+    assert result.exit_code == 0
+    unretained_mock.assert_called_once_with(workspace_api_mock, {"/ws/foo.py": "aaa"})
+    pipelines_api_mock.edit.assert_called_once()
+    restored = pipelines_api_mock.edit.call_args[0][1]
+    assert restored.to_json()["libraries"] == [{"notebook": {"path": "/ws/foo.py"}}]
+    assert workspace_api_mock.record_deployment.call_args[0][2] == "abc"
+
+def test_rollback_twice_keeps_going_back(valid_project_settings, pipelines_api_mock, workspace_api_mock):
+    pipelines_api_mock.get_pipeline_id_by_name.return_value = "1234"
+    history = [{"deployed_at": f"2024-01-0{i}T00:00:00.000Z", "git_sha": sha, "settings": {"name": "foo"}, "libraries": {}}
+               for i, sha in enumerate(["a", "b", "c"], 1)]
+    workspace_api_mock.get_deployment_history.side_effect = lambda *args: list(history)
+    workspace_api_mock.record_deployment.side_effect = lambda *args, history_entry: history.append(history_entry)
+    with mock.patch('dltctl.core.commands.get_unretained_libraries') as unretained_mock:
+        unretained_mock.return_value = []
+        for _ in range(2):
+            result = CliRunner().invoke(cli.rollback, args=["-w", "/ws"])
+            assert result.exit_code == 0
+        # Only the first deploy is left to go back from
+        result = CliRunner().invoke(cli.rollback, args=["-w", "/ws"])
+    assert result.exit_code == 1
+    assert [c[0][2] for c in workspace_api_mock.record_deployment.call_args_list] == ["b", "a"]
+
+def test_rollback_stops_running_and_continuous_pipelines(valid_project_settings, pipelines_api_mock, workspace_api_mock):
+    pipelines_api_mock.get_pipeline_id_by_name.return_value = "1234"
+    pipelines_api_mock.get_pipeline_state.return_value = "RUNNING"
+    entry = {"deployed_at": "2024-01-01T00:00:00.000Z", "settings": {"name": "foo", "continuous": True}, "libraries": {}}
+    workspace_api_mock.get_deployment_history.return_value = [entry, entry]
+    with mock.patch('dltctl.core.commands.get_unretained_libraries') as unretained_mock:
+        with mock.patch('dltctl.core.commands.edit_and_stop_continuous') as edit_mock:
+            unretained_mock.return_value = []
+            result = CliRunner().invoke(cli.rollback, args=["-w", "/ws"])
+    assert result.exit_code == 0
+    pipelines_api_mock.stop.assert_called_once_with("1234")
+    pipelines_api_mock.edit.assert_not_called()
+    assert edit_mock.call_args[0][1].continuous
+
+def test_rollback_refuses_overwritten_libraries(valid_project_settings, pipelines_api_mock, workspace_api_mock):
+    pipelines_api_mock.get_pipeline_id_by_name.return_value = "1234"
+    entry = {"deployed_at": "2024-01-01T00:00:00.000Z", "settings": {}, "libraries": {"/ws/foo.py": "aaa"}}
+    workspace_api_mock.get_deployment_history.return_value = [entry, entry]
+    with mock.patch('dltctl.core.commands.get_unretained_libraries') as unretained_mock:
+        unretained_mock.return_value = ["/ws/foo.py"]
+        result = CliRunner().invoke(cli.rollback, args=["-w", "/ws"])
+    assert result.exit_code == 1
+    assert "/ws/foo.py has changed" in result.stdout
+    pipelines_api_mock.edit.assert_not_called()
+
+def test_rollback_without_history(valid_project_settings, pipelines_api_mock, workspace_api_mock):
+    pipelines_api_mock.get_pipeline_id_by_name.return_value = "1234"
+    workspace_api_mock.get_deployment_history.return_value = []
+    result = CliRunner().invoke(cli.rollback, args=["-w", "/ws", "--to", "2"])
+    assert result.exit_code == 1
+    assert "Unable to roll back 2" in result.stdout
+
+def test_gc_dry_run(valid_project_settings, workspace_api_mock):
+    with mock.patch('dltctl.core.commands.get_referenced_libraries') as referenced_mock:
+        with mock.patch('dltctl.core.commands.get_orphaned_artifacts') as orphaned_mock:
+            orphaned_mock.return_value = (["/ws/.dltctl_bulk"], ["/ws/old.py"], ["/ws/.dltctl_bulk/1/a.py", "/ws/old.py"])
+            result = CliRunner().invoke(cli.gc, args=["-w", "/ws", "--dry-run"])
+    assert result.exit_code == 0
+    assert "Would delete: /ws/old.py" in result.stdout
+    workspace_api_mock.delete.assert_not_called()
+
+def test_gc_deletes_and_updates_manifests(valid_project_settings, workspace_api_mock):
+    with mock.patch('dltctl.core.commands.get_referenced_libraries') as referenced_mock:
+        with mock.patch('dltctl.core.commands.get_orphaned_artifacts') as orphaned_mock:
+            orphaned_mock.return_value = (["/ws/.dltctl_bulk"], ["/ws/old.py"], ["/ws/.dltctl_bulk/1/a.py", "/ws/old.py"])
+            result = CliRunner().invoke(cli.gc, args=["-w", "/ws"])
+    assert result.exit_code == 0
+    assert sorted(workspace_api_mock.delete.call_args_list) == sorted([mock.call("/ws/.dltctl_bulk", True), mock.call("/ws/old.py", False)])
+    workspace_api_mock.remove_manifest_entries.assert_called_once_with(["/ws/.dltctl_bulk/1/a.py", "/ws/old.py"])
+
+def _local_artifacts(tmp_path):
+    artifacts = []
+    for name in ["foo.py", "bar.sql"]:
+        artifacts.append(Path(tmp_path, name).as_posix())
+        with open(artifacts[-1], 'w') as f:
+            f.write(f"-- {name}\n")
+    return artifacts
+
+def test_deploy_resume_skips_journaled_uploads(tmp_path, valid_project_settings, pipelines_api_mock, workspace_api_mock):
+    artifacts = _local_artifacts(tmp_path)
+    pipelines_api_mock.get_pipeline_id_by_name.return_value = "1234"
+    workspace_api_mock.upload_pipeline_artifacts.return_value = ["/ws/bar.sql"]
+    journal = DeployJournal(tmp_path.as_posix())
+    journal.start("mycoolname", "/ws")
+    journal.record("diffs", {"stats": get_artifact_stats(artifacts), "diffs": {"keep": [], "upload": artifacts, "delete": []}})
+    journal.record_upload(artifacts[0], "/ws/foo.py", get_local_artifact_md5(artifacts[0]))
+    journal.flush()
+    with mock.patch('dltctl.core.commands.get_dlt_artifacts') as artifacts_mock:
+        with mock.patch('dltctl.core.commands.get_artifact_diffs') as diffs_mock:
+            artifacts_mock.return_value = artifacts
+            result = CliRunner().invoke(cli.deploy, args=["-w", "/ws", "--resume"])
+    assert result.exit_code == 0
+    diffs_mock.assert_not_called()
+    assert workspace_api_mock.upload_pipeline_artifacts.call_args[0][0] == [artifacts[1]]
+    assert pipelines_api_mock.edit.call_args[0][1].pipeline_files == ["/ws/foo.py", "/ws/bar.sql"]
+    pipelines_api_mock.start_update.assert_called_once()
+    # A finished deploy leaves no journal behind
+    assert not os.path.exists(journal.journal_path)
+
+def test_deploy_resume_after_update_started(tmp_path, valid_project_settings, pipelines_api_mock, workspace_api_mock):
+    artifacts = _local_artifacts(tmp_path)
+    pipelines_api_mock.get_pipeline_id_by_name.return_value = "1234"
+    journal = DeployJournal(tmp_path.as_posix())
+    journal.start("mycoolname", "/ws")
+    journal.record("diffs", {"stats": get_artifact_stats(artifacts), "diffs": {"keep": [], "upload": artifacts, "delete": []}})
+    for artifact in artifacts:
+        journal.record_upload(artifact, f"/ws/{Path(artifact).name}", get_local_artifact_md5(artifact))
+    settings = ProjectConfig().load(str(Path(__file__).parent.parent.resolve()) + '/files/valid/').pipeline_settings
+    settings.id = "1234"
+    settings.pipeline_files = ["/ws/foo.py", "/ws/bar.sql"]
+    journal.record("edited", settings.to_json())
+    journal.record("update_id", "u1")
+    journal.record("update_started", "2024-01-01T00:00:00.000Z")
+    with mock.patch('dltctl.core.commands.get_dlt_artifacts') as artifacts_mock:
+        with mock.patch('dltctl.core.commands.is_pipeline_edit_applied') as applied_mock:
+            artifacts_mock.return_value = artifacts
+            applied_mock.return_value = True
+            result = CliRunner().invoke(cli.deploy, args=["-w", "/ws", "--resume"])
+    assert result.exit_code == 0
+    workspace_api_mock.upload_pipeline_artifacts.assert_not_called()
+    pipelines_api_mock.edit.assert_not_called()
+    pipelines_api_mock.start_update.assert_not_called()
+    assert pipelines_api_mock.stream_events.call_args[1]["ts"] == "2024-01-01T00:00:00.000Z"
+    assert pipelines_api_mock.stream_events.call_args[1]["update_id"] == "u1"
+
+def test_deploy_resume_reapplies_settings_changed_remotely(tmp_path, valid_project_settings, pipelines_api_mock, workspace_api_mock):
+    artifacts = _local_artifacts(tmp_path)
+    pipelines_api_mock.get_pipeline_id_by_name.return_value = "1234"
+    pipelines_api_mock.get_pipeline_state.return_value = "IDLE"
+    journal = DeployJournal(tmp_path.as_posix())
+    journal.start("mycoolname", "/ws")
+    journal.record("diffs", {"stats": get_artifact_stats(artifacts), "diffs": {"keep": [], "upload": artifacts, "delete": []}})
+    for artifact in artifacts:
+        journal.record_upload(artifact, f"/ws/{Path(artifact).name}", get_local_artifact_md5(artifact))
+    settings = ProjectConfig().load(str(Path(__file__).parent.parent.resolve()) + '/files/valid/').pipeline_settings
+    settings.id = "1234"
+    settings.pipeline_files = ["/ws/foo.py", "/ws/bar.sql"]
+    journal.record("edited", settings.to_json())
+    with mock.patch('dltctl.core.commands.get_dlt_artifacts') as artifacts_mock:
+        with mock.patch('dltctl.core.commands.is_pipeline_edit_applied') as applied_mock:
+            artifacts_mock.return_value = artifacts
+            # Someone else deployed since the interruption
+            applied_mock.return_value = False
+            result = CliRunner().invoke(cli.deploy, args=["-w", "/ws", "--resume"])
+    assert result.exit_code == 0
+    assert pipelines_api_mock.edit.call_args[0][1].pipeline_files == ["/ws/foo.py", "/ws/bar.sql"]
+
+def test_events_tails_named_pipelines(pipelines_api_mock):
+    pipelines_api_mock.get_pipeline_id_by_name.side_effect = lambda name: {"a": "1", "b": "2"}.get(name)
+    with mock.patch('dltctl.core.commands.MultiPipelineTailer') as tailer_mock:
+        result = CliRunner().invoke(cli.cli, args=["events", "--pipelines", "a, b", "--max-poll-interval", "5"])
+    assert result.exit_code == 0
+    assert tailer_mock.call_args[0][1] == {"1": "a", "2": "b"}
+    assert tailer_mock.call_args[1]["max_polling_interval"] == 5
+    tailer_mock.return_value.run.assert_called_once()
+
+def test_events_rejects_min_poll_interval_above_max(pipelines_api_mock):
+    with mock.patch('dltctl.core.commands.MultiPipelineTailer') as tailer_mock:
+        result = CliRunner().invoke(cli.cli, args=["events", "--pipelines", "a", "--min-poll-interval", "60"])
+    assert result.exit_code == 1
+    assert "--max-poll-interval" in result.output
+    tailer_mock.assert_not_called()
+
+def test_events_page_size_capped_at_api_limit(pipelines_api_mock):
+    with mock.patch('dltctl.core.commands.MultiPipelineTailer') as tailer_mock:
+        result = CliRunner().invoke(cli.cli, args=["events", "--pipelines", "a", "--page-size", "101"])
+    assert result.exit_code == 2
+    tailer_mock.assert_not_called()
+
+def test_events_all_pipelines(pipelines_api_mock):
+    pipelines_api_mock.iter_pipelines.return_value = [{"pipeline_id": "1", "name": "a"}, {"pipeline_id": "2", "name": "b"}]
+    with mock.patch('dltctl.core.commands.MultiPipelineTailer') as tailer_mock:
+        result = CliRunner().invoke(cli.cli, args=["events", "--all"])
+    assert result.exit_code == 0
+    assert tailer_mock.call_args[0][1] == {"1": "a", "2": "b"}
+
+def test_events_unknown_pipeline(pipelines_api_mock):
+    pipelines_api_mock.get_pipeline_id_by_name.return_value = None
+    with mock.patch('dltctl.core.commands.MultiPipelineTailer') as tailer_mock:
+        result = CliRunner().invoke(cli.cli, args=["events", "--pipelines", "missing"])
+    assert result.exit_code == 1
+    assert "No existing pipeline with name missing" in result.stdout
+    tailer_mock.assert_not_called()
 
+@pytest.fixture()
+def stored_events(tmp_path):
+    store = EventStore(Path(tmp_path, "events.db").as_posix())
+    events = []
+    for i, (level, details) in enumerate([("INFO", {}), ("ERROR", {}), ("INFO", {"update_progress": {"state": "COMPLETED"}})]):
+        events.append(PipelineEvent().from_json(json.dumps({
+            "id": str(i), "sequence": {"seq_no": i}, "timestamp": f"2022-01-01T00:00:0{i}.000Z", "level": level,
+            "event_type": "update_progress", "message": f"event {i}", "details": details,
+            "origin": {"pipeline_id": "1234", "pipeline_name": "mycoolname", "update_id": "u1"}})))
+    store.add(events)
+    with mock.patch('dltctl.core.commands.get_event_store') as store_mock:
+        store_mock.return_value = store
+        yield store
+
+def test_events_query(stored_events):
+    result = CliRunner().invoke(cli.cli, args=["events", "query", "--level", "ERROR"])
+    assert result.exit_code == 0
+    assert "[mycoolname] 2022-01-01T00:00:01.000Z update_progress event 1" in result.stdout
+    assert "event 0" not in result.stdout
 
+def test_events_replay_last_update(stored_events, valid_project_settings):
+    result = CliRunner().invoke(cli.cli, args=["events", "replay"])
+    assert result.exit_code == 0
+    assert "Replaying stored events of pipeline mycoolname update u1" in result.stdout
+    assert [f"event {i}" in result.stdout for i in range(3)] == [True] * 3
+    assert "Pipeline execution is complete" in result.stdout
+
+def test_events_query_scoped_by_profile_config():
+    with mock.patch('dltctl.core.helpers.ProfileConfigProvider') as provider_mock:
+        with mock.patch('dltctl.core.helpers.EventStore') as event_store_mock:
+            provider_mock.return_value.get_config.return_value.host = "https://dev.cloud.databricks.com/"
+            event_store_mock.return_value.query.return_value = iter([])
+            result = CliRunner().invoke(cli.cli, args=["events", "query", "--profile", "dev"])
+    assert result.exit_code == 0
+    provider_mock.assert_called_once_with("dev")
+    assert event_store_mock.call_args[1]["scope"] == "dev@https://dev.cloud.databricks.com/api/"
+
+def test_events_export_ndjson(tmp_path, pipelines_api_mock, valid_project_settings):
+    pipelines_api_mock.get_pipeline_id_by_name.return_value = "1234"
+    pages = [[PipelineEvent().from_json(json.dumps({"id": str(i), "timestamp": f"2022-01-01T00:00:0{i}.000Z"}))
+              for i in range(n, n + 2)] for n in (0, 2)]
+    pipelines_api_mock.iter_backfill_pages.return_value = iter(pages)
+    output = Path(tmp_path, "events.ndjson").as_posix()
+    result = CliRunner().invoke(cli.cli, args=["events", "export", "--since", "2022-01-01T00:00:00.000Z",
+                                               "--until", "2022-01-02T00:00:00.000Z", "-o", output])
+    assert result.exit_code == 0
+    assert "Exported 4 events of pipeline mycoolname" in result.stdout
+    assert pipelines_api_mock.iter_backfill_pages.call_args[1]["until"] == "2022-01-02T00:00:00.000Z"
+    with open(output) as f:
+        assert [json.loads(line)["id"] for line in f] == ["0", "1", "2", "3"]
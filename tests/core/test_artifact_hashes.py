@@ -0,0 +1,74 @@
+from dltctl.utils.cache_utils import ArtifactHashCache
+from dltctl.utils.hash_utils import get_local_artifact_md5, get_notebook_source_md5
+import base64, hashlib, os, time
+from pathlib import Path
+from unittest import mock
+
+def _write_artifact(path, content, age_seconds=60):
+    with open(path, 'w') as f:
+        f.write(content)
+    mtime = time.time() - age_seconds
+    os.utime(path, (mtime, mtime))
+
+def test_hash_cache_reuses_unchanged_files(tmp_path):
+    artifact = Path(tmp_path, "foo.py").as_posix()
+    _write_artifact(artifact, "import dlt\n")
+    cache = ArtifactHashCache(Path(tmp_path, ".dltctl").as_posix())
+    expected = get_local_artifact_md5(artifact)
+    assert cache.get_md5(artifact) == expected
+    cache.save()
+
+    with mock.patch('dltctl.utils.cache_utils.get_local_artifact_md5') as md5_mock:
+        reloaded = ArtifactHashCache(Path(tmp_path, ".dltctl").as_posix())
+        assert reloaded.get_md5(artifact) == expected
+        md5_mock.assert_not_called()
+
+def test_hash_cache_rehashes_changed_files(tmp_path):
+    artifact = Path(tmp_path, "foo.py").as_posix()
+    _write_artifact(artifact, "import dlt\n")
+    cache = ArtifactHashCache(Path(tmp_path, ".dltctl").as_posix())
+    first = cache.get_md5(artifact)
+    _write_artifact(artifact, "import dlt\nimport foo\n", age_seconds=30)
+    assert cache.get_md5(artifact) != first
+    assert cache.get_md5(artifact) == get_local_artifact_md5(artifact)
+
+def test_hash_cache_skips_recently_modified_files(tmp_path):
+    artifact = Path(tmp_path, "foo.py").as_posix()
+    _write_artifact(artifact, "import dlt\n", age_seconds=0)
+    cache = ArtifactHashCache(Path(tmp_path, ".dltctl").as_posix())
+    cache.get_md5(artifact)
+    cache.save()
+    assert not os.path.exists(Path(tmp_path, ".dltctl", "hashcache"))
+
+def _reference_md5(content):
+    normalized = "".join([s for s in content.splitlines(True) if s.strip("\r\n")])
+    return hashlib.md5(normalized.encode('utf-8')).hexdigest()
+
+_CONTENTS = [
+    "",
+    "\n\n\n",
+    "import dlt\n\n\n@dlt.table\ndef foo():\n    return 'café ✓'\n",
+    "SELECT 1\r\n\r\nFROM foo\r\n  \r\nWHERE bar\r",
+    "no trailing newline\n\nlast line",
+]
+
+def test_local_hash_streams_in_chunks(tmp_path):
+    artifact = Path(tmp_path, "foo.py").as_posix()
+    for content in _CONTENTS:
+        with open(artifact, 'w', encoding='utf-8', newline='') as f:
+            f.write(content)
+        with open(artifact, encoding='utf-8') as f:
+            expected = _reference_md5(f.read())
+        with mock.patch('dltctl.utils.hash_utils.CHUNK_SIZE', 3):
+            assert get_local_artifact_md5(artifact) == expected
+        assert get_local_artifact_md5(artifact) == expected
+
+def test_local_and_remote_hashes_match(tmp_path):
+    artifact = Path(tmp_path, "foo.py").as_posix()
+    for content in _CONTENTS:
+        with open(artifact, 'w', encoding='utf-8', newline='') as f:
+            f.write(content)
+        notebook = ("# Databricks notebook source\n" + content).encode('utf-8')
+        content_b64 = base64.b64encode(notebook).decode()
+        with mock.patch('dltctl.utils.hash_utils.B64_CHUNK_SIZE', 8):
+            assert get_notebook_source_md5(content_b64) == get_local_artifact_md5(artifact)
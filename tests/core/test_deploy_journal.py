@@ -0,0 +1,20 @@
+from dltctl.utils.state_utils import DeployJournal
+from dltctl.utils.cache_utils import read_json_file
+
+def test_record_upload_batches_writes(tmp_path):
+    journal = DeployJournal(tmp_path.as_posix(), flush_seconds=3600)
+    journal.start("p", "/ws")
+    for i in range(3):
+        journal.record_upload(f"a{i}.py", f"/ws/a{i}.py", str(i))
+    assert read_json_file(journal.journal_path)["uploads"] == {}
+
+    journal.flush()
+    reloaded = DeployJournal(tmp_path.as_posix())
+    assert reloaded.resume("p", "/ws")
+    assert reloaded.get_upload("a1.py", "1") == "/ws/a1.py"
+
+def test_record_upload_writes_after_flush_interval(tmp_path):
+    journal = DeployJournal(tmp_path.as_posix(), flush_seconds=0)
+    journal.start("p", "/ws")
+    journal.record_upload("a.py", "/ws/a.py", "h")
+    assert len(read_json_file(journal.journal_path)["uploads"]) == 1
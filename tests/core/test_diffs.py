@@ -1,4 +1,6 @@
 from dltctl.core.helpers import *
+import base64, os, subprocess
+from pathlib import Path
 from dltctl.types.pipelines import JobConfig, PipelineSettings
 from dltctl.api.jobs import JobsApi
 from dltctl.api.pipelines import PipelinesApi
@@ -28,6 +30,19 @@ def test_is_pipeline_conf_diff_no_diff():
     assert not is_pipeline_settings_diff(mock_client, new_pipeline_settings)
     mock_client.perform_query.assert_called_once_with("GET", "/pipelines/1234", data={}, headers=None)
 
+def test_is_pipeline_edit_applied():
+    mock_client = mock.MagicMock()
+    settings = PipelineSettings("foo", id=1234, pipeline_files=["/ws/a.py", "/ws/b.sql"])
+    remote_settings = PipelineSettings("foo", id=1234, pipeline_files=["/ws/b.sql", "/ws/a.py"])
+    mock_client.perform_query.return_value = {"spec": remote_settings.to_json()}
+    assert is_pipeline_edit_applied(mock_client, settings)
+
+    # Same core settings, but another deploy changed the libraries
+    remote_settings.pipeline_files = ["/ws/a.py"]
+    mock_client = mock.MagicMock()
+    mock_client.perform_query.return_value = {"spec": remote_settings.to_json()}
+    assert not is_pipeline_edit_applied(mock_client, settings)
+
 def test_is_job_conf_diff():
     mock_client = mock.MagicMock()
     orig_job_conf = JobConfig(name="foo")
@@ -46,4 +61,186 @@ def test_is_job_conf_diff_no_diff():
     mock_client.perform_query.return_value = orig_job_return_val
 
     assert not is_job_conf_diff(mock_client, new_job_conf, 12345)
-    mock_client.perform_query.assert_called_with("GET", "/jobs/get", data={'job_id': 12345}, headers=None, version=None)
\ No newline at end of file
+    mock_client.perform_query.assert_called_with("GET", "/jobs/get", data={'job_id': 12345}, headers=None, version=None)
+
+def _remote_export(content):
+    notebook = "# Databricks notebook source\n" + content
+    return base64.b64encode(notebook.encode("utf-8"))
+
+def test_get_artifact_diffs(tmp_path):
+    keep_path = Path(tmp_path, "keep.py").as_posix()
+    new_path = Path(tmp_path, "new.sql").as_posix()
+    with open(keep_path, 'w') as f:
+        f.write("import dlt\n\n@dlt.table\ndef foo():\n    return 1\n")
+    with open(new_path, 'w') as f:
+        f.write("CREATE LIVE TABLE bar AS SELECT 1\n")
+    exports = {
+        "/ws/keep.py": _remote_export("import dlt\n@dlt.table\n\ndef foo():\n    return 1\n"),
+        "/ws/old.py": _remote_export("import dlt\n")
+    }
+    settings = PipelineSettings("foo")
+    settings.id = 1234
+    with mock.patch('dltctl.core.helpers.PipelinesApi') as pipelines_api_mock:
+        with mock.patch('dltctl.core.helpers.WorkspaceApi') as workspace_api_mock:
+            pipelines_api_mock.return_value.get_pipeline_libraries.return_value = list(exports.keys())
+            workspace_api_mock.return_value.get_artifact_manifest.return_value = None
+            workspace_api_mock.return_value.get_workspace_file_b64.side_effect = lambda path: exports[path]
+            diffs = get_artifact_diffs(mock.MagicMock(), settings, [keep_path, new_path], max_workers=2)
+
+    assert diffs == {"keep": ["/ws/keep.py"], "upload": [new_path], "delete": ["/ws/old.py"], "rename": [], "duplicate": []}
+
+def test_get_artifact_diffs_from_manifest(tmp_path):
+    keep_path = Path(tmp_path, "keep.py").as_posix()
+    with open(keep_path, 'w') as f:
+        f.write("import dlt\n")
+    manifest = {"version": 1, "artifacts": {
+        "/ws/keep.py": {"hash": get_local_artifact_md5(keep_path), "uploaded_at": "2022-10-10T16:46:28.161Z"}}}
+    settings = PipelineSettings("foo")
+    settings.id = 1234
+    with mock.patch('dltctl.core.helpers.PipelinesApi') as pipelines_api_mock:
+        with mock.patch('dltctl.core.helpers.WorkspaceApi') as workspace_api_mock:
+            pipelines_api_mock.return_value.get_pipeline_libraries.return_value = ["/ws/keep.py", "/ws/old.py"]
+            workspace_api_mock.return_value.get_artifact_manifest.return_value = manifest
+            workspace_api_mock.return_value.get_workspace_file_b64.return_value = _remote_export("import foo\n")
+            diffs = get_artifact_diffs(mock.MagicMock(), settings, [keep_path])
+
+    workspace_api_mock.return_value.get_artifact_manifest.assert_called_once_with("/ws")
+    workspace_api_mock.return_value.get_workspace_file_b64.assert_called_once_with("/ws/old.py")
+    assert diffs == {"keep": ["/ws/keep.py"], "upload": [], "delete": ["/ws/old.py"], "rename": [], "duplicate": []}
+
+def test_get_artifact_diffs_renames_and_duplicates(tmp_path):
+    renamed_path = Path(tmp_path, "renamed.py").as_posix()
+    changed_path = Path(tmp_path, "changed.py").as_posix()
+    copy_path = Path(tmp_path, "copy.py").as_posix()
+    for path, content in [(renamed_path, "import dlt\n"), (changed_path, "import foo\n"), (copy_path, "import foo\n")]:
+        with open(path, 'w') as f:
+            f.write(content)
+    exports = {
+        "/ws/original.py": _remote_export("import dlt\n"),
+        "/ws/changed.py": _remote_export("import bar\n")
+    }
+    settings = PipelineSettings("foo")
+    settings.id = 1234
+    with mock.patch('dltctl.core.helpers.PipelinesApi') as pipelines_api_mock:
+        with mock.patch('dltctl.core.helpers.WorkspaceApi') as workspace_api_mock:
+            pipelines_api_mock.return_value.get_pipeline_libraries.return_value = list(exports.keys())
+            workspace_api_mock.return_value.get_artifact_manifest.return_value = None
+            workspace_api_mock.return_value.get_workspace_file_b64.side_effect = lambda path: exports[path]
+            diffs = get_artifact_diffs(mock.MagicMock(), settings, [renamed_path, changed_path, copy_path], workspace_path="/ws")
+
+    assert diffs["keep"] == ["/ws/original.py"]
+    assert diffs["upload"] == [changed_path, copy_path]
+    assert diffs["delete"] == []
+    assert diffs["rename"] == [{"from": "/ws/original.py", "to": renamed_path}]
+    assert diffs["duplicate"] == [[changed_path, copy_path]]
+
+def _git(repo, *args):
+    subprocess.run(["git", "-c", "user.name=test", "-c", "user.email=test@test.com"] + list(args),
+                   cwd=repo, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+def test_get_git_artifact_diffs(tmp_path):
+    repo = Path(tmp_path).resolve().as_posix()
+    for name in ["same.py", "changed.py", "removed.py"]:
+        with open(Path(repo, name), 'w') as f:
+            f.write(f"# {name}\n")
+    _git(repo, "init", "-q")
+    _git(repo, "add", "-A")
+    _git(repo, "commit", "-q", "-m", "first")
+    since_sha = get_head_sha(repo)
+    with open(Path(repo, "changed.py"), 'a') as f:
+        f.write("import dlt\n")
+    with open(Path(repo, "added.sql"), 'w') as f:
+        f.write("SELECT 1\n")
+    os.remove(Path(repo, "removed.py"))
+
+    artifacts = [Path(repo, name).as_posix() for name in ["same.py", "changed.py", "added.sql"]]
+    settings = PipelineSettings("foo")
+    settings.id = 1234
+    with mock.patch('dltctl.core.helpers.PipelinesApi') as pipelines_api_mock:
+        with mock.patch('dltctl.core.helpers.WorkspaceApi') as workspace_api_mock:
+            pipelines_api_mock.return_value.get_pipeline_libraries.return_value = ["/ws/same.py", "/ws/changed.py", "/ws/removed.py"]
+            workspace_api_mock.return_value.get_deployment.return_value = {"git_sha": since_sha}
+            diffs = get_git_artifact_diffs(mock.MagicMock(), settings, artifacts, "/ws", repo)
+
+    workspace_api_mock.return_value.get_workspace_file_b64.assert_not_called()
+    assert diffs["keep"] == ["/ws/same.py"]
+    assert diffs["upload"] == [artifacts[1], artifacts[2]]
+    assert diffs["delete"] == ["/ws/removed.py"]
+
+def test_get_git_artifact_diffs_without_recorded_commit():
+    settings = PipelineSettings("foo")
+    settings.id = 1234
+    with mock.patch('dltctl.core.helpers.WorkspaceApi') as workspace_api_mock:
+        workspace_api_mock.return_value.get_deployment.return_value = None
+        assert get_git_artifact_diffs(mock.MagicMock(), settings, ["foo.py"], "/ws") is None
+
+def test_record_deployment_clean_and_dirty(tmp_path):
+    repo = Path(tmp_path).resolve().as_posix()
+    with open(Path(repo, "foo.py"), 'w') as f:
+        f.write("import dlt\n")
+    _git(repo, "init", "-q")
+    _git(repo, "add", "-A")
+    _git(repo, "commit", "-q", "-m", "first")
+    settings = PipelineSettings("foo")
+    settings.id = 1234
+    workspace_api_mock = mock.MagicMock()
+    record_deployment(workspace_api_mock, settings, "/ws", repo)
+    workspace_api_mock.record_deployment.assert_called_with("/ws", 1234, get_head_sha(repo), history_entry=mock.ANY)
+    with open(Path(repo, "foo.py"), 'a') as f:
+        f.write("import foo\n")
+    record_deployment(workspace_api_mock, settings, "/ws", repo)
+    workspace_api_mock.record_deployment.assert_called_with("/ws", 1234, None, history_entry=mock.ANY)
+
+def test_get_artifact_diffs_matches_bulk_batch_paths(tmp_path):
+    artifact = Path(tmp_path, "foo.py").as_posix()
+    with open(artifact, 'w') as f:
+        f.write("import dlt\n")
+    settings = PipelineSettings("foo")
+    settings.id = 1234
+    with mock.patch('dltctl.core.helpers.PipelinesApi') as pipelines_api_mock:
+        with mock.patch('dltctl.core.helpers.WorkspaceApi') as workspace_api_mock:
+            pipelines_api_mock.return_value.get_pipeline_libraries.return_value = ["/ws/.dltctl_bulk/20240101T000000000000Z/foo.py"]
+            workspace_api_mock.return_value.get_artifact_manifest.return_value = None
+            workspace_api_mock.return_value.get_workspace_file_b64.return_value = _remote_export("import dlt\n")
+            diffs = get_artifact_diffs(mock.MagicMock(), settings, [artifact], workspace_path="/ws")
+
+    assert diffs["keep"] == ["/ws/.dltctl_bulk/20240101T000000000000Z/foo.py"]
+    assert diffs["upload"] == []
+    assert diffs["rename"] == []
+
+def test_get_artifact_diffs_content_addressed_libraries(tmp_path):
+    artifact = Path(tmp_path, "foo.py").as_posix()
+    with open(artifact, 'w') as f:
+        f.write("import dlt\n")
+    md5_hash = get_local_artifact_md5(artifact)
+    settings = PipelineSettings("foo")
+    settings.id = 1234
+    with mock.patch('dltctl.core.helpers.PipelinesApi') as pipelines_api_mock:
+        with mock.patch('dltctl.core.helpers.WorkspaceApi') as workspace_api_mock:
+            pipelines_api_mock.return_value.get_pipeline_libraries.return_value = [
+                f"/ws/.dltctl/objects/{md5_hash}/foo.py", f"/ws/.dltctl/objects/{'0' * 32}/bar.py"]
+            workspace_api_mock.return_value.get_artifact_manifest.return_value = None
+            diffs = get_artifact_diffs(mock.MagicMock(), settings, [artifact], workspace_path="/ws")
+
+    # The hash comes from the object path, nothing is exported
+    workspace_api_mock.return_value.get_workspace_file_b64.assert_not_called()
+    workspace_api_mock.return_value.get_artifact_manifest.assert_called_once_with("/ws/.dltctl/objects")
+    assert diffs["keep"] == [f"/ws/.dltctl/objects/{md5_hash}/foo.py"]
+    assert diffs["delete"] == [f"/ws/.dltctl/objects/{'0' * 32}/bar.py"]
+
+def test_get_unretained_libraries():
+    workspace_api_mock = mock.MagicMock()
+    workspace_api_mock.get_artifact_manifest.side_effect = lambda d: {
+        "/ws": {"artifacts": {"/ws/same.py": {"hash": "aaa"}, "/ws/changed.py": {"hash": "ccc"}}},
+        "/ws/.dltctl/objects": {"artifacts": {}}}[d]
+    gone_object = f"/ws/.dltctl/objects/{'0' * 32}/gone.py"
+    libraries = {"/ws/same.py": "aaa", "/ws/changed.py": "bbb", gone_object: '0' * 32, "/ws/unknown.py": None}
+    # A library without a recorded hash can't be verified
+    assert get_unretained_libraries(workspace_api_mock, libraries) == ["/ws/changed.py", gone_object, "/ws/unknown.py"]
+
+def test_get_rollback_candidates():
+    a, b, c, d = [{"git_sha": sha} for sha in "abcd"]
+    # c was rolled back to a, then d was deployed
+    assert get_rollback_candidates([a, b, c, dict(a, rolled_back=2), d]) == [a, d]
+    # A rollback from before the kept history never drops the oldest deploy
+    assert get_rollback_candidates([c, dict(a, rolled_back=2)]) == [c]
@@ -0,0 +1,52 @@
+import json
+from pathlib import Path
+from dltctl.types.events import PipelineEvent
+from dltctl.utils.event_store import EventStore
+
+def _event(id, timestamp, update_id="u1", level="INFO", event_type="flow_progress", pipeline_name="mypipeline"):
+    return PipelineEvent().from_json(json.dumps({
+        "id": id, "sequence": {"data_plane_id": {"seq_no": 1}}, "timestamp": timestamp, "level": level,
+        "event_type": event_type, "message": f"event {id}", "details": {},
+        "origin": {"pipeline_id": "p1", "pipeline_name": pipeline_name, "update_id": update_id}}))
+
+def test_event_store_dedupes_and_filters(tmp_path):
+    store = EventStore(Path(tmp_path, "events.db").as_posix())
+    store.add([_event("b", "2022-01-01T00:00:02.000Z"), _event("a", "2022-01-01T00:00:01.000Z")])
+    # Fetching the same events again doesn't duplicate them
+    store.add([_event("b", "2022-01-01T00:00:02.000Z"), _event("c", "2022-01-01T00:00:03.000Z", update_id="u2", level="ERROR")])
+    assert [e.id for e in store.query()] == ["a", "b", "c"]
+    assert [e.id for e in store.query(pipeline="mypipeline", update_id="u1")] == ["a", "b"]
+    assert [e.id for e in store.query(pipeline="p1", levels=["ERROR"])] == ["c"]
+    assert [e.id for e in store.query(since="2022-01-01T00:00:02.000Z", until="2022-01-01T00:00:03.000Z")] == ["b"]
+    assert [e.id for e in store.query(event_types=["update_progress"])] == []
+    assert [e.id for e in store.query(limit=1)] == ["a"]
+    assert store.get_last_update_id("mypipeline") == "u2"
+    # Stored events keep the JSON the API returned
+    assert json.loads(next(store.query()).raw)["origin"]["update_id"] == "u1"
+
+def test_event_store_without_database(tmp_path):
+    store = EventStore(Path(tmp_path, "missing", "events.db").as_posix())
+    assert list(store.query()) == []
+    assert store.get_last_update_id("mypipeline") is None
+    assert not Path(tmp_path, "missing").exists()
+
+def test_event_store_scopes_events_by_workspace(tmp_path):
+    path = Path(tmp_path, "events.db").as_posix()
+    dev, prod = EventStore(path, scope="dev@https://dev/api/"), EventStore(path, scope="prod@https://prod/api/")
+    dev.add([_event("a", "2022-01-01T00:00:01.000Z")])
+    prod.add([_event("a", "2022-01-01T00:00:01.000Z", update_id="u2"), _event("b", "2022-01-01T00:00:02.000Z", update_id="u2")])
+    assert [e.id for e in dev.query(pipeline="mypipeline")] == ["a"]
+    assert [e.id for e in prod.query(pipeline="mypipeline")] == ["a", "b"]
+    assert dev.get_last_update_id("mypipeline") == "u1"
+
+def test_event_store_prunes_events_past_retention(tmp_path):
+    path = Path(tmp_path, "events.db").as_posix()
+    store = EventStore(path)
+    store.add([_event("a", "2022-01-01T00:00:01.000Z")])
+    store.conn.execute("UPDATE events SET stored_at = '2000-01-01T00:00:00.000Z'")
+    store.conn.commit()
+    store.close()
+    # Pruning only looks at when events were stored, old events fetched today are kept
+    store = EventStore(path, retention_days=30)
+    store.add([_event("b", "2022-01-01T00:00:02.000Z")])
+    assert [e.id for e in store.query()] == ["b"]
@@ -0,0 +1,49 @@
+import json, sys
+from pathlib import Path
+from unittest import mock
+import pytest
+from dltctl.types.events import PipelineEvent
+from dltctl.utils.export_utils import flatten_event, get_event_writer, ParquetEventWriter, EXPORT_COLUMNS
+
+def _event(id, details):
+    return PipelineEvent().from_json(json.dumps({
+        "id": id, "timestamp": "2022-01-01T00:00:00.000Z", "level": "INFO", "event_type": "flow_progress",
+        "message": "progress", "origin": {"pipeline_id": "p1", "update_id": "u1", "flow_name": "silver"},
+        "details": details}))
+
+def test_flatten_event():
+    row = flatten_event(_event("a", {"flow_progress": {"status": "RUNNING", "metrics": {"num_output_rows": "42"}},
+                                     "cluster_resources": {"avg_task_slot_utilization": 0.5}}))
+    assert list(row) == [name for name, _, _ in EXPORT_COLUMNS]
+    assert row["flow_name"] == "silver"
+    assert row["flow_progress_status"] == "RUNNING"
+    assert row["flow_progress_metrics_num_output_rows"] == 42
+    assert row["cluster_resources_avg_task_slot_utilization"] == 0.5
+    assert row["cluster_resources_num_executors"] is None
+    assert row["error"] is None
+    assert json.loads(row["details"])["flow_progress"]["status"] == "RUNNING"
+
+def test_ndjson_writer(tmp_path):
+    path = Path(tmp_path, "events.ndjson").as_posix()
+    writer = get_event_writer("ndjson", path)
+    writer.write([_event("a", {}), _event("b", {"update_progress": {"state": "COMPLETED"}})])
+    writer.close()
+    with open(path) as f:
+        rows = [json.loads(line) for line in f]
+    assert [row["id"] for row in rows] == ["a", "b"]
+    assert rows[1]["update_progress_state"] == "COMPLETED"
+
+def test_parquet_writer_without_pyarrow(tmp_path):
+    with mock.patch.dict(sys.modules, {"pyarrow": None, "pyarrow.parquet": None}):
+        with pytest.raises(ImportError, match="pip install 'dltctl\\[parquet\\]'"):
+            ParquetEventWriter(Path(tmp_path, "events.parquet").as_posix())
+
+def test_parquet_writer(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    path = Path(tmp_path, "events.parquet").as_posix()
+    writer = ParquetEventWriter(path, row_group_size=2)
+    writer.write([_event(str(i), {"flow_progress": {"metrics": {"num_output_rows": i}}}) for i in range(5)])
+    writer.close()
+    table = pq.read_table(path)
+    assert pq.ParquetFile(path).num_row_groups == 3
+    assert table.column("flow_progress_metrics_num_output_rows").to_pylist() == [0, 1, 2, 3, 4]
@@ -0,0 +1,58 @@
+from dltctl.core.helpers import *
+from unittest import mock
+import datetime
+
+def _object(path):
+    return mock.MagicMock(path=path, basename=Path(path).name)
+
+def _walk(tree):
+    return lambda workspace_dir: [(d, subdirs, [_object(o) for o in objects]) for d, subdirs, objects in tree]
+
+def _manifest(paths, uploaded_at="2020-01-01T00:00:00.000Z"):
+    return {"artifacts": {path: {"hash": "a", "uploaded_at": uploaded_at} for path in paths}}
+
+def test_get_orphaned_artifacts():
+    recent = datetime.datetime.utcnow().isoformat()[:-3]+'Z'
+    workspace_api_mock = mock.MagicMock()
+    workspace_api_mock.walk.side_effect = _walk([
+        ("/ws", ["/ws/.dltctl_bulk", "/ws/.dltctl", "/ws/mine"],
+         ["/ws/used.py", "/ws/old.py", "/ws/new.py", "/ws/by_hand.py", "/ws/_dltctl_manifest"]),
+        ("/ws/mine", [], ["/ws/mine/notes.py"]),
+        ("/ws/.dltctl", ["/ws/.dltctl/objects"], []),
+        ("/ws/.dltctl/objects", ["/ws/.dltctl/objects/aaa", "/ws/.dltctl/objects/bbb"], ["/ws/.dltctl/objects/_dltctl_manifest"]),
+        ("/ws/.dltctl/objects/bbb", [], ["/ws/.dltctl/objects/bbb/shared.py"]),
+        ("/ws/.dltctl/objects/aaa", [], ["/ws/.dltctl/objects/aaa/shared.py"]),
+        ("/ws/.dltctl_bulk", ["/ws/.dltctl_bulk/1", "/ws/.dltctl_bulk/2"], []),
+        ("/ws/.dltctl_bulk/1", [], ["/ws/.dltctl_bulk/1/a.py", "/ws/.dltctl_bulk/1/b.py", "/ws/.dltctl_bulk/1/_dltctl_manifest"]),
+        # A file dltctl didn't upload keeps its directory from being deleted as a whole
+        ("/ws/.dltctl_bulk/2", [], ["/ws/.dltctl_bulk/2/c.py", "/ws/.dltctl_bulk/2/data.csv", "/ws/.dltctl_bulk/2/_dltctl_manifest"]),
+    ])
+    manifests = {
+        "/ws": {"artifacts": dict(_manifest(["/ws/used.py", "/ws/old.py"])["artifacts"], **_manifest(["/ws/new.py"], recent)["artifacts"])},
+        "/ws/.dltctl/objects": _manifest(["/ws/.dltctl/objects/aaa/shared.py", "/ws/.dltctl/objects/bbb/shared.py"]),
+        "/ws/.dltctl_bulk/1": _manifest(["/ws/.dltctl_bulk/1/a.py", "/ws/.dltctl_bulk/1/b.py"]),
+        "/ws/.dltctl_bulk/2": _manifest(["/ws/.dltctl_bulk/2/c.py"])}
+    workspace_api_mock.get_artifact_manifest.side_effect = lambda d: manifests.get(d)
+    referenced = {"/ws/used.py", "/ws/.dltctl/objects/aaa/shared.py"}
+    dirs, notebooks, artifacts = get_orphaned_artifacts(workspace_api_mock, "/ws", referenced)
+
+    # Whole directories are removed with one call, the root and directories with anything else in them never are
+    assert sorted(dirs) == ["/ws/.dltctl/objects/bbb", "/ws/.dltctl_bulk/1"]
+    # Objects missing from the manifests and recent uploads are left alone
+    assert sorted(notebooks) == ["/ws/.dltctl_bulk/2/c.py", "/ws/old.py"]
+    assert sorted(artifacts) == ["/ws/.dltctl/objects/bbb/shared.py", "/ws/.dltctl_bulk/1/a.py", "/ws/.dltctl_bulk/1/b.py",
+                                 "/ws/.dltctl_bulk/2/c.py", "/ws/old.py"]
+
+def test_get_referenced_libraries_keeps_recent_history():
+    recent = (datetime.datetime.utcnow() - datetime.timedelta(days=1)).isoformat()[:-3]+'Z'
+    workspace_api_mock = mock.MagicMock()
+    workspace_api_mock.get_artifact_manifest.return_value = {"artifacts": {}, "history": {"1": [
+        {"deployed_at": "2020-01-01T00:00:00.000Z", "libraries": {"/ws/ancient.py": "a"}},
+        {"deployed_at": recent, "libraries": {"/ws/recent.py": "b"}}]}}
+    with mock.patch('dltctl.core.helpers.PipelinesApi') as pipelines_api_mock:
+        pipelines_api_mock.return_value.iter_pipelines.return_value = iter([{"pipeline_id": "1"}, {"pipeline_id": "2"}])
+        pipelines_api_mock.return_value.get_snapshot.side_effect = lambda pipeline_id: {
+            "1": {"spec": {"libraries": [{"notebook": {"path": "/ws/current.py"}}]}},
+            "2": {"spec": {"libraries": [{"jar": "dbfs:/foo.jar"}, {"file": {"path": "/ws/other.py"}}]}}}[pipeline_id]
+        referenced = get_referenced_libraries(mock.MagicMock(), workspace_api_mock, "/ws", grace_days=7)
+    assert referenced == {"/ws/current.py", "/ws/other.py", "/ws/recent.py"}
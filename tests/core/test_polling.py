@@ -0,0 +1,20 @@
+from dltctl.utils.poll_utils import AdaptivePoller
+from unittest import mock
+import pytest
+
+def test_adaptive_poller_backoff_with_jitter():
+    poller = AdaptivePoller(min_interval=1, max_interval=10)
+    intervals = [poller.next_interval(active=False) for _ in range(6)]
+    assert all(1 <= i <= 10 for i in intervals)
+    assert poller.interval == 10
+    assert poller.next_interval(active=True) == 1
+
+def test_adaptive_poller_waits_next_interval():
+    poller = AdaptivePoller(min_interval=2, max_interval=4)
+    with mock.patch('dltctl.utils.poll_utils.time.sleep') as sleep_mock:
+        poller.wait(active=True)
+    sleep_mock.assert_called_once_with(2)
+
+def test_adaptive_poller_rejects_invalid_intervals():
+    with pytest.raises(ValueError):
+        AdaptivePoller(min_interval=5, max_interval=1)
@@ -1,4 +1,6 @@
-from dltctl.types.events import PipelineEvent, PipelineEventsResponse
+from unittest import mock
+import json
+from dltctl.types.events import PipelineEvent, PipelineEventsResponse, EventCursor
 
 _EVENT_DICT = {
     "id": "15e29b10-48bb-11ed-b1cf-9649472ee14a",
@@ -179,3 +181,43 @@ def test_pipeline_events_response_to_events():
 def test_pipeline_event():
     event = PipelineEvent().from_json(_EVENTS[0])
     assert event.message == "Update 175b9d started by USER_ACTION."
+
+def test_event_cursor_dedupes_and_bounds_memory():
+    events = []
+    for i in range(5):
+        e = PipelineEvent()
+        e.id = f"id{i}"
+        e.sequence = {"control_plane_seq_no": i}
+        e.timestamp = "2022-06-27T20:30:33.541Z"
+        events.append(e)
+    cursor = EventCursor("2022-06-27T20:30:30.000Z", lookback_seconds=2, max_seen=3)
+    assert cursor.advance(events[:2]) == events[:2]
+    assert cursor.advance(events[:3]) == [events[2]]
+    assert cursor.get_filter_timestamp() == "2022-06-27T20:30:31.541Z"
+    cursor.advance(events[3:])
+    assert len(cursor.seen) == 3
+    # The lookback never reaches before the starting point
+    assert EventCursor("2022-06-27T20:30:33.000Z").get_filter_timestamp() == "2022-06-27T20:30:33.000Z"
+
+def test_pipeline_event_parses_details_lazily():
+    event = PipelineEvent().from_json(_EVENTS[0])
+    assert not hasattr(event, "__dict__")
+    assert event.raw == _EVENTS[0]
+    assert not event.has_error()
+    assert event.error is None
+    expected = json.loads(_EVENTS[0])["details"]
+    with mock.patch('dltctl.types.events.json.loads', wraps=json.loads) as loads_mock:
+        assert event.details == expected
+        assert event.details is event.details
+    # details are parsed once, on first access
+    assert loads_mock.call_count == 1
+    event.details = {"foo": "bar"}
+    assert event.details == {"foo": "bar"}
+
+def test_pipeline_event_keeps_details():
+    with mock.patch('dltctl.types.events.json.loads', wraps=json.loads) as loads_mock:
+        event = PipelineEvent().from_json(_EVENTS[0], keep_details=True)
+        assert event.details == json.loads(_EVENTS[0])["details"]
+        assert event.error is None
+    # Everything comes from the one parse of the whole event, plus the parse for the expected value
+    assert loads_mock.call_count == 2